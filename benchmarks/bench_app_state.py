@@ -0,0 +1,41 @@
+"""Benchmark planning the steps while the user toggles the options."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+from pathlib import Path
+
+from app_state import AppState
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+ASSETS_PATH = ROOT_DIR.joinpath("openandroidinstaller", "assets", "configs")
+
+
+class ToggleSteps:
+    """Toggle unlocking the bootloader and flashing the recovery for a loaded config."""
+
+    def setup(self):
+        self.state = AppState(
+            platform="linux", config_path=ASSETS_PATH, bin_path=Path("bin")
+        )
+        self.state.load_config("sargo")
+        self.state.image_path = "lineage.zip"
+        self.state.recovery_path = "twrp.img"
+
+    def time_toggle_flash_unlock_bootloader(self):
+        self.state.toggle_flash_unlock_bootloader()
+
+    def time_toggle_flash_recovery(self):
+        self.state.toggle_flash_recovery()
+
+    def time_toggle_and_compile_flow(self):
+        """Toggle and compile the flow, like going back and forth before the installation."""
+        self.state.toggle_flash_recovery()
+        self.state.compile_flow()
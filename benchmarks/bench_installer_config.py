@@ -0,0 +1,112 @@
+"""Benchmark finding, loading and validating the device configs."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import shutil
+import tempfile
+from pathlib import Path
+
+import yaml
+from installer_config import (
+    ConfigRegistry,
+    SafeLoader,
+    _find_config_file,
+    _load_config,
+    validate_config,
+    validate_config_files,
+)
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+ASSETS_PATH = ROOT_DIR.joinpath("openandroidinstaller", "assets", "configs")
+SYNTHETIC_CONFIGS = 10_000
+# device codes looked up per call
+LOOKUPS = 100
+
+
+class ConfigCorpus:
+    """Base for benchmarks over the configs shipped in the assets or 10k synthetic configs."""
+
+    params = ["assets", "synthetic"]
+
+    def setup(self, corpus: str):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix="oai-configs-"))
+        if corpus == "assets":
+            self.config_path = ASSETS_PATH
+            self.device_codes = sorted(
+                ConfigRegistry(ASSETS_PATH).device_codes(), key=str.lower
+            )
+        else:
+            self.config_path = self.tmp_dir.joinpath("configs")
+            self.config_path.mkdir()
+            template = ASSETS_PATH.joinpath("sargo.yaml").read_text(encoding="utf-8")
+            self.device_codes = [f"sim{num:05d}" for num in range(SYNTHETIC_CONFIGS)]
+            for device_code in self.device_codes:
+                self.config_path.joinpath(f"{device_code}.yaml").write_text(
+                    template.replace("sargo", device_code), encoding="utf-8"
+                )
+        step = max(1, len(self.device_codes) // LOOKUPS)
+        self.lookups = self.device_codes[::step][:LOOKUPS]
+
+    def teardown(self, corpus: str):
+        shutil.rmtree(self.tmp_dir)
+
+
+class FindConfigFile(ConfigCorpus):
+    """Find the config files supporting some device codes."""
+
+    def setup(self, corpus: str):
+        super().setup(corpus)
+        # build and persist the index before timing the lookups
+        _find_config_file(self.lookups[0], self.config_path)
+
+    def time_lookup(self, corpus: str):
+        for device_code in self.lookups:
+            _find_config_file(device_code, self.config_path)
+
+    def time_start_with_index(self, corpus: str):
+        """Lookup after a restart of the application, with the index persisted before."""
+        ConfigRegistry(self.config_path).lookup(self.lookups[-1])
+
+    def time_build_index(self, corpus: str):
+        """First lookup without a persisted index, parsing all configs."""
+        index_path = self.tmp_dir.joinpath("config-index.json")
+        index_path.unlink(missing_ok=True)
+        ConfigRegistry(self.config_path, index_path=index_path).lookup(self.lookups[-1])
+
+    time_build_index.number = 1  # type: ignore
+    time_build_index.repeat = 3  # type: ignore
+
+
+class LoadConfig(ConfigCorpus):
+    """Load and validate the config of a device."""
+
+    def setup(self, corpus: str):
+        super().setup(corpus)
+        _find_config_file(self.lookups[0], self.config_path)
+
+    def time_load_config(self, corpus: str):
+        _load_config(self.lookups[len(self.lookups) // 2], self.config_path)
+
+
+class ValidateConfig:
+    """Validate the schema of the configs."""
+
+    def setup(self):
+        self.paths = sorted(ASSETS_PATH.glob("*.yaml"))
+        with open(ASSETS_PATH.joinpath("sargo.yaml"), "r", encoding="utf-8") as stream:
+            self.raw_config = yaml.load(stream, Loader=SafeLoader)
+
+    def time_validate_config(self):
+        validate_config(self.raw_config)
+
+    def time_validate_config_files(self):
+        """Validate all configs in the assets like the CI does."""
+        validate_config_files(self.paths)
@@ -0,0 +1,43 @@
+"""Benchmark the line throughput of the tool commands."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+
+from tooling import run_command
+
+LINES = 100_000
+
+
+class RunCommand:
+    """Read the output of a fake adb printing sideload progress lines as fast as it can."""
+
+    params = [False, True]
+
+    def setup(self, enable_logging: bool):
+        self.bin_path = Path(tempfile.mkdtemp(prefix="oai-bin-"))
+        adb = self.bin_path.joinpath("adb")
+        adb.write_text(
+            f"#!/bin/sh\nyes \"serving: 'lineage.zip'  (~47%)\" | head -n {LINES}\n"
+        )
+        adb.chmod(adb.stat().st_mode | stat.S_IEXEC)
+
+    def teardown(self, enable_logging: bool):
+        shutil.rmtree(self.bin_path)
+
+    def time_run_command(self, enable_logging: bool):
+        for _ in run_command(
+            "adb sideload", self.bin_path, enable_logging=enable_logging
+        ):
+            pass
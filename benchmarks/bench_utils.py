@@ -0,0 +1,81 @@
+"""Benchmark reading the metadata of OS images."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
+from utils import _inspect_image, retrieve_image_metadata
+
+GIB = 1024**3
+CHUNK_SIZE = 64 * 1024 * 1024
+METADATA = """ota-type=AB
+post-build=google/sargo/sargo:12/SP2A.220505.008/8782922:user/release-keys
+post-sdk-level=32
+pre-device=sargo
+"""
+
+
+class SparseWriter:
+    """File wrapper skipping over zeros instead of writing them, so huge images stay sparse."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, data: bytes) -> int:
+        if len(data) >= CHUNK_SIZE and not data.strip(b"\0"):
+            self._stream.seek(len(data), os.SEEK_CUR)
+            return len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def write_image(path: Path, size: int):
+    """Write an OS image zip with a payload of zeros of the given size."""
+    zeros = bytes(CHUNK_SIZE)
+    with open(path, "wb") as stream:
+        with zipfile.ZipFile(SparseWriter(stream), "w") as image_zip:
+            image_zip.writestr("META-INF/com/android/metadata", METADATA)
+            for name in ("apex_info.pb", "care_map.pb", "payload_properties.txt"):
+                image_zip.writestr(name, b"\1" * 1024)
+            info = zipfile.ZipInfo("payload.bin")
+            info.file_size = size
+            with image_zip.open(info, "w", force_zip64=True) as payload:
+                for _ in range(size // CHUNK_SIZE):
+                    payload.write(zeros)
+        stream.truncate()
+
+
+class RetrieveImageMetadata:
+    """Read the metadata of OS images of some GiB."""
+
+    params = [1, 4]
+
+    def setup(self, size: int):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix="oai-images-"))
+        self.image_path = str(self.tmp_dir.joinpath(f"lineage-{size}gib.zip"))
+        write_image(Path(self.image_path), size * GIB)
+
+    def teardown(self, size: int):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_retrieve_image_metadata(self, size: int):
+        """Selecting and checking the same image again."""
+        retrieve_image_metadata(self.image_path)
+
+    def time_retrieve_image_metadata_uncached(self, size: int):
+        _inspect_image.cache_clear()
+        retrieve_image_metadata(self.image_path)
@@ -0,0 +1,95 @@
+"""Benchmark the widgets showing the output and the progress of the tools."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+from progress import ProgressEvent
+from widgets import ProgressIndicator, TerminalBox
+
+LINES = 10_000
+
+
+class _TerminalBox(TerminalBox):
+    def update(self):
+        """There is no page to update without the app."""
+
+
+class _ProgressIndicator(ProgressIndicator):
+    def update(self):
+        """There is no page to update without the app."""
+
+
+class TerminalBoxWriteLine:
+    """Write the output of a long sideload to the terminal box."""
+
+    def setup(self):
+        self.lines = [
+            f"serving: 'lineage.zip'  (~{line * 100 // LINES}%)"
+            for line in range(LINES)
+        ]
+        self.terminal_box = _TerminalBox(expand=True)
+        self.terminal_box.build()
+        # fill the buffer, so flushing shows as many lines as the box keeps
+        for line in self.lines:
+            self.terminal_box.write_line(line)
+
+    def teardown(self):
+        self.terminal_box.flush()
+
+    def time_write_line(self):
+        for line in self.lines:
+            self.terminal_box.write_line(line)
+
+    def time_flush(self):
+        self.terminal_box.flush()
+
+
+class ProgressIndicatorDisplayProgressBar:
+    """Show the progress of adb, fastboot and heimdall in the progress bar."""
+
+    params = ["adb", "fastboot", "heimdall", "events"]
+
+    def setup(self, tool: str):
+        if tool == "adb":
+            self.lines = [
+                f"serving: 'lineage.zip'  (~{line * 100 // LINES}%)"
+                for line in range(LINES)
+            ] + ["Total xfer: 1.00x"]
+        elif tool == "fastboot":
+            self.lines = [
+                line
+                for chunk in range(1, LINES // 4 + 1)
+                for line in (
+                    f"Sending sparse 'super' {chunk}/{LINES // 4} (524284 KB)",
+                    "OKAY [ 12.301s]",
+                    f"Writing 'super' {chunk}/{LINES // 4}",
+                    "OKAY [  2.003s]",
+                )
+            ] + ["Finished. Total time: 42.123s"]
+        elif tool == "heimdall":
+            self.lines = [f"{line * 100 // LINES}%" for line in range(LINES)]
+        else:
+            self.lines = [
+                ProgressEvent(
+                    label="super.img",
+                    bytes_done=line * 1024 * 1024,
+                    bytes_total=LINES * 1024 * 1024,
+                    bytes_per_second=21.3e6,
+                    eta=LINES - line,
+                )
+                for line in range(LINES)
+            ]
+        self.progress_indicator = _ProgressIndicator(expand=True)
+        self.progress_indicator.build()
+
+    def time_display_progress_bar(self, tool: str):
+        self.progress_indicator.clear()
+        for line in self.lines:
+            self.progress_indicator.display_progress_bar(line)
@@ -0,0 +1,256 @@
+"""Run the micro-benchmarks of the hot paths and store the results as JSON.
+
+The benchmarks are written like for asv: the modules `bench_*.py` in this directory contain
+classes with `time_*` methods. `setup` and `teardown` of a class run once around all of its
+methods. If the class has a list of `params`, they run for each parameter, which is passed to
+`setup`, `teardown` and the methods. How often a method is called per round is chosen
+automatically, unless the method or the class sets `number`; `repeat` sets the number of rounds.
+
+Usage:
+    python benchmarks/run.py                    # run all and write results/<version>.json
+    python benchmarks/run.py -k config          # only run the benchmarks matching 'config'
+    python benchmarks/run.py --compare benchmarks/results/0.5.4-beta.json
+"""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+import tomllib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCHMARK_DIR.parent
+RESULTS_DIR = BENCHMARK_DIR.joinpath("results")
+# the modules of the application import each other by their bare names
+sys.path.insert(0, str(ROOT_DIR.joinpath("openandroidinstaller")))
+
+from loguru import logger  # noqa: E402
+
+DEFAULT_REPEAT = 5
+# a benchmark is reported as regression if it got slower by this factor
+DEFAULT_THRESHOLD = 1.2
+
+
+@dataclass
+class Result:
+    """Timings of a benchmark.
+
+    Attributes:
+        name: Name of the benchmark, like `installer_config.FindConfigFile.time_lookup`.
+        number: Calls of the benchmark per round.
+        times: Seconds per call of every round.
+    """
+
+    name: str
+    number: int
+    times: List[float]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "min": min(self.times),
+            "median": statistics.median(self.times),
+            "mean": statistics.mean(self.times),
+            "stdev": statistics.stdev(self.times) if len(self.times) > 1 else 0.0,
+            "number": self.number,
+            "rounds": len(self.times),
+        }
+
+
+def load_benchmarks() -> Iterator[Tuple[str, type]]:
+    """Import the benchmark modules and get the benchmark classes with their names."""
+    for path in sorted(BENCHMARK_DIR.glob("bench_*.py")):
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)  # type: ignore
+        for name, cls in vars(module).items():
+            if (
+                isinstance(cls, type)
+                and cls.__module__ == module.__name__
+                and any(attribute.startswith("time_") for attribute in vars(cls))
+            ):
+                yield f"{path.stem.removeprefix('bench_')}.{name}", cls
+
+
+def time_function(
+    function: Callable[[], Any], number: int, repeat: int
+) -> Tuple[int, List[float]]:
+    """Time the function and return the calls per round with the seconds per call of every round."""
+    timer = timeit.Timer(function)
+    if not number:
+        # call the function often enough to run for at least 0.2 seconds per round
+        number, _ = timer.autorange()
+    return number, [
+        seconds / number for seconds in timer.repeat(repeat=repeat, number=number)
+    ]
+
+
+def run_benchmarks(pattern: str = "", repeat: int = DEFAULT_REPEAT) -> List[Result]:
+    """Run all benchmarks with the pattern in their name."""
+    results = []
+    for class_name, cls in load_benchmarks():
+        methods = sorted(name for name in vars(cls) if name.startswith("time_"))
+        for param in getattr(cls, "params", [None]):
+            suffix = "" if param is None else f"[{param}]"
+            names = {
+                method: f"{class_name}.{method}{suffix}"
+                for method in methods
+                if pattern in f"{class_name}.{method}{suffix}"
+            }
+            if not names:
+                continue
+            args = () if param is None else (param,)
+            benchmark = cls()
+            if hasattr(benchmark, "setup"):
+                benchmark.setup(*args)
+            try:
+                for method, name in names.items():
+                    function = getattr(benchmark, method)
+                    number, times = time_function(
+                        lambda: function(*args),
+                        number=getattr(function, "number", getattr(cls, "number", 0)),
+                        repeat=getattr(
+                            function, "repeat", getattr(cls, "repeat", repeat)
+                        ),
+                    )
+                    result = Result(name=name, number=number, times=times)
+                    print(
+                        f"{name:<80} {format_time(result.summary()['min']):>10}",
+                        flush=True,
+                    )
+                    results.append(result)
+            finally:
+                if hasattr(benchmark, "teardown"):
+                    benchmark.teardown(*args)
+    return results
+
+
+def format_time(seconds: float) -> str:
+    for unit, factor in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return f"{seconds / factor:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def get_version() -> str:
+    with open(ROOT_DIR.joinpath("pyproject.toml"), "rb") as stream:
+        return tomllib.load(stream)["tool"]["poetry"]["version"]
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results: List[Result], path: Path):
+    """Write the results together with the version and the machine they were measured on."""
+    report = {
+        "version": get_version(),
+        "commit": get_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "benchmarks": {result.name: result.summary() for result in results},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump(report, stream, indent=2)
+        stream.write("\n")
+    print(f"Wrote the results to {path}.")
+
+
+def compare_results(
+    results: List[Result], baseline_path: Path, threshold: float
+) -> int:
+    """Print the change of the fastest rounds against the baseline and count the regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as stream:
+        baseline = json.load(stream)
+    print(f"\nCompared to {baseline['version']} ({baseline.get('commit')}):")
+    regressions = 0
+    for result in results:
+        old = baseline["benchmarks"].get(result.name)
+        if old is None:
+            continue
+        ratio = result.summary()["min"] / old["min"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = "  improved"
+        print(f"{result.name:<80} {ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-k", dest="pattern", default="", help="Only run benchmarks matching this."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="Rounds per benchmark."
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Path to write the results to. Defaults to results/<version>.json.",
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="Results to compare against, like a release."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Slowdown factor reported as regression.",
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="oai-benchmarks-") as tmp_dir:
+        # keep the persistent caches of the application apart from the ones of the user
+        os.environ["OPENANDROIDINSTALLER_CACHE_DIR"] = tmp_dir
+        # log to a file like the application does, instead of flooding the terminal
+        logger.remove()
+        sink_id = logger.add(Path(tmp_dir).joinpath("benchmarks.log"))
+        try:
+            results = run_benchmarks(args.pattern, repeat=args.repeat)
+        finally:
+            logger.remove(sink_id)
+    if not results:
+        print(f"No benchmarks match '{args.pattern}'.")
+        return 1
+    write_results(results, args.output or RESULTS_DIR.joinpath(f"{get_version()}.json"))
+    if args.compare and compare_results(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
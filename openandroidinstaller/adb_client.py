@@ -0,0 +1,368 @@
+"""This module contains a client speaking the protocol of the adb server directly."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import os
+import re
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Generator, Iterator, List, Optional, Union
+
+from loguru import logger
+
+TerminalResponse = Generator[Union[str, bool], None, None]
+
+# packet ids of the shell v2 protocol
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+# fields like `usb:1-1.2` or `transport_id:3` following the state of a device
+DETAIL_FIELD = re.compile(r"^[a-z_]+:")
+
+
+class AdbError(Exception):
+    """Error reported by the adb server or raised on protocol violations."""
+
+
+@dataclass(frozen=True)
+class DeviceInfo:
+    """A device as listed by `adb devices -l` or `fastboot devices -l`.
+
+    Attributes:
+        serial: Serial number of the device.
+        state: State of the device like device, recovery, sideload, bootloader or offline.
+        usb: USB path of the device, if connected via USB.
+        product: Product name of the device.
+        model: Model name of the device.
+        device: Device code of the device.
+        transport_id: Id of the adb transport used for the device.
+    """
+
+    serial: str
+    state: str
+    usb: Optional[str] = None
+    product: Optional[str] = None
+    model: Optional[str] = None
+    device: Optional[str] = None
+    transport_id: Optional[str] = None
+
+
+def parse_devices(output: str) -> List[DeviceInfo]:
+    """Parse the output of `adb devices -l` or the `host:devices-l` service."""
+    devices = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or line.startswith("List of devices") or line.startswith("*"):
+            continue
+        serial, *fields = line.split()
+        if not fields:
+            continue
+        # some states contain spaces, e.g. "no permissions (...)", so they end at the first field
+        end = next(
+            (
+                index
+                for index, field in enumerate(fields)
+                if index > 0 and DETAIL_FIELD.match(field)
+            ),
+            len(fields),
+        )
+        state = " ".join(fields[:end])
+        details = fields[end:]
+        attributes = {}
+        for detail in details:
+            key, sep, value = detail.partition(":")
+            if sep:
+                attributes[key] = value
+        devices.append(
+            DeviceInfo(
+                serial=serial,
+                state=state,
+                usb=attributes.get("usb"),
+                product=attributes.get("product"),
+                model=attributes.get("model"),
+                device=attributes.get("device"),
+                transport_id=attributes.get("transport_id"),
+            )
+        )
+    return devices
+
+
+class AdbClient:
+    """Client for the adb server using its smart socket protocol on localhost.
+
+    The client does not spawn any processes, so it only works if an adb server is already
+    running. Every request uses a fresh connection to the server, since the server closes
+    the connection after serving a request or hands it over to the device.
+
+    Commands for a device are generators yielding the output lines and finally a boolean
+    encoding success, like `tooling.run_command` which uses them if a server is running. A running command is stopped with `abort`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # connections to devices by the id of the thread running the command
+        self._device_connections: Dict[int, socket.socket] = {}
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        """Check if an adb server is listening."""
+        try:
+            self.server_version()
+            return True
+        except (OSError, AdbError):
+            return False
+
+    def server_version(self) -> int:
+        """Get the protocol version of the running adb server."""
+        with self._connect(timeout=self.timeout) as sock:
+            self._request(sock, "host:version")
+            return int(self._read_length_prefixed(sock), 16)
+
+    def devices(self) -> List[DeviceInfo]:
+        """List the devices known to the adb server."""
+        with self._connect(timeout=self.timeout) as sock:
+            self._request(sock, "host:devices-l")
+            return parse_devices(self._read_length_prefixed(sock))
+
+    def features(self, serial: Optional[str] = None, usb: bool = True) -> List[str]:
+        """Get the features supported by the device."""
+        with self._connect(timeout=self.timeout) as sock:
+            self._request(sock, f"{self._host_prefix(serial, usb)}:features")
+            return self._read_length_prefixed(sock).split(",")
+
+    def shell(
+        self, command: str, serial: Optional[str] = None, usb: bool = True
+    ) -> TerminalResponse:
+        """Run a shell command on the device.
+
+        Args:
+            command: Command to run in the shell of the device.
+            serial: Serial of the device. If not given, the only device is used.
+            usb: If no serial is given, only use a device connected via USB like `adb -d`.
+        """
+        try:
+            use_v2 = "shell_v2" in self.features(serial, usb)
+            with self._device_connection(serial, usb) as sock:
+                if use_v2:
+                    self._request(sock, f"shell,v2,raw:{command}")
+                    success = yield from self._read_shell_v2(sock)
+                else:
+                    # without shell v2 the exit code of the command is unknown
+                    self._request(sock, f"shell:{command}")
+                    yield from _lines(_read_stream(sock))
+                    success = True
+        except (OSError, AdbError) as e:
+            logger.error(f"adb shell {command} failed: {e}")
+            yield f"error: {e}"
+            success = False
+        yield success
+
+    def reboot(
+        self, target: str = "", serial: Optional[str] = None, usb: bool = True
+    ) -> TerminalResponse:
+        """Reboot the device into the given target like bootloader, recovery or download."""
+        try:
+            with self._device_connection(serial, usb) as sock:
+                self._request(sock, f"reboot:{target}")
+                yield from _lines(_read_stream(sock))
+            success = True
+        except (OSError, AdbError) as e:
+            logger.error(f"adb reboot {target} failed: {e}")
+            yield f"error: {e}"
+            success = False
+        yield success
+
+    def sideload(
+        self,
+        path: str,
+        serial: Optional[str] = None,
+        usb: bool = True,
+        block_size: int = 65536,
+    ) -> TerminalResponse:
+        """Serve the file to a device in sideload mode like `adb sideload`.
+
+        The progress is reported in the same format as the adb binary does.
+        """
+        size = os.path.getsize(path)
+        name = os.path.basename(path)
+        transferred = 0
+        last_percentage = -1
+        try:
+            with open(path, "rb") as image, self._device_connection(
+                serial, usb
+            ) as sock:
+                self._request(sock, f"sideload-host:{size}:{block_size}")
+                while True:
+                    request = _read_exactly(sock, 8)
+                    if request == b"DONEDONE":
+                        success = True
+                        break
+                    if request == b"FAILFAIL":
+                        yield "adb: failed to sideload: device reported failure"
+                        success = False
+                        break
+                    offset = int(request) * block_size
+                    if offset >= size:
+                        raise AdbError(
+                            f"Device requested block beyond the end: {offset}"
+                        )
+                    image.seek(offset)
+                    block = image.read(min(block_size, size - offset))
+                    sock.sendall(block)
+                    transferred += len(block)
+                    # the device reads the image more than once, so the percentage is estimated
+                    percentage = min(99, transferred * 100 // size)
+                    if percentage != last_percentage:
+                        last_percentage = percentage
+                        yield f"serving: '{name}'  (~{percentage}%)"
+            yield f"Total xfer: {transferred / max(size, 1):.2f}x"
+        except (OSError, AdbError, ValueError) as e:
+            logger.error(f"adb sideload {path} failed: {e}")
+            yield f"error: {e}"
+            success = False
+        yield success
+
+    def abort(self, thread_id: int) -> bool:
+        """Abort the command running in the given thread, if there is one.
+
+        The command reports a failure.
+
+        Returns:
+            True if a running command was aborted.
+        """
+        with self._lock:
+            sock = self._device_connections.get(thread_id)
+        if sock is None:
+            return False
+        logger.info("Abort the command running through the adb server.")
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            return False
+        return True
+
+    def _connect(self, timeout: Optional[float] = None) -> socket.socket:
+        """Open a connection to the adb server.
+
+        The timeout applies to reading from the connection; by default reads block.
+        """
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.settimeout(timeout)
+        return sock
+
+    @contextmanager
+    def _device_connection(
+        self, serial: Optional[str], usb: bool
+    ) -> Iterator[socket.socket]:
+        """Open a connection bound to the device with the given serial or the only device."""
+        if serial:
+            transport = f"host:transport:{serial}"
+        else:
+            transport = "host:transport-usb" if usb else "host:transport-any"
+        thread_id = threading.get_ident()
+        with self._connect() as sock:
+            with self._lock:
+                self._device_connections[thread_id] = sock
+            try:
+                self._request(sock, transport)
+                yield sock
+            finally:
+                with self._lock:
+                    self._device_connections.pop(thread_id, None)
+
+    @staticmethod
+    def _host_prefix(serial: Optional[str], usb: bool) -> str:
+        if serial:
+            return f"host-serial:{serial}"
+        return "host-usb" if usb else "host"
+
+    def _request(self, sock: socket.socket, service: str):
+        """Send a request for a service and check the response status."""
+        payload = service.encode("utf-8")
+        sock.sendall(f"{len(payload):04x}".encode("ascii") + payload)
+        self._read_status(sock)
+
+    def _read_status(self, sock: socket.socket):
+        status = _read_exactly(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self._read_length_prefixed(sock))
+        raise AdbError(f"Unexpected response from adb server: {status!r}")
+
+    @staticmethod
+    def _read_length_prefixed(sock: socket.socket) -> str:
+        length = int(_read_exactly(sock, 4), 16)
+        return _read_exactly(sock, length).decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _read_shell_v2(sock: socket.socket) -> Generator[str, None, bool]:
+        """Read output packets of the shell v2 protocol and return if the command succeeded."""
+        exit_code = None
+        pending = ""
+        while True:
+            try:
+                header = _read_exactly(sock, 5)
+            except AdbError:
+                break
+            packet_id, length = struct.unpack("<BI", header)
+            data = _read_exactly(sock, length)
+            if packet_id in (SHELL_STDOUT, SHELL_STDERR):
+                pending += data.decode("utf-8", errors="replace")
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    if line.strip():
+                        yield line.strip()
+            elif packet_id == SHELL_EXIT:
+                exit_code = data[0] if data else 0
+                break
+        if pending.strip():
+            yield pending.strip()
+        return exit_code == 0
+
+
+def _read_exactly(sock: socket.socket, length: int) -> bytes:
+    """Read exactly the given number of bytes from the socket."""
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise AdbError("Connection closed by adb server.")
+        data += chunk
+    return data
+
+
+def _read_stream(sock: socket.socket) -> Iterator[bytes]:
+    """Read from the socket until the connection is closed."""
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _lines(chunks: Iterator[bytes]) -> Iterator[str]:
+    """Split a stream of bytes into non-empty, stripped lines."""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk.decode("utf-8", errors="replace")
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if pending.strip():
+        yield pending.strip()
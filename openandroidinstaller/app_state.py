@@ -10,12 +10,59 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
-import copy
+import threading
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+from flow import (  # noqa: F401
+    BOOT_FLASHED_RECOVERY_STEP,
+    FlowError,
+    FlowGraph,
+    FlowOptions,
+    compile_flow,
+    plan_steps,
+)
 from installer_config import Step, _load_config
+from journal import Checkpoint, InstallJournal, verify_checkpoint
 from loguru import logger
+from utils import CheckResult, CompatibilityStatus
+
+
+class StepPlan:
+    """The steps to run in order and a cursor pointing to the next one.
+
+    The steps are shared with the config and only referenced, so creating a plan is cheap.
+    """
+
+    __slots__ = ("steps", "cursor")
+
+    def __init__(self, steps: Tuple[Step, ...] = ()):
+        self.steps = steps
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        """Number of steps left."""
+        return len(self.steps) - self.cursor
+
+    def __bool__(self) -> bool:
+        return self.cursor < len(self.steps)
+
+    @property
+    def current(self) -> Optional[Step]:
+        """The next step, None if all steps are done."""
+        return self.steps[self.cursor] if self else None
+
+    def advance(self) -> Step:
+        """Return the next step and move the cursor past it.
+
+        Raises:
+            IndexError: If all steps are done.
+        """
+        if not self:
+            raise IndexError("No steps left.")
+        step = self.steps[self.cursor]
+        self.cursor += 1
+        return step
 
 
 class AppState:
@@ -44,6 +91,20 @@ class AppState:
         self.install_addons = False
         self.addon_paths = []
         self.config = None
+        self.steps = StepPlan()
+        # flow of the planned steps, compiled once the images are selected
+        self.flow: Optional[FlowGraph] = None
+        # flow installing the OS image and the addons after the steps
+        self.install_flow: Optional[FlowGraph] = None
+        # journal of the completed steps and the interrupted installation offered to resume
+        self.journal: Optional[InstallJournal] = None
+        self.checkpoint: Optional[Checkpoint] = None
+        # True if a resumed installation installed the OS already
+        self.os_installed = False
+        # set to cancel the running command; shared by the task runners of the views and the flow
+        self.cancel_event = threading.Event()
+        # properties of the connected device, read by the device search
+        self.device_properties = None
         self.image_path = None
         self.recovery_path = None
         self.dtbo_path = None
@@ -72,51 +133,165 @@ class AppState:
         """Load the config from file to state by device code."""
         self.config = _load_config(device_code, self.config_path)
         if self.config:
-            self.steps = copy.deepcopy(self.config.unlock_bootloader) + copy.deepcopy(
-                self.config.boot_recovery
-            )
+            self._plan_steps()
 
     def toggle_flash_unlock_bootloader(self):
         """Toggle flashing of unlock bootloader."""
         self.unlock_bootloader = not self.unlock_bootloader
         if self.unlock_bootloader:
             logger.info("Enabled unlocking the bootloader again.")
-            self.steps = copy.deepcopy(self.config.unlock_bootloader)
         else:
             logger.info("Skipping bootloader unlocking.")
-            self.steps = []
-        # if the recovery is already flashed, skip flashing it again
-        if self.flash_recovery:
-            self.steps += copy.deepcopy(self.config.boot_recovery)
-        else:
-            self.steps = [
-                Step(
-                    title="Boot custom recovery",
-                    type="confirm_button",
-                    content="If you already flashed TWRP, boot into it by pressing 'Confirm and run'. Otherwise restart the process. Once your phone screen looks like the picture on the left, continue.",
-                    command="adb_reboot_recovery",
-                    img="twrp-start.png",
-                )
-            ]
+        self._plan_steps()
 
     def toggle_flash_recovery(self):
         """Toggle flashing of recovery."""
         self.flash_recovery = not self.flash_recovery
-        if self.unlock_bootloader:
-            self.steps = copy.deepcopy(self.config.unlock_bootloader)
-        else:
-            self.steps = []
         if self.flash_recovery:
             logger.info("Enabled flashing recovery again.")
-            self.steps += copy.deepcopy(self.config.boot_recovery)
         else:
             logger.info("Skipping flashing recovery.")
-            self.steps = [
-                Step(
-                    title="Boot custom recovery",
-                    type="call_button",
-                    content="If you already flashed TWRP, boot into it by pressing 'Confirm and run'. Otherwise restart the process. Once your phone screen looks like the picture on the left, continue.",
-                    command="adb_reboot_recovery",
-                    img="twrp-start.png",
-                )
-            ]
+        self._plan_steps()
+
+    def _plan_steps(self):
+        """Plan the steps of the config for the current switches."""
+        self.steps = StepPlan(
+            plan_steps(self.config, self.unlock_bootloader, self.flash_recovery)
+        )
+        self.flow = None
+
+    def flow_options(self, **options) -> FlowOptions:
+        """Get the options to compile a flow with from the state. Keyword arguments override them."""
+        return FlowOptions(
+            **{
+                "bin_path": self.bin_path,
+                "config_path": self.config_path,
+                "unlock_bootloader": self.unlock_bootloader,
+                "flash_recovery": self.flash_recovery,
+                "install_addons": self.install_addons,
+                "addon_paths": tuple(self.addon_paths),
+                "image": self.image_path,
+                "recovery": self.recovery_path,
+                "dtbo": self.dtbo_path,
+                "vbmeta": self.vbmeta_path,
+                "super_empty": self.super_empty_path,
+                "vendor_boot": self.vendor_boot_path,
+                "serial": self.serial,
+                "cancel_event": self.cancel_event,
+                **options,
+            }
+        )
+
+    def compile_flow(self, **options) -> FlowGraph:
+        """Compile the planned steps with the selected images into the flow to run.
+
+        Raises:
+            FlowError: If an image needed by a step is missing.
+        """
+        self.flow = compile_flow(
+            self.config, self.flow_options(**options), steps=self.steps.steps
+        )
+        return self.flow
+
+    def compile_install_flow(self) -> FlowGraph:
+        """Compile the flow installing the OS image and then the addons, if they are enabled.
+
+        The first node installs the OS image, the following nodes install the addons. Compile it
+        again once the addons are selected.
+
+        Raises:
+            FlowError: If the OS image is missing.
+        """
+        self.install_flow = compile_flow(
+            self.config, self.flow_options(install_os=True), steps=()
+        )
+        return self.install_flow
+
+    @property
+    def serial(self) -> Optional[str]:
+        """Serial of the connected device, if it was read already."""
+        return self.device_properties.serial if self.device_properties else None
+
+    def start_journal(self):
+        """Journal the steps of the compiled flow, if the serial of the device is known."""
+        serial = self.serial
+        if self.flow is None or not serial:
+            return
+        self.close_journal()
+        self.journal = InstallJournal(serial)
+        self.journal.start(self.config, self.flow)
+
+    def finish_journal(self):
+        """Record that the installation finished and close the journal."""
+        if self.journal:
+            self.journal.finish()
+        self.close_journal()
+
+    def close_journal(self):
+        """Wait until the records of the journal are written and stop journaling."""
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def resume_install(self, checkpoint: Checkpoint) -> CheckResult:
+        """Restore the state of an interrupted installation, if it can be resumed.
+
+        The state is only changed if the device and the images are still the same. The planned
+        steps continue with the first step which didn't complete and wasn't skipped. If the OS was
+        installed already, only the addons are left to install.
+
+        Args:
+            checkpoint: Checkpoint of the interrupted installation.
+
+        Returns:
+            CheckResult object with the status and a message to display.
+        """
+        config = _load_config(checkpoint.device_code, self.config_path)
+        if not config:
+            return CheckResult(
+                CompatibilityStatus.INCOMPATIBLE,
+                f"No config found for the device code '{checkpoint.device_code}'.",
+            )
+        steps = plan_steps(
+            config,
+            checkpoint.choices["unlock_bootloader"],
+            checkpoint.choices["flash_recovery"],
+        )
+        options = FlowOptions(
+            bin_path=self.bin_path,
+            config_path=self.config_path,
+            addon_paths=checkpoint.addon_paths,
+            serial=checkpoint.serial,
+            cancel_event=self.cancel_event,
+            **checkpoint.choices,
+            **checkpoint.artifacts,
+        )
+        try:
+            flow = compile_flow(config, options, steps=steps)
+        except FlowError as e:
+            return CheckResult(CompatibilityStatus.INCOMPATIBLE, str(e))
+        result = verify_checkpoint(checkpoint, flow, self.bin_path)
+        if result.status != CompatibilityStatus.COMPATIBLE:
+            return result
+
+        self.config = config
+        self.unlock_bootloader = options.unlock_bootloader
+        self.flash_recovery = options.flash_recovery
+        self.install_addons = options.install_addons
+        self.addon_paths = list(options.addon_paths)
+        self.image_path = options.image
+        self.recovery_path = options.recovery
+        self.dtbo_path = options.dtbo
+        self.vbmeta_path = options.vbmeta
+        self.super_empty_path = options.super_empty
+        self.vendor_boot_path = options.vendor_boot
+        self.steps = StepPlan(steps)
+        self.steps.cursor = checkpoint.next_index
+        self.flow = flow
+        self.os_installed = 0 in checkpoint.installed
+        # continue the journal of the interrupted installation
+        self.close_journal()
+        self.journal = InstallJournal(checkpoint.serial, checkpoint.path.parent)
+        self.checkpoint = None
+        logger.info(f"Resume the installation on {checkpoint.serial}.")
+        return result
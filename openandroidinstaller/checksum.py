@@ -0,0 +1,197 @@
+"""This module contains functions to verify the integrity of OS images with SHA-256 checksums."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import regex as re
+from loguru import logger
+from utils import CheckResult, CompatibilityStatus, get_cache_dir
+
+# large reads keep the number of system calls low for images of several GB
+HASH_BUFFER_SIZE = 4 * 1024 * 1024
+DIGEST_CACHE_FILE = "image-digests.json"
+# number of digests kept in the cache
+DIGEST_CACHE_SIZE = 32
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+ProgressCallback = Callable[[int, int], None]
+
+_cache_lock = threading.Lock()
+
+
+def normalize_checksum(text: str) -> Optional[str]:
+    """Get the SHA-256 checksum from a text like the content of a `.sha256` file.
+
+    Returns:
+        The checksum in lowercase or None if the text doesn't start with a valid checksum.
+    """
+    parts = text.strip().split()
+    if not parts:
+        return None
+    checksum = parts[0].lower()
+    if SHA256_PATTERN.match(checksum):
+        return checksum
+    return None
+
+
+def read_sidecar_checksum(image_path: str) -> Optional[str]:
+    """Read the checksum from the `.sha256` file next to the image, as offered by the download pages.
+
+    Both `<image>.zip.sha256` and `<image>.sha256` are checked.
+    """
+    path = Path(image_path)
+    for sidecar in (
+        path.with_name(path.name + ".sha256"),
+        path.with_suffix(".sha256"),
+    ):
+        try:
+            checksum = normalize_checksum(sidecar.read_text(errors="replace"))
+        except OSError:
+            continue
+        if checksum:
+            logger.info(f"Found checksum file {sidecar.name}.")
+            return checksum
+        logger.warning(f"Checksum file {sidecar.name} is malformed.")
+    return None
+
+
+def _cache_key(stat: os.stat_result) -> str:
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _read_digest_cache() -> Dict[str, str]:
+    try:
+        with open(get_cache_dir().joinpath(DIGEST_CACHE_FILE)) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_digest_cache(cache: Dict[str, str]):
+    cache_path = get_cache_dir().joinpath(DIGEST_CACHE_FILE)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Can't write digest cache: {e}")
+
+
+def sha256_file(
+    path: str,
+    progress_callback: Optional[ProgressCallback] = None,
+    buffer_size: int = HASH_BUFFER_SIZE,
+) -> str:
+    """Compute the SHA-256 digest of a file by streaming it in large blocks.
+
+    Digests are cached on disk by inode, size and modification time of the file, so the same
+    image is only read once, even if it is flashed on several devices.
+
+    Args:
+        path: Path to the file.
+        progress_callback: Called with the number of bytes hashed and the size of the file.
+        buffer_size: Number of bytes read at once.
+
+    Returns:
+        The digest as hex string.
+    """
+    stat = os.stat(path)
+    key = _cache_key(stat)
+    with _cache_lock:
+        digest = _read_digest_cache().get(key)
+    if digest:
+        logger.info(f"Using cached checksum of {Path(path).name}.")
+        if progress_callback:
+            progress_callback(stat.st_size, stat.st_size)
+        return digest
+
+    logger.info(f"Computing checksum of {Path(path).name}.")
+    hasher = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    done = 0
+    with open(path, "rb", buffering=0) as image:
+        while True:
+            read = image.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+            done += read
+            if progress_callback:
+                progress_callback(done, stat.st_size)
+    digest = hasher.hexdigest()
+
+    with _cache_lock:
+        cache = _read_digest_cache()
+        cache.pop(key, None)
+        cache[key] = digest
+        # dicts keep the insertion order, so the oldest digests are dropped first
+        while len(cache) > DIGEST_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        _write_digest_cache(cache)
+    return digest
+
+
+def verify_image_checksum(
+    image_path: str,
+    expected: Optional[str] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> CheckResult:
+    """Verify the SHA-256 checksum of an OS image.
+
+    Args:
+        image_path: Path to the image file.
+        expected: Checksum given by the user. If it's not given, the `.sha256` file next to the image is used.
+            The image is only hashed if there is a checksum to compare with.
+        progress_callback: Called with the number of bytes hashed and the size of the image.
+
+    Returns:
+        CheckResult object with the status of the verification and a message.
+    """
+    if expected:
+        expected = normalize_checksum(expected)
+        if not expected:
+            return CheckResult(
+                CompatibilityStatus.INCOMPATIBLE,
+                "The given checksum is not a valid SHA-256 checksum.",
+            )
+    else:
+        expected = read_sidecar_checksum(image_path)
+    if not expected:
+        # hashing a large image takes a while, don't do it without a checksum to compare with
+        logger.info(f"No checksum to verify {image_path} with.")
+        return CheckResult(
+            CompatibilityStatus.UNKNOWN, "No checksum found to verify the image."
+        )
+    try:
+        digest = sha256_file(image_path, progress_callback=progress_callback)
+    except OSError as e:
+        logger.error(f"Can't read image {image_path}: {e}")
+        return CheckResult(CompatibilityStatus.INCOMPATIBLE, "Can't read the image.")
+
+    if digest != expected:
+        logger.error(f"Checksum mismatch: expected {expected}, got {digest}.")
+        return CheckResult(
+            CompatibilityStatus.INCOMPATIBLE,
+            "The checksum doesn't match. The image might be corrupted, please download it again.",
+        )
+    logger.success("The checksum of the image matches.")
+    return CheckResult(CompatibilityStatus.COMPATIBLE, "The checksum matches.")
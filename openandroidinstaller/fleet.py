@@ -0,0 +1,183 @@
+"""This module contains classes to run the install flows on several devices concurrently."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+
+from installer_config import InstallerConfig
+from loguru import logger
+from progress import ProgressEvent, ProgressParser
+from tooling import TerminalResponse, list_devices
+
+# output lines kept per session; the full output is written to the log files
+MAX_SESSION_LINES = 1000
+
+
+class SessionStatus(Enum):
+    """Enum for the status of a device session."""
+
+    PENDING = 0
+    RUNNING = 1
+    SUCCEEDED = 2
+    FAILED = 3
+
+
+@dataclass
+class DeviceSession:
+    """State of the installation on a single device.
+
+    Attributes:
+        serial: Serial number of the device as listed by adb or fastboot.
+        bin_path: Path to the directory with the tools.
+        config: Config of the device.
+        image_path: Path to the OS image.
+        recovery_path: Path to the recovery image.
+        addon_paths: Paths to the addons to install.
+        status: Status of the session.
+        progress: Progress of the current flow in percent.
+        lines: Last output lines of the flows run on the device, at most `MAX_SESSION_LINES`.
+    """
+
+    serial: str
+    bin_path: Path
+    config: Optional[InstallerConfig] = None
+    image_path: Optional[str] = None
+    recovery_path: Optional[str] = None
+    addon_paths: List[str] = field(default_factory=list)
+    status: SessionStatus = SessionStatus.PENDING
+    progress: int = 0
+    lines: Deque[str] = field(default_factory=lambda: deque(maxlen=MAX_SESSION_LINES))
+
+
+@dataclass(frozen=True)
+class FleetEvent:
+    """Event emitted while running a flow on a device.
+
+    Attributes:
+        serial: Serial number of the device.
+        kind: Kind of the event: line, progress, transfer or finished.
+        value: The output line, the progress in percent, the `ProgressEvent` of a flash or the success of the flow.
+    """
+
+    serial: str
+    kind: str
+    value: Any
+
+
+# flows address the device of the session by passing `serial=session.serial` to the tooling
+Flow = Callable[[DeviceSession], TerminalResponse]
+
+
+class FleetEngine:
+    """Run flows of the tooling module on many devices concurrently on a worker pool.
+
+    Every device gets its own `DeviceSession` collecting the output and progress, and its own
+    log file if a log directory is given. Events are passed to `on_event` from the worker threads.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        on_event: Optional[Callable[[FleetEvent], None]] = None,
+        log_dir: Optional[Path] = None,
+    ):
+        self.sessions: Dict[str, DeviceSession] = {}
+        self.on_event = on_event
+        self.log_dir = log_dir
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="fleet"
+        )
+        self._lock = threading.Lock()
+
+    def add_session(self, session: DeviceSession):
+        """Add a device to the fleet."""
+        if session.serial in self.sessions:
+            raise ValueError(f"Device {session.serial} is already part of the fleet.")
+        self.sessions[session.serial] = session
+
+    def discover(self, bin_path: Path, states=("device", "recovery", "bootloader")):
+        """Add a session for every connected device in one of the given states."""
+        for device in list_devices(bin_path):
+            if device.state in states and device.serial not in self.sessions:
+                self.add_session(DeviceSession(serial=device.serial, bin_path=bin_path))
+
+    def submit(self, serial: str, flow: Flow) -> Future:
+        """Run a flow on the device with the given serial in the background."""
+        session = self.sessions[serial]
+        return self._executor.submit(self._run_session, session, flow)
+
+    def run(self, flow: Flow) -> Dict[str, bool]:
+        """Run a flow on all devices concurrently and wait for the results."""
+        futures = {serial: self.submit(serial, flow) for serial in self.sessions}
+        return {serial: future.result() for serial, future in futures.items()}
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool."""
+        self._executor.shutdown(wait=wait)
+
+    def _run_session(self, session: DeviceSession, flow: Flow) -> bool:
+        """Run the flow on a single device and keep its session up to date."""
+        sink_id = None
+        if self.log_dir:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            sink_id = logger.add(
+                self.log_dir.joinpath(f"{session.serial}.log"),
+                filter=lambda record: record["extra"].get("serial") == session.serial,
+            )
+        session.status = SessionStatus.RUNNING
+        session.progress = 0
+        progress_parser = ProgressParser()
+        line = False
+        try:
+            with logger.contextualize(serial=session.serial):
+                logger.info(f"Start flow on device {session.serial}.")
+                for line in flow(session):
+                    if isinstance(line, (str, ProgressEvent)):
+                        self._handle_line(session, line, progress_parser)
+                success = isinstance(line, bool) and line
+                logger.info(f"Flow on device {session.serial} finished: {success}.")
+        except Exception as e:
+            logger.error(f"Flow on device {session.serial} crashed: {e}")
+            success = False
+        finally:
+            if sink_id is not None:
+                logger.remove(sink_id)
+        session.status = SessionStatus.SUCCEEDED if success else SessionStatus.FAILED
+        self._emit(FleetEvent(session.serial, "finished", success))
+        return success
+
+    def _handle_line(
+        self,
+        session: DeviceSession,
+        line: Union[str, ProgressEvent],
+        progress_parser: ProgressParser,
+    ):
+        """Store an output line and derive the progress from it and from the progress events of flashes."""
+        if isinstance(line, ProgressEvent):
+            self._emit(FleetEvent(session.serial, "transfer", line))
+        else:
+            session.lines.append(line)
+            self._emit(FleetEvent(session.serial, "line", line))
+        progress = progress_parser.feed(line)
+        if progress is not None:
+            session.progress = progress
+            self._emit(FleetEvent(session.serial, "progress", progress))
+
+    def _emit(self, event: FleetEvent):
+        if self.on_event:
+            with self._lock:
+                self.on_event(event)
@@ -0,0 +1,340 @@
+"""This module contains the compiler turning the steps of a config into an executable flow graph."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+from dataclasses import dataclass, field, replace
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from installer_config import InstallerConfig, Step
+from tooling import (
+    TerminalResponse,
+    adb_reboot,
+    adb_twrp_finish_install_addons,
+    adb_twrp_install_addon,
+    get_command_functions,
+)
+
+# types of steps running their command; the other steps only instruct the user
+COMMAND_STEP_TYPES = ("call_button", "call_button_with_input")
+
+# step to boot an already flashed recovery instead of flashing it
+BOOT_FLASHED_RECOVERY_STEP = Step(
+    title="Boot custom recovery",
+    type="call_button",
+    content="If you already flashed TWRP, boot into it by pressing 'Confirm and run'. Otherwise restart the process. Once your phone screen looks like the picture on the left, continue.",
+    command="adb_reboot_recovery",
+    img="twrp-start.png",
+)
+INSTALL_OS_STEP = Step(
+    title="Install OS",
+    type="call_button",
+    content="Wipe the device and install the OS image with TWRP.",
+    command="adb_twrp_wipe_and_install",
+)
+INSTALL_ADDON_STEP_TYPE = "call_button"
+
+# images the commands can't run without; additional images listed in the config are optional,
+# the flash commands skip the ones which weren't selected
+REQUIRED_IMAGES = {
+    "adb_sideload": ("image",),
+    "adb_twrp_wipe_and_install": ("image",),
+    "fastboot_boot_recovery": ("recovery",),
+    "fastboot_flash_boot": ("recovery",),
+    "fastboot_flash_recovery": ("recovery",),
+    "heimdall_flash_recovery": ("recovery",),
+}
+
+
+class FlowError(Exception):
+    """Raised if the steps of a config can't be compiled into a flow."""
+
+
+@dataclass(frozen=True)
+class FlowOptions:
+    """The choices of the user a flow is compiled with.
+
+    Attributes:
+        bin_path: Path to the directory with the tools.
+        config_path: Path to the directory with the configs.
+        unlock_bootloader: Run the steps to unlock the bootloader.
+        flash_recovery: Run the steps to flash the recovery; otherwise only boot into it.
+        install_os: Install the OS image with TWRP after the steps.
+        install_addons: Install the addons after the OS image.
+        addon_paths: Paths to the addons to install.
+        image: Path to the OS image.
+        recovery: Path to the recovery image.
+        dtbo: Path to the dtbo image.
+        vbmeta: Path to the vbmeta image.
+        super_empty: Path to the super_empty image.
+        vendor_boot: Path to the vendor_boot image.
+        unlock_code: Code to unlock the bootloader; steps asking for it can also get it when run.
+        serial: Serial of the device; by default the only USB device.
+        cancel_event: Set to stop the commands waiting for the device, like the event of a `TaskRunner`.
+    """
+
+    bin_path: Path
+    config_path: Path
+    unlock_bootloader: bool = True
+    flash_recovery: bool = True
+    install_os: bool = False
+    install_addons: bool = False
+    addon_paths: Tuple[str, ...] = ()
+    image: Optional[str] = None
+    recovery: Optional[str] = None
+    dtbo: Optional[str] = None
+    vbmeta: Optional[str] = None
+    super_empty: Optional[str] = None
+    vendor_boot: Optional[str] = None
+    unlock_code: Optional[str] = None
+    serial: Optional[str] = None
+    cancel_event: Optional[threading.Event] = field(default=None, compare=False)
+
+
+@dataclass(frozen=True, slots=True)
+class CommandNode:
+    """A step of a flow with the function running its command, with all arguments bound.
+
+    Attributes:
+        index: Position of the node in the flow.
+        step: The step of the config.
+        function: Function running the command; None for steps which only instruct the user.
+    """
+
+    index: int
+    step: Step
+    function: Optional[Callable[..., TerminalResponse]] = None
+
+    @property
+    def command(self) -> Optional[str]:
+        return self.step.command
+
+    @property
+    def requires_input(self) -> bool:
+        """True if the user needs to enter the unlock code to run the command."""
+        return self.function is not None and self.step.type == "call_button_with_input"
+
+    def run(self, user_input: Optional[str] = None) -> TerminalResponse:
+        """Run the command of the node. Nodes without command succeed right away."""
+        if self.function is None:
+            yield True
+        elif self.requires_input and user_input is not None:
+            yield from self.function(unlock_code=user_input)
+        else:
+            yield from self.function()
+
+
+NodeCallback = Callable[[CommandNode], None]
+
+
+@dataclass(frozen=True)
+class FlowGraph:
+    """Immutable flow of command nodes, run one after another until one fails.
+
+    Attributes:
+        nodes: The nodes of the flow in the order they run.
+        options: The options the flow was compiled with.
+    """
+
+    nodes: Tuple[CommandNode, ...]
+    options: FlowOptions
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def requires_input(self) -> bool:
+        return any(node.requires_input for node in self.nodes)
+
+    def run(
+        self,
+        start: int = 0,
+        on_node_start: Optional[NodeCallback] = None,
+        on_node_done: Optional[Callable[[CommandNode, bool], None]] = None,
+    ) -> TerminalResponse:
+        """Run the nodes from `start` on and yield their output, then the success of the flow.
+
+        Args:
+            start: Index of the first node to run, e.g. to resume a flow.
+            on_node_start: Called before a node runs.
+            on_node_done: Called with the success of a node once it finished.
+        """
+        for node in self.nodes[start:]:
+            if on_node_start:
+                on_node_start(node)
+            success = False
+            for line in node.run():
+                if isinstance(line, bool):
+                    success = line
+                else:
+                    yield line
+            if on_node_done:
+                on_node_done(node, success)
+            if not success:
+                yield False
+                return
+        yield True
+
+
+def plan_steps(
+    config: InstallerConfig, unlock_bootloader: bool = True, flash_recovery: bool = True
+) -> Tuple[Step, ...]:
+    """Get the steps of the config to run for the choices of the user."""
+    if not flash_recovery:
+        # if the recovery is already flashed, skip flashing it again
+        return (BOOT_FLASHED_RECOVERY_STEP,)
+    if unlock_bootloader:
+        return config.unlock_bootloader + config.boot_recovery
+    return config.boot_recovery
+
+
+def compile_flow(
+    config: InstallerConfig,
+    options: FlowOptions,
+    steps: Optional[Tuple[Step, ...]] = None,
+) -> FlowGraph:
+    """Compile the steps of the config into a flow graph and validate it.
+
+    Args:
+        config: Config of the device.
+        options: Choices of the user and the selected images.
+        steps: Steps to compile; planned from the config and the options by default.
+
+    Returns:
+        The flow graph.
+
+    Raises:
+        FlowError: If a command is unknown or an image needed by a command is missing.
+    """
+    if steps is None:
+        steps = plan_steps(config, options.unlock_bootloader, options.flash_recovery)
+    steps += (INSTALL_OS_STEP,) if options.install_os else ()
+    functions = get_command_functions(
+        bin_path=options.bin_path,
+        config_path=options.config_path,
+        is_ab=config.is_ab,
+        image=options.image,
+        recovery=options.recovery,
+        dtbo=options.dtbo,
+        vbmeta=options.vbmeta,
+        super_empty=options.super_empty,
+        vendor_boot=options.vendor_boot,
+        unlock_code=options.unlock_code,
+        serial=options.serial,
+        cancel_event=options.cancel_event,
+    )
+    if options.install_os and options.install_addons:
+        functions["adb_twrp_wipe_and_install"] = partial(
+            functions["adb_twrp_wipe_and_install"], install_addons=True
+        )
+    nodes: List[CommandNode] = []
+    errors = []
+    for step in steps:
+        function = None
+        if step.type in COMMAND_STEP_TYPES and step.command:
+            function = functions.get(step.command)
+            if function is None:
+                errors.append(f"Unknown command '{step.command}' in '{step.title}'.")
+            errors += _missing_images(step.command, options)
+        nodes.append(CommandNode(index=len(nodes), step=step, function=function))
+    if options.install_os and options.install_addons:
+        nodes += _addon_nodes(config, options, start=len(nodes))
+    if errors:
+        raise FlowError(" ".join(errors))
+    return FlowGraph(nodes=tuple(nodes), options=options)
+
+
+def _missing_images(command: str, options: FlowOptions) -> List[str]:
+    return [
+        f"The command '{command}' needs the {name} image."
+        for name in REQUIRED_IMAGES.get(command, ())
+        if not getattr(options, name)
+    ]
+
+
+def _addon_nodes(
+    config: InstallerConfig, options: FlowOptions, start: int
+) -> List[CommandNode]:
+    """Get the nodes installing the addons and rebooting afterwards.
+
+    Without addons to install, the device is only rebooted into the OS.
+    """
+    if not options.addon_paths:
+        return [
+            CommandNode(
+                index=start,
+                step=Step(
+                    title="Install addons",
+                    type=INSTALL_ADDON_STEP_TYPE,
+                    content="No addons selected. Reboot into the OS.",
+                    command="adb_reboot",
+                ),
+                function=partial(
+                    adb_reboot, bin_path=options.bin_path, serial=options.serial
+                ),
+            )
+        ]
+    bound: Dict[str, Any] = dict(
+        bin_path=options.bin_path,
+        is_ab=config.is_ab,
+        serial=options.serial,
+        cancel_event=options.cancel_event,
+    )
+    nodes = [
+        CommandNode(
+            index=start + num,
+            step=Step(
+                title="Install addons",
+                type=INSTALL_ADDON_STEP_TYPE,
+                content=f"Install the addon {Path(addon_path).name}.",
+                command="adb_twrp_install_addon",
+            ),
+            function=partial(adb_twrp_install_addon, addon_path=addon_path, **bound),
+        )
+        for num, addon_path in enumerate(options.addon_paths)
+    ]
+    nodes.append(
+        CommandNode(
+            index=start + len(nodes),
+            step=Step(
+                title="Install addons",
+                type=INSTALL_ADDON_STEP_TYPE,
+                content="Finish the installation of the addons and reboot.",
+                command="adb_twrp_finish_install_addons",
+            ),
+            function=partial(adb_twrp_finish_install_addons, **bound),
+        )
+    )
+    return nodes
+
+
+def session_flow(
+    options: FlowOptions,
+) -> Callable[[Any], TerminalResponse]:
+    """Get a flow for the `FleetEngine`, compiling the config of every device session.
+
+    The images and addons of a session replace the ones of the options.
+    """
+
+    def flow(session) -> TerminalResponse:
+        session_options = replace(
+            options,
+            serial=session.serial,
+            bin_path=session.bin_path,
+            image=session.image_path or options.image,
+            recovery=session.recovery_path or options.recovery,
+            addon_paths=tuple(session.addon_paths) or options.addon_paths,
+        )
+        return compile_flow(session.config, session_options).run()
+
+    return flow
@@ -0,0 +1,155 @@
+"""This module contains the headless install mode, running the steps of a config without the GUI."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import json
+import sys
+from functools import partial
+from time import monotonic
+from typing import Callable, Dict, Optional, TextIO
+
+from flow import CommandNode, FlowGraph
+from journal import InstallJournal
+from loguru import logger
+from progress import ProgressEvent, ProgressParser
+from tooling import TerminalResponse
+
+
+class JsonLinesReporter:
+    """Write the events of a headless install as JSON lines.
+
+    Every event has a name and the seconds elapsed since the reporter was created.
+    """
+
+    def __init__(
+        self, stream: TextIO = sys.stdout, clock: Callable[[], float] = monotonic
+    ):
+        self.stream = stream
+        self._clock = clock
+        self._start = clock()
+
+    def elapsed(self) -> float:
+        return round(self._clock() - self._start, 3)
+
+    def emit(self, event: str, **fields):
+        """Write the event with its fields and flush, so readers see it right away."""
+        self.stream.write(
+            json.dumps({"event": event, "elapsed": self.elapsed(), **fields}) + "\n"
+        )
+        self.stream.flush()
+
+
+def run_flow(
+    flow: Callable[[], TerminalResponse],
+    reporter: JsonLinesReporter,
+    parser: Optional[ProgressParser] = None,
+) -> bool:
+    """Run a flow of the tooling module and report its output lines and progress."""
+    parser = parser or ProgressParser()
+    success = False
+    for line in flow():
+        if isinstance(line, bool):
+            success = line
+            continue
+        if isinstance(line, ProgressEvent):
+            reporter.emit(
+                "transfer",
+                label=line.label,
+                bytes_done=line.bytes_done,
+                bytes_total=line.bytes_total,
+                bytes_per_second=line.bytes_per_second,
+                eta=line.eta,
+            )
+        elif line:
+            reporter.emit("line", text=line)
+        percentage = parser.feed(line)
+        if percentage is not None:
+            reporter.emit("progress", percentage=percentage)
+    return success
+
+
+def run_headless_install(
+    flow: FlowGraph,
+    reporter: JsonLinesReporter,
+    device_code: Optional[str] = None,
+    start: int = 0,
+    journal: Optional[InstallJournal] = None,
+) -> bool:
+    """Run a compiled flow unattended and report every step.
+
+    Steps without a command, like pressing buttons on the device, can't be done without a user.
+    They are reported as `instruction` events and skipped; the commands wait for the device to
+    reach the state they need.
+
+    Args:
+        flow: The flow to run, usually compiled with `install_os=True`.
+        reporter: Reporter to write the events to.
+        device_code: Device code to report.
+        start: Index of the first node to run, to resume an interrupted installation.
+        journal: Journal to record the completed nodes in.
+
+    Returns:
+        True if all steps succeeded.
+    """
+    parser = ProgressParser()
+    started: Dict[int, float] = {}
+
+    def describe(node: CommandNode) -> dict:
+        return dict(index=node.index, title=node.step.title, type=node.step.type)
+
+    def on_node_start(node: CommandNode):
+        if node.function is None:
+            reporter.emit(
+                "instruction", content=node.step.content.strip(), **describe(node)
+            )
+            return
+        # every step starts with its own progress
+        parser.reset()
+        started[node.index] = reporter.elapsed()
+        reporter.emit("step", command=node.command, **describe(node))
+
+    def on_node_done(node: CommandNode, success: bool):
+        if journal and success:
+            journal.record_step(node)
+        if node.function is None:
+            return
+        reporter.emit(
+            "step_finished",
+            success=success,
+            seconds=round(reporter.elapsed() - started[node.index], 3),
+            **describe(node),
+        )
+        if not success:
+            logger.error(f"Step '{node.command}' failed. Stopping.")
+
+    reporter.emit(
+        "start",
+        device_code=device_code,
+        serial=flow.options.serial,
+        steps=len(flow),
+        first_step=start,
+    )
+    success = run_flow(
+        partial(
+            flow.run,
+            start=start,
+            on_node_start=on_node_start,
+            on_node_done=on_node_done,
+        ),
+        reporter,
+        parser,
+    )
+    if journal:
+        if success:
+            journal.finish()
+        journal.close()
+    reporter.emit("finished", success=success)
+    return success
@@ -10,47 +10,58 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import hashlib
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Set, Tuple
 
+import regex as re
 import schema
 import yaml
 from loguru import logger
 from schema import Regex, Schema, SchemaError
 from typing_extensions import Self
+from utils import get_cache_dir
 
+# use the much faster loader of libyaml, if pyyaml was built with it
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
+
+@dataclass(frozen=True, slots=True)
 class Step:
-    """Class representing on step in the installer."""
+    """Class representing on step in the installer.
+
+    Steps are immutable, so the step plans of the app state can share them with the config.
+    """
 
-    default_images = {
+    default_images: ClassVar[Dict[str, str]] = {
         "Unlock the bootloader": "unlock-bootloader-default.png",
     }
 
-    def __init__(
-        self,
-        title: str,
-        type: str,
-        content: str,
-        allow_skip: bool = False,
-        command: Optional[str] = None,
-        img: Optional[str] = None,
-        link: Optional[str] = None,
-    ):
-        self.title = title
-        self.type = type
-        self.content = content
-        self.command = command
-        self.img = img if img else self.default_images.get(title, "placeholder.png")
-        self.allow_skip = allow_skip
-        self.link = link
+    title: str
+    type: str
+    content: str
+    allow_skip: bool = False
+    command: Optional[str] = None
+    img: Optional[str] = None
+    link: Optional[str] = None
+
+    def __post_init__(self):
+        if not self.img:
+            object.__setattr__(
+                self, "img", self.default_images.get(self.title, "placeholder.png")
+            )
 
 
 class InstallerConfig:
     def __init__(
         self,
-        unlock_bootloader: List[Step],
-        boot_recovery: List[Step],
+        unlock_bootloader: Tuple[Step, ...],
+        boot_recovery: Tuple[Step, ...],
         metadata: dict,
         requirements: dict,
     ):
@@ -69,7 +80,7 @@ class InstallerConfig:
     def from_file(cls, path) -> Self:
         with open(path, "r", encoding="utf-8") as stream:
             try:
-                raw_config = yaml.safe_load(stream)
+                raw_config = yaml.load(stream, Loader=SafeLoader)
                 if validate_config(raw_config):
                     config = dict(raw_config)
                     raw_steps = config["steps"]
@@ -81,38 +92,364 @@ class InstallerConfig:
             except yaml.YAMLError as exc:
                 logger.error(f"Loading the config from {path} failed with {exc}")
                 return None
+        return cls.from_dict(metadata, raw_steps, requirements)
 
+    @classmethod
+    def from_dict(
+        cls, metadata: dict, raw_steps: dict, requirements: Optional[dict] = None
+    ) -> Self:
+        """Create the config from the sections of an already validated config."""
         if raw_steps.get("unlock_bootloader") is not None:
-            unlock_bootloader = [
+            unlock_bootloader = tuple(
                 Step(**raw_step, title="Unlock the bootloader")
                 for raw_step in raw_steps.get("unlock_bootloader")
-            ]
+            )
         else:
-            unlock_bootloader = []
-        boot_recovery = [
+            unlock_bootloader = ()
+        boot_recovery = tuple(
             Step(**raw_step, title="Boot custom recovery")
             for raw_step in raw_steps.get("boot_recovery", [])
-        ]
+        )
         return cls(unlock_bootloader, boot_recovery, metadata, requirements)
 
 
-def _find_config_file(device_code: str, config_path: Path) -> Optional[Path]:
-    """Find the config file which is supported by the given device code."""
-    for path in config_path.glob("*.yaml"):
+class ConfigRegistry:
+    """Index of the device codes supported by the config files in a directory.
+
+    The index maps every supported device code to the config file listing it, so a lookup
+    doesn't need to parse any YAML. It is persisted together with the size and modification
+    time of every config file and only new or changed files are parsed again when it is rebuilt.
+
+    Adding or removing a file changes the modification time of the directory, editing one in
+    place doesn't. So the file found by a lookup is checked against its indexed size and
+    modification time, and the index is rebuilt if it changed. Device codes without a config
+    are remembered until the directory changes, so repeated misses don't rescan it.
+
+    The registry is shared between threads.
+    """
+
+    index_version = 1
+
+    def __init__(self, config_path: Path, index_path: Optional[Path] = None):
+        self.config_path = config_path
+        if index_path is None:
+            path_hash = hashlib.sha1(
+                str(config_path.resolve()).encode("utf-8")
+            ).hexdigest()[:16]
+            index_path = get_cache_dir().joinpath(f"config-index-{path_hash}.json")
+        self.index_path = index_path
+        # file name -> {"mtime_ns": ..., "size": ..., "device_codes": [...]}
+        self._files: Dict[str, dict] = {}
+        # device code -> config file
+        self._index: Dict[str, Path] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        # device codes without a config since the index was last rebuilt
+        self._misses: Set[str] = set()
+        self._lock = threading.RLock()
+
+    def lookup(self, device_code: str) -> Optional[Path]:
+        """Get the config file supporting the given device code."""
+        with self._lock:
+            rebuilt = self._ensure_index()
+            if device_code in self._misses:
+                return None
+            path = self._index.get(device_code)
+            if not rebuilt and (path is None or not self._is_current(path)):
+                # a config was edited in place or the device code was added to one
+                self.rebuild()
+                path = self._index.get(device_code)
+            if path is None:
+                self._misses.add(device_code)
+            return path
+
+    def device_codes(self) -> List[str]:
+        """Get all device codes supported by the configs in the directory."""
+        with self._lock:
+            self._ensure_index()
+            return list(self._index.keys())
+
+    def rebuild(self):
+        """Update the index from the config files; only changed files are parsed."""
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._misses = set()
+        if not self._files:
+            self._files = self._read_index()
+        try:
+            self._dir_mtime_ns = self.config_path.stat().st_mtime_ns
+            paths = sorted(self.config_path.glob("*.yaml"))
+        except OSError:
+            self._dir_mtime_ns = None
+            paths = []
+
+        files = {}
+        changed = False
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entry = self._files.get(path.name)
+            if (
+                entry is None
+                or entry["mtime_ns"] != stat.st_mtime_ns
+                or entry["size"] != stat.st_size
+            ):
+                entry = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "device_codes": _read_supported_device_codes(path),
+                }
+                changed = True
+            files[path.name] = entry
+        changed = changed or files.keys() != self._files.keys()
+        self._files = files
+
+        self._index = {}
+        for name, entry in files.items():
+            for device_code in entry["device_codes"]:
+                self._index.setdefault(device_code, self.config_path.joinpath(name))
+        if changed:
+            self._write_index()
+
+    def _ensure_index(self) -> bool:
+        """Build the index on first use or if files were added or removed.
+
+        Returns:
+            True if the index was rebuilt, False if it was up to date.
+        """
+        try:
+            dir_mtime_ns = self.config_path.stat().st_mtime_ns
+        except OSError:
+            dir_mtime_ns = None
+        if self._dir_mtime_ns is None or dir_mtime_ns != self._dir_mtime_ns:
+            self.rebuild()
+            return True
+        return False
+
+    def _is_current(self, path: Path) -> bool:
+        """Check if the config file is unchanged since it was indexed."""
+        entry = self._files.get(path.name)
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        return (
+            entry is not None
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        )
+
+    def _read_index(self) -> Dict[str, dict]:
+        """Read the persisted index if it exists and matches the config directory."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as stream:
+                raw_index = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+        if raw_index.get("version") != self.index_version or raw_index.get(
+            "config_path"
+        ) != str(self.config_path.resolve()):
+            return {}
+        return raw_index.get("files", {})
+
+    def _write_index(self):
+        """Persist the index; failing to do so only costs a rebuild on the next start."""
+        raw_index = {
+            "version": self.index_version,
+            "config_path": str(self.config_path.resolve()),
+            "files": self._files,
+        }
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as stream:
+                json.dump(raw_index, stream)
+            tmp_path.replace(self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist the config index: {e}")
+
+
+def _read_supported_device_codes(path: Path) -> List[str]:
+    """Read the supported device codes from a config file."""
+    try:
         with open(path, "r", encoding="utf-8") as stream:
+            raw_config = dict(yaml.load(stream, Loader=SafeLoader))
+        device_codes = raw_config.get("metadata", dict()).get(
+            "supported_device_codes", []
+        )
+        return [str(device_code) for device_code in device_codes]
+    except Exception:
+        # this is a very broad exception, but we want to catch all errors here and handle them downstream
+        return []
+
+
+_registries: Dict[Path, ConfigRegistry] = {}
+
+
+def get_config_registry(config_path: Path) -> ConfigRegistry:
+    """Get the shared config registry for the given directory."""
+    registry = _registries.get(config_path)
+    if registry is None:
+        registry = _registries[config_path] = ConfigRegistry(config_path)
+    return registry
+
+
+BUNDLE_SUFFIX = ".sqlite"
+BUNDLE_VERSION = 1
+# memory map the bundle instead of reading it into buffers
+BUNDLE_MMAP_SIZE = 64 * 1024 * 1024
+
+
+def compile_config_bundle(
+    config_path: Path, bundle_path: Path
+) -> Dict[Path, List["ConfigError"]]:
+    """Validate all configs in the directory and compile them into a single bundle.
+
+    The bundle is a SQLite database with the validated configs as JSON and an index of the
+    supported device codes. It is only written if all configs are valid.
+
+    Returns:
+        The errors of the invalid configs by path; empty if the bundle was written.
+    """
+    paths = sorted(config_path.glob("*.yaml"))
+    errors = {
+        path: file_errors
+        for path, file_errors in validate_config_files(paths).items()
+        if file_errors
+    }
+    if errors:
+        return errors
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = bundle_path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        with connection:
+            connection.executescript(
+                """
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE configs (name TEXT PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE device_codes (
+                    device_code TEXT PRIMARY KEY,
+                    name TEXT NOT NULL REFERENCES configs (name)
+                ) WITHOUT ROWID;
+                """
+            )
+            connection.execute(
+                "INSERT INTO meta VALUES ('version', ?)", (str(BUNDLE_VERSION),)
+            )
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as stream:
+                    raw_config = yaml.load(stream, Loader=SafeLoader)
+                connection.execute(
+                    "INSERT INTO configs VALUES (?, ?)",
+                    (path.name, json.dumps(raw_config, separators=(",", ":"))),
+                )
+                # like the registry, the first config supporting a device code wins
+                connection.executemany(
+                    "INSERT OR IGNORE INTO device_codes VALUES (?, ?)",
+                    [
+                        (str(device_code), path.name)
+                        for device_code in raw_config["metadata"][
+                            "supported_device_codes"
+                        ]
+                    ],
+                )
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    tmp_path.replace(bundle_path)
+    logger.info(f"Compiled {len(paths)} configs into {bundle_path}.")
+    return {}
+
+
+class ConfigBundle:
+    """Read-only access to the configs compiled by `compile_config_bundle`.
+
+    The database is opened on first use and memory mapped, so a lookup only reads the pages
+    of the index and of the requested config.
+    """
+
+    def __init__(self, bundle_path: Path):
+        self.bundle_path = bundle_path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            uri = f"{self.bundle_path.resolve().as_uri()}?mode=ro&immutable=1"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            connection.execute(f"PRAGMA mmap_size = {BUNDLE_MMAP_SIZE}")
+            (version,) = connection.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            if int(version) != BUNDLE_VERSION:
+                connection.close()
+                raise sqlite3.DatabaseError(
+                    f"Unsupported config bundle version {version}."
+                )
+            self._connection = connection
+        return self._connection
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
             try:
-                raw_config = dict(yaml.safe_load(stream))
-                if device_code in raw_config.get("metadata", dict()).get(
-                    "supported_device_codes", []
-                ):
-                    logger.info(
-                        f"Device code '{device_code}' is supported by config '{path}'."
-                    )
-                    return path
-            except Exception:
-                # this is a very broad exception, but we want to catch all errors here and handle them downstream
-                pass
-    return None
+                return self._connect().execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                logger.error(
+                    f"Reading the config bundle {self.bundle_path} failed: {e}"
+                )
+                return []
+
+    def device_codes(self) -> List[str]:
+        """Get all device codes supported by the configs in the bundle."""
+        return [row[0] for row in self._query("SELECT device_code FROM device_codes")]
+
+    def load(self, device_code: str) -> Optional[InstallerConfig]:
+        """Load the config supporting the device code."""
+        rows = self._query(
+            """
+            SELECT configs.data FROM device_codes
+            JOIN configs ON configs.name = device_codes.name
+            WHERE device_codes.device_code = ?
+            """,
+            (device_code,),
+        )
+        if not rows:
+            return None
+        raw_config = json.loads(rows[0][0])
+        # the configs were validated when the bundle was compiled
+        return InstallerConfig.from_dict(
+            raw_config["metadata"], raw_config["steps"], raw_config.get("requirements")
+        )
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_bundles: Dict[Path, ConfigBundle] = {}
+
+
+def get_config_bundle(bundle_path: Path) -> ConfigBundle:
+    """Get the shared config bundle at the given path."""
+    bundle = _bundles.get(bundle_path)
+    if bundle is None:
+        bundle = _bundles[bundle_path] = ConfigBundle(bundle_path)
+    return bundle
+
+
+def _find_config_file(device_code: str, config_path: Path) -> Optional[Path]:
+    """Find the config file which is supported by the given device code."""
+    path = get_config_registry(config_path).lookup(device_code)
+    if path:
+        logger.info(f"Device code '{device_code}' is supported by config '{path}'.")
+    return path
 
 
 def _load_config(device_code: str, config_path: Path) -> Optional[InstallerConfig]:
@@ -120,6 +457,8 @@ def _load_config(device_code: str, config_path: Path) -> Optional[InstallerConfi
     Function to load a function from given path and directory path.
 
     Try to load local file in the same directory as the executable first, then load from assets.
+    If there is a compiled config bundle next to the config directory, like in the frozen builds,
+    the assets are loaded from the bundle instead of the YAML files.
     """
     custom_path = _find_config_file(device_code, config_path=Path.cwd())
     if custom_path:
@@ -127,6 +466,15 @@ def _load_config(device_code: str, config_path: Path) -> Optional[InstallerConfi
         logger.info(f"Loaded custom device config from {custom_path}.")
         logger.info(f"Config metadata: {config.metadata}.")
         return config
+    bundle_path = config_path.with_suffix(BUNDLE_SUFFIX)
+    if bundle_path.is_file():
+        config = get_config_bundle(bundle_path).load(device_code)
+        if config:
+            logger.info(f"Loaded device config for '{device_code}' from {bundle_path}.")
+            logger.info(f"Config metadata: {config.metadata}.")
+        else:
+            logger.info(f"No device config found for device code '{device_code}'.")
+        return config
     else:
         # if no localfile, then try to load a config file from assets
         path = _find_config_file(device_code, config_path)
@@ -142,9 +490,9 @@ def _load_config(device_code: str, config_path: Path) -> Optional[InstallerConfi
             return None
 
 
-def validate_config(config: str) -> bool:
-    """Validate the schema of the config."""
-
+@lru_cache(maxsize=None)
+def get_config_schema() -> Schema:
+    """Get the schema of the configs. It is only built on first use."""
     step_schema = {
         "type": Regex(
             r"text|confirm_button|call_button|call_button_with_input|link_button_with_confirm"
@@ -159,7 +507,7 @@ def validate_config(config: str) -> bool:
         schema.Optional("link"): str,
     }
 
-    config_schema = Schema(
+    return Schema(
         {
             "metadata": {
                 "maintainer": str,
@@ -185,10 +533,138 @@ def validate_config(config: str) -> bool:
             },
         }
     )
+
+
+def validate_config(config: str) -> bool:
+    """Validate the schema of the config."""
     try:
-        config_schema.validate(config)
+        get_config_schema().validate(config)
         logger.success("Config is valid.")
         return True
     except SchemaError as se:
         logger.error(f"Config is invalid. Error {se}")
         return False
+
+
+@dataclass(frozen=True)
+class ConfigError:
+    """An error in a config file.
+
+    Attributes:
+        path: Path of the config file.
+        line: Line of the error in the file, starting at 1.
+        location: Keys and indices leading to the invalid value, like `steps.boot_recovery[2].command`.
+        message: Description of the error.
+    """
+
+    path: Path
+    line: Optional[int]
+    location: str
+    message: str
+
+    def __str__(self) -> str:
+        position = f"{self.path}:{self.line}" if self.line else f"{self.path}"
+        location = f" {self.location}:" if self.location else ""
+        return f"{position}:{location} {self.message}"
+
+
+# parts of the error messages of schema pointing to the invalid value
+KEY_ERROR_PATTERN = re.compile(r"^Key '(.+)' error:$")
+WRONG_KEY_PATTERN = re.compile(r"^Wrong key '(.+?)' in ")
+
+
+def _load_yaml_nodes(stream) -> Tuple[Any, Optional[yaml.Node]]:
+    """Load a YAML document together with its nodes, which know their position in the file."""
+    loader = SafeLoader(stream)
+    try:
+        node = loader.get_single_node()
+        data = loader.construct_document(node) if node is not None else None
+    finally:
+        loader.dispose()
+    return data, node
+
+
+def _child_node(node: Optional[yaml.Node], key: Any, key_node: bool = False):
+    """Get the node of the value of a key in a mapping node, or of the key itself."""
+    if isinstance(node, yaml.MappingNode):
+        for child_key, child_value in node.value:
+            if child_key.value == str(key):
+                return child_key if key_node else child_value
+    return None
+
+
+def _locate_error(
+    data: Any, node: Optional[yaml.Node], error: SchemaError
+) -> Tuple[Optional[yaml.Node], str, str]:
+    """Follow the messages of a schema error to the node of the invalid value.
+
+    Returns:
+        The node of the invalid value, its location and the message describing the error.
+    """
+    location = ""
+    messages = [message for message in error.autos if message]
+    for message in messages:
+        key_error = KEY_ERROR_PATTERN.match(message)
+        wrong_key = WRONG_KEY_PATTERN.match(message)
+        if key_error and isinstance(data, dict) and key_error.group(1) in data:
+            key = key_error.group(1)
+            data = data[key]
+            node = _child_node(node, key) or node
+            location += f".{key}" if location else key
+        elif wrong_key:
+            node = _child_node(node, wrong_key.group(1), key_node=True) or node
+            location += f".{wrong_key.group(1)}" if location else wrong_key.group(1)
+            break
+        elif isinstance(data, list) and "did not validate" in message:
+            # schema names the invalid element of a list by its value
+            for index, element in enumerate(data):
+                if message.endswith(f"did not validate {element!r}"):
+                    data = element
+                    if isinstance(node, yaml.SequenceNode):
+                        node = node.value[index]
+                    location += f"[{index}]"
+                    break
+    return node, location, messages[-1] if messages else str(error)
+
+
+def validate_config_file(path: Path) -> List[ConfigError]:
+    """Validate a config file and return its errors with their lines in the file."""
+    try:
+        with open(path, "r", encoding="utf-8") as stream:
+            data, node = _load_yaml_nodes(stream)
+    except yaml.MarkedYAMLError as e:
+        mark = e.problem_mark or e.context_mark
+        return [
+            ConfigError(
+                path=path,
+                line=mark.line + 1 if mark else None,
+                location="",
+                message=f"Invalid YAML: {e.problem or e}",
+            )
+        ]
+    except (OSError, yaml.YAMLError) as e:
+        return [ConfigError(path=path, line=None, location="", message=str(e))]
+    try:
+        get_config_schema().validate(data)
+        return []
+    except SchemaError as se:
+        error_node, location, message = _locate_error(data, node, se)
+        return [
+            ConfigError(
+                path=path,
+                line=error_node.start_mark.line + 1 if error_node else None,
+                location=location,
+                message=message,
+            )
+        ]
+
+
+def validate_config_files(paths: Iterable[Path]) -> Dict[Path, List[ConfigError]]:
+    """Validate many config files at once, like all configs in CI.
+
+    The schema is only built once for all files and nothing is logged per file.
+
+    Returns:
+        The errors of every file by path; valid files have no errors.
+    """
+    return {Path(path): validate_config_file(Path(path)) for path in paths}
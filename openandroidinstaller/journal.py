@@ -0,0 +1,328 @@
+"""This module contains the journal of the completed steps, allowing to resume interrupted installations."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import regex as re
+from checksum import sha256_file
+from flow import CommandNode, FlowGraph
+from installer_config import InstallerConfig
+from loguru import logger
+from tooling import list_devices
+from utils import CheckResult, CompatibilityStatus, get_cache_dir
+
+JOURNAL_DIR = "journals"
+JOURNAL_SUFFIX = ".jsonl"
+# choices of the user which need to be the same to resume a flow
+RESUME_CHOICES = ("unlock_bootloader", "flash_recovery", "install_addons")
+# images selected by the user, named like the options of the flow
+ARTIFACTS = ("image", "recovery", "dtbo", "vbmeta", "super_empty", "vendor_boot")
+
+UNSAFE_CHARACTERS = re.compile(r"[^\w.\-]")
+
+
+def journal_path(serial: str, journal_dir: Optional[Path] = None) -> Path:
+    """Get the path of the journal of the device with the given serial."""
+    journal_dir = journal_dir or get_cache_dir().joinpath(JOURNAL_DIR)
+    return journal_dir.joinpath(UNSAFE_CHARACTERS.sub("_", serial) + JOURNAL_SUFFIX)
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """The state of an installation read from its journal.
+
+    Attributes:
+        path: Path to the journal.
+        serial: Serial of the device.
+        device_code: Device code of the config.
+        device_codes: Device codes supported by the config.
+        choices: Choices of the user, like unlocking the bootloader.
+        artifacts: Paths to the selected images by name.
+        digests: SHA-256 digests of the selected images by name. Empty if the application stopped
+            before the images were hashed.
+        addon_paths: Paths to the addons to install.
+        commands: Commands of the nodes of the flow, None for the steps without command.
+        completed: Indices of the completed nodes.
+        skipped: Indices of the nodes skipped by the user.
+        installed: Indices of the completed nodes of the flow installing the OS and the addons.
+        finished: True if the installation finished.
+        started: Time the installation started at.
+    """
+
+    path: Path
+    serial: str
+    device_code: str
+    device_codes: Tuple[str, ...]
+    choices: Dict[str, bool]
+    artifacts: Dict[str, str]
+    digests: Dict[str, str]
+    addon_paths: Tuple[str, ...] = ()
+    commands: Tuple[Optional[str], ...] = ()
+    completed: FrozenSet[int] = field(default_factory=frozenset)
+    skipped: FrozenSet[int] = field(default_factory=frozenset)
+    installed: FrozenSet[int] = field(default_factory=frozenset)
+    finished: bool = False
+    started: float = 0
+
+    @property
+    def next_index(self) -> int:
+        """Index of the first node which didn't complete and wasn't skipped."""
+        return next(
+            (
+                index
+                for index in range(len(self.commands))
+                if index not in self.completed and index not in self.skipped
+            ),
+            len(self.commands),
+        )
+
+    @property
+    def resumable(self) -> bool:
+        """True if the installation was interrupted after some steps completed."""
+        return not self.finished and bool(
+            self.completed or self.skipped or self.installed
+        )
+
+
+class InstallJournal:
+    """Append-only journal of the completed steps of the installation on a device.
+
+    A session record with the choices and the paths of the images starts the journal, followed by
+    one record per completed or skipped node. The records of the nodes are synced to disk before
+    the methods adding them return, so the journal survives a crash of the application. The
+    images are hashed in the background and their digests follow in a record of their own once
+    they are known, so hashing neither blocks the UI nor delays the records of the nodes.
+    """
+
+    def __init__(self, serial: str, journal_dir: Optional[Path] = None):
+        self.serial = serial
+        self.path = journal_path(serial, journal_dir)
+        # a single worker keeps the records in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._hasher = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="journal-hash"
+        )
+
+    def start(self, config: InstallerConfig, flow: FlowGraph):
+        """Start the journal of a new installation, replacing the previous one."""
+        artifacts = {
+            name: str(getattr(flow.options, name))
+            for name in ARTIFACTS
+            if getattr(flow.options, name)
+        }
+        self._executor.submit(self._write_session, config, flow, artifacts)
+        self._hasher.submit(self._hash_artifacts, artifacts)
+
+    def record_step(self, node: CommandNode, skipped: bool = False):
+        """Record that the node completed or was skipped by the user."""
+        self._record(
+            dict(
+                event="skipped" if skipped else "step",
+                index=node.index,
+                command=node.command,
+                title=node.step.title,
+            )
+        )
+
+    def record_install(self, node: CommandNode):
+        """Record that the node of the flow installing the OS and the addons completed."""
+        self._record(dict(event="install", index=node.index, command=node.command))
+
+    def finish(self):
+        """Record that the installation finished, so it isn't offered to resume anymore."""
+        self._record(dict(event="finished"))
+
+    def close(self):
+        """Wait until the images are hashed and all records are written."""
+        self._hasher.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+
+    def _record(self, record: dict):
+        """Append the record after the pending ones and wait until it is synced to disk."""
+        self._executor.submit(self._append, record).result()
+
+    def _write_session(
+        self, config: InstallerConfig, flow: FlowGraph, artifacts: Dict[str, str]
+    ):
+        options = flow.options
+        record = dict(
+            event="session",
+            time=time(),
+            serial=self.serial,
+            device_code=config.device_code,
+            device_codes=list(config.supported_device_codes or [config.device_code]),
+            choices={name: getattr(options, name) for name in RESUME_CHOICES},
+            artifacts=artifacts,
+            addon_paths=list(options.addon_paths),
+            commands=[node.command for node in flow.nodes],
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._append(record, mode="w")
+
+    def _hash_artifacts(self, artifacts: Dict[str, str]):
+        digests = {}
+        for name, artifact_path in artifacts.items():
+            try:
+                digests[name] = sha256_file(artifact_path)
+            except OSError as e:
+                logger.warning(f"Can't hash {artifact_path} for the journal: {e}")
+        self._executor.submit(self._append, dict(event="digests", digests=digests))
+
+    def _append(self, record: dict, mode: str = "a"):
+        """Write the record and sync it to disk. A failing journal must not stop the installation."""
+        try:
+            with open(self.path, mode, encoding="utf-8") as stream:
+                stream.write(json.dumps(record) + "\n")
+                stream.flush()
+                os.fsync(stream.fileno())
+        except OSError as e:
+            logger.warning(f"Could not write the install journal {self.path}: {e}")
+
+
+def read_journal(path: Path) -> Optional[Checkpoint]:
+    """Read the checkpoint of the last installation from the journal.
+
+    A record cut off by a crash is ignored.
+
+    Returns:
+        The checkpoint or None if the journal doesn't exist or doesn't contain a session.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as stream:
+            lines = stream.readlines()
+    except OSError:
+        return None
+    session = None
+    digests, completed, skipped, installed = {}, set(), set(), set()
+    finished = False
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skip broken record in the install journal {path}.")
+            continue
+        event = record.get("event")
+        if event == "session":
+            session, finished = record, False
+            digests, completed, skipped, installed = {}, set(), set(), set()
+        elif session is None:
+            continue
+        elif event == "digests":
+            digests = record["digests"]
+        elif event == "step":
+            completed.add(record["index"])
+        elif event == "skipped":
+            skipped.add(record["index"])
+        elif event == "install":
+            installed.add(record["index"])
+        elif event == "finished":
+            finished = True
+    if session is None:
+        return None
+    return Checkpoint(
+        path=path,
+        serial=session["serial"],
+        device_code=session["device_code"],
+        device_codes=tuple(session["device_codes"]),
+        choices=session["choices"],
+        artifacts=session["artifacts"],
+        digests=digests,
+        addon_paths=tuple(session["addon_paths"]),
+        commands=tuple(session["commands"]),
+        completed=frozenset(completed),
+        skipped=frozenset(skipped),
+        installed=frozenset(installed),
+        finished=finished,
+        started=session["time"],
+    )
+
+
+def find_interrupted_installs(journal_dir: Optional[Path] = None) -> List[Checkpoint]:
+    """Get the checkpoints of the interrupted installations, the latest first."""
+    journal_dir = journal_dir or get_cache_dir().joinpath(JOURNAL_DIR)
+    checkpoints = [
+        read_journal(path) for path in journal_dir.glob("*" + JOURNAL_SUFFIX)
+    ]
+    return sorted(
+        (
+            checkpoint
+            for checkpoint in checkpoints
+            if checkpoint and checkpoint.resumable
+        ),
+        key=lambda checkpoint: checkpoint.started,
+        reverse=True,
+    )
+
+
+def verify_checkpoint(
+    checkpoint: Checkpoint, flow: FlowGraph, bin_path: Path
+) -> CheckResult:
+    """Check if the flow can resume the installation of the checkpoint.
+
+    The flow needs to consist of the same commands and use the same images, which didn't change
+    since. The device needs to be connected; if it reports its device code, it needs to match.
+
+    Args:
+        checkpoint: Checkpoint of the interrupted installation.
+        flow: Flow compiled to resume the installation.
+        bin_path: Path to the directory with the tools.
+
+    Returns:
+        CheckResult object with the status and a message to display.
+    """
+    if tuple(node.command for node in flow.nodes) != checkpoint.commands:
+        return CheckResult(
+            CompatibilityStatus.INCOMPATIBLE,
+            "The steps of the installation changed since it was interrupted.",
+        )
+    for name in ARTIFACTS:
+        artifact_path = getattr(flow.options, name)
+        if artifact_path and str(artifact_path) != checkpoint.artifacts.get(name):
+            return CheckResult(
+                CompatibilityStatus.INCOMPATIBLE,
+                f"A different {name} image was selected.",
+            )
+    for name, digest in checkpoint.digests.items():
+        try:
+            changed = sha256_file(checkpoint.artifacts[name]) != digest
+        except OSError:
+            changed = True
+        if changed:
+            return CheckResult(
+                CompatibilityStatus.INCOMPATIBLE,
+                f"The {name} image {Path(checkpoint.artifacts[name]).name} was changed or removed.",
+            )
+    devices = {device.serial: device for device in list_devices(bin_path)}
+    device = devices.get(checkpoint.serial)
+    if device is None:
+        return CheckResult(
+            CompatibilityStatus.UNKNOWN,
+            f"Connect the device {checkpoint.serial} to resume the installation.",
+        )
+    if device.device and device.device not in checkpoint.device_codes:
+        return CheckResult(
+            CompatibilityStatus.INCOMPATIBLE,
+            f"The device {checkpoint.serial} reports the device code '{device.device}' instead of '{checkpoint.device_code}'.",
+        )
+    logger.info(
+        f"Resume the installation on {checkpoint.serial} in state '{device.state}' at step {checkpoint.next_index}."
+    )
+    return CheckResult(
+        CompatibilityStatus.COMPATIBLE,
+        f"Resume with step {checkpoint.next_index + 1} of {len(checkpoint.commands)}.",
+    )
@@ -0,0 +1,182 @@
+"""This module contains the client for all network requests of the application."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from loguru import logger
+
+LINEAGE_API_URL = "https://download.lineageos.org/api/v2/devices/{}"
+LINEAGE_BUILDS_URL = "https://download.lineageos.org/devices/{}/builds"
+# Plausible API endpoint for tracking events
+TRACKING_URL = "https://plausible.io/api/event"
+
+
+class NetworkClient:
+    """Send the requests of the application on a background thread, so they never block the UI.
+
+    All requests share one session, which keeps the connections open. Download links are cached
+    per device code for `download_link_ttl` seconds. Tracking events are queued and sent together
+    `tracking_delay` seconds after the first one; if the computer is offline, they are dropped.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5,
+        download_link_ttl: float = 3600,
+        tracking_delay: float = 2,
+        max_pending_events: int = 100,
+        lineage_api_url: str = LINEAGE_API_URL,
+        tracking_url: str = TRACKING_URL,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.timeout = timeout
+        self.download_link_ttl = download_link_ttl
+        self.tracking_delay = tracking_delay
+        self.max_pending_events = max_pending_events
+        self.lineage_api_url = lineage_api_url
+        self.tracking_url = tracking_url
+        self._clock = clock
+        self._session = requests.Session()
+        self._session.headers.update({"User-Agent": "Desktop-App"})
+        # a single worker, so the session is never used concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="network")
+        self._lock = threading.Lock()
+        self._download_links: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._pending_events: List[dict] = []
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def get_download_link(
+        self,
+        devicecode: str,
+        callback: Optional[Callable[[Optional[str]], None]] = None,
+    ) -> "Future[Optional[str]]":
+        """Check if a lineageOS version for this device exists on download.lineageos.com.
+
+        Args:
+            devicecode: Code of the device.
+            callback: Called with the download link or None, right away if the link is cached.
+
+        Returns:
+            Future of the download link or None.
+        """
+        with self._lock:
+            cached = self._download_links.get(devicecode)
+        if cached and self._clock() - cached[0] < self.download_link_ttl:
+            future: Future = Future()
+            future.set_result(cached[1])
+            if callback:
+                callback(cached[1])
+            return future
+        future = self._executor.submit(self._probe_download_link, devicecode)
+        if callback:
+            future.add_done_callback(lambda f: callback(f.result()))
+        return future
+
+    def send_tracking_info(self, device_code: str, event: str):
+        """Queue a tracking event. It is sent in the background with the other queued events."""
+        data = {
+            "name": event,
+            "url": "app://openandroidinstaller",
+            "domain": "openandroidinstaller.org",
+            "props": {"device_code": device_code},
+        }
+        with self._lock:
+            if len(self._pending_events) >= self.max_pending_events:
+                logger.warning(f"Too many pending tracking events. Drop '{event}'.")
+                return
+            self._pending_events.append(data)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.tracking_delay, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send the queued tracking events now.
+
+        Args:
+            timeout: Seconds to wait until the events are sent. Don't wait if it's None.
+
+        Returns:
+            True if all events were sent in time.
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        future = self._executor.submit(self._send_pending_events)
+        if timeout is None:
+            return False
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            return False
+
+    def shutdown(self):
+        """Stop the background thread once the queued requests are done."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self._executor.shutdown(wait=False)
+
+    def _probe_download_link(self, devicecode: str) -> Optional[str]:
+        url = self.lineage_api_url.format(devicecode)
+        download_url = None
+        try:
+            logger.info(f"Checking {url}")
+            res = self._session.get(url, timeout=self.timeout)
+            # if the request succeeds
+            if res.status_code == 200:
+                download_url = LINEAGE_BUILDS_URL.format(devicecode)
+                logger.info(f"{download_url} exists.")
+            else:
+                logger.info(f"{url} doesn't exist, status_code: {res.status_code}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"{url} doesn't exist, error: {e}")
+            # don't cache the result, the computer might be online again later
+            return None
+        with self._lock:
+            self._download_links[devicecode] = (self._clock(), download_url)
+        return download_url
+
+    def _send_pending_events(self) -> bool:
+        with self._lock:
+            events, self._pending_events = self._pending_events, []
+        for num, data in enumerate(events):
+            try:
+                self._session.post(self.tracking_url, json=data, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                logger.info(
+                    f"Can't send tracking events, dropping {len(events) - num}: {e}"
+                )
+                return False
+            logger.info(
+                f"Sent tracking event '{data['name']}' for device '{data['props']['device_code']}'."
+            )
+        return True
+
+
+_client: Optional[NetworkClient] = None
+_client_lock = threading.Lock()
+
+
+def get_network_client() -> NetworkClient:
+    """Get the network client shared by the whole application."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NetworkClient()
+        return _client
@@ -15,16 +15,18 @@ import os
 import sys
 import webbrowser
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 import click
 import flet as ft
 from app_state import AppState
 from flet import (
+    AlertDialog,
     AppBar,
     Banner,
     Column,
     Container,
+    Control,
     ElevatedButton,
     Icon,
     Image,
@@ -33,11 +35,21 @@ from flet import (
     Colors,
     Icons,
 )
+from flow import FlowError
+from headless import JsonLinesReporter, run_headless_install
+from journal import (
+    InstallJournal,
+    find_interrupted_installs,
+    read_journal,
+    verify_checkpoint,
+)
 from loguru import logger
 from styles import Text
-from tooling import run_command
+from tool_registry import get_tool_registry
+from utils import CompatibilityStatus
 from views import (
     AddonsView,
+    BaseView,
     InstallAddonsView,
     InstallView,
     RequirementsView,
@@ -60,115 +72,196 @@ CONFIG_PATH = (
 BIN_PATH = Path(__file__).parent.joinpath(Path("bin")).resolve()
 
 
+# views with a back button; the views before them are kept to be shown again
+BACKABLE_VIEWS = ("start", "requirements", "select_files")
+
+
 class MainView(Column):
+    """Main view switching between the views of the installation process.
+
+    Views are created on first navigation by the factory of their slot. The slots are stored in
+    `state.default_views`, `state.addon_views` and `state.final_default_views`. Once the user
+    can't go back anymore, the views left behind are released.
+    """
+
     def __init__(self, state: AppState):
         super().__init__()
         self.state = state
         # create the main columns
         self.view = Column(expand=True)  # , width=1200)
 
-        # create default starter views
-        welcome_view = WelcomeView(
-            on_confirm=self.to_next_view,
-            state=self.state,
-        )
-        # self.state.page.add(welcome_view)
-
-        start_view = StartView(
-            on_confirm=self.to_next_view,
-            on_back=self.to_previous_view,
-            state=self.state,
-        )
-        requirements_view = RequirementsView(
-            on_confirm=self.to_next_view,
-            on_back=self.to_previous_view,
-            state=self.state,
-        )
-        select_files_view = SelectFilesView(
-            on_confirm=self.to_next_view,
-            on_back=self.to_previous_view,
-            state=self.state,
-        )
-
-        # create the install view
-        self.install_view = InstallView(
-            on_confirm=self.to_next_view,
-            state=self.state,
-        )
-
-        # create the final success view
-        self.final_view = SuccessView(state=self.state)
-
-        # initialize the addon view
-        self.select_addon_view = AddonsView(
-            on_confirm=self.to_next_view, state=self.state
-        )
-        self.install_addons_view = InstallAddonsView(
-            on_confirm=self.to_next_view, state=self.state
-        )
+        # factories of the views by slot
+        self.view_factories: Dict[str, Callable[[], Control]] = {
+            "welcome": lambda: WelcomeView(
+                on_confirm=self.to_next_view,
+                on_resume=self.resume_install,
+                state=self.state,
+            ),
+            "start": lambda: StartView(
+                on_confirm=self.to_next_view,
+                on_back=self.to_previous_view,
+                state=self.state,
+            ),
+            "requirements": lambda: RequirementsView(
+                on_confirm=self.to_next_view,
+                on_back=self.to_previous_view,
+                state=self.state,
+            ),
+            "select_files": lambda: SelectFilesView(
+                on_confirm=self.to_next_view,
+                on_back=self.to_previous_view,
+                state=self.state,
+            ),
+            # the install view
+            "install": lambda: InstallView(
+                on_confirm=self.to_next_view,
+                state=self.state,
+            ),
+            # the final success view
+            "success": lambda: SuccessView(state=self.state),
+            # the addon views
+            "addons": lambda: AddonsView(
+                on_confirm=self.to_next_view, state=self.state
+            ),
+            "install_addons": lambda: InstallAddonsView(
+                on_confirm=self.to_next_view, state=self.state
+            ),
+        }
+        # views created so far, which might be shown again
+        self.views: Dict[str, Control] = {}
+        # slot of the current view, None for step views
+        self.current_slot: Optional[str] = None
 
-        # attach some views to the state to modify and reuse later
+        # attach the slots of some views to the state to modify and reuse later
         # ordered to allow for pop
         self.state.add_default_views(
             views=[
-                select_files_view,
-                requirements_view,
-                start_view,
-                welcome_view,
+                "select_files",
+                "requirements",
+                "start",
+                "welcome",
             ]
         )
         self.state.add_addon_views(
             views=[
-                self.install_addons_view,
-                self.select_addon_view,
+                "install_addons",
+                "addons",
             ]
         )
         # final default views, ordered to allow to pop
         self.state.add_final_default_views(
             views=[
-                self.final_view,
-                self.install_view,
+                "success",
+                "install",
             ]
         )
 
-        # stack of previous default views for the back-button
-        self.previous_views: List = []
+        # stack of the slots of previous default views for the back-button
+        self.previous_views: List[str] = []
+
+    def get_view(self, slot: str) -> Control:
+        """Get the view of the slot and create it on first use."""
+        if slot not in self.views:
+            logger.info(f"Create view '{slot}'.")
+            self.views[slot] = self.view_factories[slot]()
+        return self.views[slot]
+
+    def show_view(self, slot: Optional[str], view: Control):
+        """Display the view and release the views the user can't go back to."""
+        if self.current_slot is None and self.view.controls:
+            # step views are created for every step and not shown again
+            self.release_view(self.view.controls[0])
+        self.current_slot = slot
+        self.view.controls = [view]
+        if slot not in BACKABLE_VIEWS:
+            for previous_slot in self.previous_views:
+                released = self.views.pop(previous_slot, None)
+                if released is not None:
+                    self.release_view(released)
+            self.previous_views = []
+
+    @staticmethod
+    def release_view(view: Control):
+        """Let the view free its resources, like the threads running commands."""
+        if isinstance(view, BaseView):
+            logger.info(f"Release view {type(view).__name__}.")
+            view.release()
 
     def build(self):
-        self.view.controls.append(self.state.default_views.pop())
+        slot = self.state.default_views.pop()
+        self.show_view(slot, self.get_view(slot))
         return self.view
 
     def to_previous_view(self, e):
         """Method to display the previous view."""
         # store the current view
-        self.state.default_views.append(self.view.controls[-1])
-        # clear the current view
-        self.view.controls = []
+        self.state.default_views.append(self.current_slot)
         # retrieve the new view and update
-        self.view.controls.append(self.previous_views.pop())
+        slot = self.previous_views.pop()
+        self.show_view(slot, self.get_view(slot))
         logger.info("One step back.")
         self.view.update()
 
-    def to_next_view(self, e):
-        """Confirmation event handler to use in views."""
+    def resume_install(self):
+        """Continue an interrupted installation restored by `state.resume_install`."""
+        # the device and the images are known already
+        self.state.default_views.clear()
+        if self.state.os_installed:
+            # the addons to install are known already, too
+            self.state.final_default_views.remove("install")
+            if self.state.install_addons:
+                self.state.add_default_views(["install_addons"])
+        self.to_next_view(None)
+
+    def to_next_view(self, e, skipped: bool = False):
+        """Confirmation event handler to use in views.
+
+        Args:
+            e: The event of the view.
+            skipped: True if the user skipped the step of the current step view.
+        """
         # store the current view
-        self.previous_views.append(self.view.controls[-1])
-        # remove all elements from column view
-        self.view.controls = []
+        if self.current_slot:
+            self.previous_views.append(self.current_slot)
+        elif self.state.journal and self.state.steps.cursor:
+            # the step view is only confirmed once its step completed or was skipped
+            self.state.journal.record_step(
+                self.state.flow.nodes[self.state.steps.cursor - 1], skipped=skipped
+            )
         # if there are default views left, display them first
         if self.state.default_views:
-            self.view.controls.append(self.state.default_views.pop())
+            slot = self.state.default_views.pop()
+            self.show_view(slot, self.get_view(slot))
         elif self.state.steps:
-            self.view.controls.append(
+            # the images are selected once the steps start
+            if self.state.flow is None:
+                try:
+                    self.state.compile_flow()
+                except FlowError as e:
+                    # stay on the current view, so the user can select the missing images
+                    logger.error(f"Can't start the installation: {e}")
+                    if self.current_slot:
+                        self.previous_views.pop()
+                    self.show_flow_error(str(e))
+                    return
+                self.state.start_journal()
+            node = self.state.flow.nodes[self.state.steps.cursor]
+            self.show_view(
+                None,
                 StepView(
-                    step=self.state.steps.pop(0),
+                    step=self.state.steps.advance(),
                     state=self.state,
                     on_confirm=self.to_next_view,
-                )
+                    on_skip=functools.partial(self.to_next_view, skipped=True),
+                    node=node,
+                ),
             )
         elif self.state.final_default_views:
             # here we expect the install view to populate the step views again if necessary
-            self.view.controls.append(self.state.final_default_views.pop())
+            slot = self.state.final_default_views.pop()
+            if slot == "success":
+                self.state.finish_journal()
+            self.show_view(slot, self.get_view(slot))
 
         # else:
         #    # display the final view
@@ -176,6 +269,25 @@ class MainView(Column):
         logger.info("Confirmed and moved to next step.")
         self.view.update()
 
+    def show_flow_error(self, message: str):
+        """Show a dialog explaining why the installation can't start."""
+        self.dlg_flow_error = AlertDialog(
+            modal=True,
+            title=Text("The installation can't start"),
+            content=Text(message),
+            actions=[TextButton("Ok", on_click=self.close_flow_error_dlg)],
+            actions_alignment="end",
+        )
+        if self.page:
+            self.page.dialog = self.dlg_flow_error
+            self.dlg_flow_error.open = True
+            self.page.update()
+
+    def close_flow_error_dlg(self, e):
+        """Close the dialog explaining why the installation can't start."""
+        self.dlg_flow_error.open = False
+        self.page.update()
+
 
 def configure(page: Page):
     """Configure the application."""
@@ -193,26 +305,16 @@ def configure(page: Page):
 
 
 def log_version_infos(bin_path):
-    """Log the version infos of adb, fastboot and heimdall."""
-    # adb
-    adbversion = [
-        line for line in run_command("adb version", bin_path, enable_logging=False)
-    ]
-    logger.info(f"{adbversion[1].strip()}")
-    # fastboot
-    fbversion = [
-        line
-        for line in run_command("fastboot --version", bin_path, enable_logging=False)
-    ]
-    logger.info(f"{fbversion[1].strip()}")
-    # heimdall
-    hdversion = [
-        line for line in run_command("heimdall info", bin_path, enable_logging=False)
-    ]
-    try:
-        logger.info(f"Heimdall version: {hdversion[1].strip()}")
-    except IndexError:
-        logger.info(f"Issue with heimdall: {hdversion}")
+    """Log the version infos of adb, fastboot and heimdall once they are probed in the background."""
+
+    def log_infos(probe):
+        for info in probe.result().values():
+            if info.available:
+                logger.info(f"{info.name} version: {info.version} ({info.output})")
+            else:
+                logger.info(f"Issue with {info.name}: {info.output or 'not available'}")
+
+    get_tool_registry(bin_path).probe().add_done_callback(log_infos)
 
 
 def main(page: Page, test: bool = False, test_config: str = "sargo"):
@@ -297,13 +399,17 @@ def main(page: Page, test: bool = False, test_config: str = "sargo"):
         test_config=test_config,
     )
     state.page = page
+    if not test:
+        # offer to resume the latest interrupted installation
+        interrupted = find_interrupted_installs()
+        state.checkpoint = interrupted[0] if interrupted else None
     # create application instance
     app = MainView(state=state)
     # add application's root control to the page
     page.add(app)
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option(
     "--test", is_flag=True, default=False, help="Start the application in testing mode."
 )
@@ -317,10 +423,13 @@ def main(page: Page, test: bool = False, test_config: str = "sargo"):
     default=".",
     help="Path where to store the log file.",
 )
-def startup(test: bool, test_config: str, logging_path: str):
+@click.pass_context
+def startup(ctx: click.Context, test: bool, test_config: str, logging_path: str):
     "Main entrypoint to the app."
     # where to write the logs
     logger.add(f"{logging_path}/openandroidinstaller.log")
+    if ctx.invoked_subcommand is not None:
+        return
 
     # start the app
     ft.app(
@@ -329,5 +438,94 @@ def startup(test: bool, test_config: str, logging_path: str):
     )
 
 
+IMAGE = click.Path(exists=True, dir_okay=False)
+
+
+@startup.command()
+@click.option("--device-code", required=True, help="Code of the device to install.")
+@click.option("--image", required=True, type=IMAGE, help="OS image to install.")
+@click.option("--recovery", type=IMAGE, help="TWRP recovery image to flash.")
+@click.option("--dtbo", type=IMAGE, help="dtbo image, if the config needs one.")
+@click.option("--vbmeta", type=IMAGE, help="vbmeta image, if the config needs one.")
+@click.option(
+    "--super-empty", type=IMAGE, help="super_empty image, if the config needs one."
+)
+@click.option(
+    "--vendor-boot", type=IMAGE, help="vendor_boot image, if the config needs one."
+)
+@click.option("--unlock-code", help="Code to unlock the bootloader, if needed.")
+@click.option("--serial", help="Serial of the device, if several are connected.")
+@click.option("--skip-unlock", is_flag=True, help="The bootloader is unlocked already.")
+@click.option(
+    "--skip-recovery", is_flag=True, help="The TWRP recovery is flashed already."
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the interrupted installation on the device with --serial.",
+)
+def install(
+    device_code: str,
+    image: str,
+    recovery: Optional[str],
+    dtbo: Optional[str],
+    vbmeta: Optional[str],
+    super_empty: Optional[str],
+    vendor_boot: Optional[str],
+    unlock_code: Optional[str],
+    serial: Optional[str],
+    skip_unlock: bool,
+    skip_recovery: bool,
+    resume: bool,
+):
+    """Install the OS on the device without the GUI, writing the progress as JSON lines."""
+    logger.info(f"Running OpenAndroidInstaller version '{VERSION}' headless.")
+    state = AppState(platform=PLATFORM, config_path=CONFIG_PATH, bin_path=BIN_PATH)
+    state.unlock_bootloader = not skip_unlock
+    state.flash_recovery = not skip_recovery
+    state.load_config(device_code)
+    if not state.config:
+        raise click.UsageError(f"No valid config for device code '{device_code}'.")
+    state.image_path = image
+    state.recovery_path = recovery
+    state.dtbo_path = dtbo
+    state.vbmeta_path = vbmeta
+    state.super_empty_path = super_empty
+    state.vendor_boot_path = vendor_boot
+    try:
+        flow = state.compile_flow(
+            install_os=True, unlock_code=unlock_code, serial=serial
+        )
+    except FlowError as e:
+        raise click.UsageError(str(e))
+    if flow.requires_input and not unlock_code:
+        raise click.UsageError("The config needs the --unlock-code.")
+
+    # the steps are journaled to resume them, if the device is known
+    journal = InstallJournal(serial) if serial else None
+    start = 0
+    if resume:
+        if not journal:
+            raise click.UsageError("Pass the --serial of the device to resume.")
+        checkpoint = read_journal(journal.path)
+        if not checkpoint or not checkpoint.resumable:
+            raise click.UsageError(f"No interrupted installation on '{serial}'.")
+        result = verify_checkpoint(checkpoint, flow, BIN_PATH)
+        if result.status != CompatibilityStatus.COMPATIBLE:
+            raise click.UsageError(result.message)
+        start = checkpoint.next_index
+    elif journal:
+        journal.start(state.config, flow)
+
+    success = run_headless_install(
+        flow,
+        JsonLinesReporter(),
+        device_code=state.config.device_code,
+        start=start,
+        journal=journal,
+    )
+    sys.exit(0 if success else 1)
+
+
 if __name__ == "__main__":
     startup()
@@ -0,0 +1,273 @@
+"""This module contains classes to derive the progress of the tools from their output."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Iterable, Optional, Union
+
+import regex as re
+
+# adb sideload: serving: 'lineage.zip'  (~47%)
+SIDELOAD_PATTERN = re.compile(r"\(\~(\d{1,3})\%\)")
+# adb sideload is done, the device might close the connection before the last block
+SIDELOAD_DONE_PATTERN = re.compile(r"Total xfer:|adb: failed to read command: Success")
+# fastboot: Sending 'boot_a' (65536 KB) or Sending sparse 'super' 2/5 (524284 KB)
+FASTBOOT_PATTERN = re.compile(
+    r"^(Sending|Writing)(?: sparse)? '[^']+'(?: (\d+)/(\d+))?"
+)
+FASTBOOT_DONE_PATTERN = re.compile(r"^Finished\. Total time")
+# fastboot prints the line once the data was sent: Sending sparse 'super' 1/9 (524284 KB)  OKAY [ 12.3s]
+FASTBOOT_SENT_PATTERN = re.compile(
+    r"^Sending(?: sparse)? '[^']+'(?: \d+/\d+)? \((\d+) KB\)"
+)
+# heimdall: 47%
+HEIMDALL_PATTERN = re.compile(r"^(\d{1,3})%$")
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Progress of the transfer of images to the device, yielded by the flash functions.
+
+    Attributes:
+        label: Name of the image currently transferred.
+        bytes_done: Bytes of all images transferred so far.
+        bytes_total: Size of all images to transfer.
+        bytes_per_second: Average transfer rate.
+        eta: Estimated seconds until all images are transferred.
+    """
+
+    label: str
+    bytes_done: int
+    bytes_total: int
+    bytes_per_second: Optional[float] = None
+    eta: Optional[float] = None
+
+    @property
+    def percentage(self) -> int:
+        if self.bytes_total <= 0:
+            return 0
+        return min(100, self.bytes_done * 100 // self.bytes_total)
+
+    def describe(self) -> str:
+        """Describe the transfer rate and the remaining time like `21.3 MB/s, 0:42 left`."""
+        if not self.bytes_per_second:
+            return ""
+        text = f"{self.bytes_per_second / 1_000_000:.1f} MB/s"
+        if self.eta is not None:
+            minutes, seconds = divmod(int(self.eta), 60)
+            text += f", {minutes}:{seconds:02d} left"
+        return text
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class TransferProgress:
+    """Track the bytes sent to the device while flashing images of known size.
+
+    The sizes of all images of a flow are read up front, so the progress covers all of them.
+    Only the time spent transferring counts for the transfer rate, not the reboots in between.
+    """
+
+    def __init__(
+        self, image_paths: Iterable[str], clock: Callable[[], float] = monotonic
+    ):
+        self.sizes = {str(path): _file_size(path) for path in image_paths if path}
+        self.bytes_total = sum(self.sizes.values())
+        self.bytes_done = 0
+        self.label = ""
+        self._clock = clock
+        self._image_offset = 0
+        self._image_size = 0
+        self._image_started: Optional[float] = None
+        self._elapsed = 0.0
+
+    def start_image(self, image_path: str):
+        """Start the transfer of the given image."""
+        self.label = Path(image_path).name
+        self._image_offset = self.bytes_done
+        self._image_size = self.sizes.get(str(image_path), 0)
+        self._image_started = self._clock()
+
+    def finish_image(self) -> ProgressEvent:
+        """Count the current image as transferred completely."""
+        self.bytes_done = self._image_offset + self._image_size
+        event = self._event()
+        if self._image_started is not None:
+            self._elapsed += self._clock() - self._image_started
+            self._image_started = None
+        return event
+
+    def feed(self, line: str) -> Optional[ProgressEvent]:
+        """Read an output line of fastboot or heimdall and return the progress if it changed."""
+        if not isinstance(line, str):
+            return None
+        line = line.strip()
+        image_end = self._image_offset + self._image_size
+        result = FASTBOOT_SENT_PATTERN.match(line)
+        if result:
+            bytes_done = self.bytes_done + int(result.group(1)) * 1024
+        else:
+            result = HEIMDALL_PATTERN.match(line)
+            if not result:
+                return None
+            bytes_done = (
+                self._image_offset + self._image_size * int(result.group(1)) // 100
+            )
+        # the sizes reported by fastboot are rounded
+        bytes_done = min(bytes_done, image_end)
+        if bytes_done <= self.bytes_done:
+            return None
+        self.bytes_done = bytes_done
+        return self._event()
+
+    def _event(self) -> ProgressEvent:
+        elapsed = self._elapsed
+        if self._image_started is not None:
+            elapsed += self._clock() - self._image_started
+        rate = self.bytes_done / elapsed if elapsed > 0 and self.bytes_done else None
+        eta = (self.bytes_total - self.bytes_done) / rate if rate else None
+        return ProgressEvent(
+            label=self.label,
+            bytes_done=self.bytes_done,
+            bytes_total=self.bytes_total,
+            bytes_per_second=rate,
+            eta=eta,
+        )
+
+
+class ProgressParser:
+    """Get the progress in percent from the output lines of adb, fastboot and heimdall.
+
+    Only increasing percentages are reported, so the progress never jumps back. The progress
+    stays between 1 and 99 percent; reaching 100 percent is up to the caller once the flow succeeded.
+    """
+
+    def __init__(self):
+        self.percentage = 0
+        # the byte progress of flashed images replaces the progress read from the lines
+        self._byte_progress = False
+
+    def reset(self):
+        """Start over with the progress of a new flow."""
+        self.percentage = 0
+        self._byte_progress = False
+
+    @staticmethod
+    def parse(line: Union[str, ProgressEvent]) -> Optional[int]:
+        """Get the progress from a single line or event, ignoring the previous lines."""
+        if isinstance(line, ProgressEvent):
+            return line.percentage
+        if not isinstance(line, str):
+            return None
+        line = line.strip()
+        if not line:
+            return None
+        result = SIDELOAD_PATTERN.search(line)
+        if result:
+            return int(result.group(1))
+        if SIDELOAD_DONE_PATTERN.search(line) or FASTBOOT_DONE_PATTERN.match(line):
+            return 99
+        result = HEIMDALL_PATTERN.match(line)
+        if result:
+            return int(result.group(1))
+        result = FASTBOOT_PATTERN.match(line)
+        if result:
+            phase, chunk, chunks = result.groups()
+            if chunk and chunks:
+                # sparse images are sent and written in chunks
+                offset = 0 if phase == "Sending" else 50
+                return (100 * (int(chunk) - 1) + offset) // int(chunks)
+            return 1 if phase == "Sending" else 50
+        return None
+
+    def feed(self, line: Union[str, ProgressEvent]) -> Optional[int]:
+        """Read a line or event and return the new progress if it increased."""
+        if isinstance(line, ProgressEvent):
+            self._byte_progress = True
+        elif self._byte_progress:
+            return None
+        percentage = self.parse(line)
+        if percentage is None:
+            return None
+        percentage = max(1, min(99, percentage))
+        if percentage <= self.percentage:
+            return None
+        self.percentage = percentage
+        return percentage
+
+
+class RateLimiter:
+    """Limit how often an action like updating the UI happens.
+
+    Actions passed to `run` within the interval are not dropped: the latest of them runs once
+    the interval passed, so the last update like 100 % is always shown.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last = float("-inf")
+        self._pending: Optional[threading.Timer] = None
+        self._pending_action: Optional[Callable[[], Any]] = None
+        self._lock = threading.Lock()
+
+    def ready(self, force: bool = False) -> bool:
+        """Return True if the interval passed since the last time it returned True."""
+        now = monotonic()
+        if force or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+    def run(self, action: Callable[[], Any], force: bool = False):
+        """Run the action now if the interval passed, otherwise the latest one once it passed."""
+        with self._lock:
+            now = monotonic()
+            wait_time = self._last + self.interval - now
+            if not force and wait_time > 0:
+                self._pending_action = action
+                if self._pending is None:
+                    self._pending = threading.Timer(wait_time, self.flush)
+                    self._pending.daemon = True
+                    self._pending.start()
+                return
+            self._cancel_pending()
+            self._last = now
+        action()
+
+    def flush(self):
+        """Run the latest throttled action right away, if there is one."""
+        with self._lock:
+            action = self._pending_action
+            self._cancel_pending()
+            if action is None:
+                return
+            self._last = monotonic()
+        action()
+
+    def cancel(self):
+        """Drop the throttled action, if there is one."""
+        with self._lock:
+            self._cancel_pending()
+
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self._pending_action = None
@@ -0,0 +1,234 @@
+"""This module contains the automatic checks of the requirements of a device config."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+from dataclasses import dataclass, field
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import List, Optional
+
+import regex as re
+from loguru import logger
+from tooling import DeviceProperties, get_device_properties
+from utils import CompatibilityStatus
+
+MIN_BATTERY_LEVEL = 80
+# leading version number of a requirement like `12.1.0`, `10 (Q)` or `13 (MiUI 14.0.x)`
+VERSION_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)*)")
+# properties which might contain the firmware version
+FIRMWARE_PROPERTIES = (
+    "ro.build.display.id",
+    "ro.build.id",
+    "ro.build.version.incremental",
+)
+
+
+@dataclass
+class RequirementResult:
+    """Result of checking a single requirement.
+
+    Attributes:
+        name: Name of the requirement: android, firmware, battery or bootloader.
+        status: COMPATIBLE if the requirement is met, UNKNOWN if it can't be checked automatically.
+        message: Message to be displayed to the user.
+    """
+
+    name: str
+    status: CompatibilityStatus
+    message: str
+
+
+@dataclass
+class RequirementsReport:
+    """Results of checking all requirements of a device.
+
+    Attributes:
+        results: Result of every checked requirement.
+        properties: Properties of the device the requirements were checked with.
+    """
+
+    results: List[RequirementResult] = field(default_factory=list)
+    properties: Optional[DeviceProperties] = None
+
+    def get(self, name: str) -> Optional[RequirementResult]:
+        """Get the result of the requirement with the name, if it was checked."""
+        return next((result for result in self.results if result.name == name), None)
+
+    @property
+    def failed(self) -> List[RequirementResult]:
+        return [
+            result
+            for result in self.results
+            if result.status == CompatibilityStatus.INCOMPATIBLE
+        ]
+
+    @property
+    def device_read(self) -> bool:
+        """True if properties were read from the device and told anything about a requirement."""
+        if not self.properties or not any(self.properties.values.values()):
+            return False
+        return not self.results or any(
+            result.status != CompatibilityStatus.UNKNOWN for result in self.results
+        )
+
+    @property
+    def passed(self) -> bool:
+        """True if no requirement failed. Unknown results need to be checked by hand."""
+        return not self.failed
+
+
+def _parse_version(version: str) -> Optional[List[int]]:
+    result = VERSION_PATTERN.match(str(version))
+    if not result:
+        return None
+    return [int(part) for part in result.group(1).split(".")]
+
+
+def check_android_version(
+    required: str, properties: DeviceProperties
+) -> RequirementResult:
+    """Compare the Android version of the device with the required one.
+
+    Only the parts of the version both have are compared, since e.g. Android 12L reports `12`.
+    """
+    installed = properties.android_version
+    required_version = _parse_version(required)
+    installed_version = _parse_version(installed) if installed else None
+    if not required_version or not installed_version:
+        return RequirementResult(
+            name="android",
+            status=CompatibilityStatus.UNKNOWN,
+            message=f"Could not read the Android version. Make sure Android {required} is installed.",
+        )
+    length = min(len(required_version), len(installed_version))
+    if required_version[:length] == installed_version[:length]:
+        return RequirementResult(
+            name="android",
+            status=CompatibilityStatus.COMPATIBLE,
+            message=f"Android {installed} is installed.",
+        )
+    return RequirementResult(
+        name="android",
+        status=CompatibilityStatus.INCOMPATIBLE,
+        message=f"Android {installed} is installed, but Android {required} is required.",
+    )
+
+
+def check_firmware_version(
+    required: str, properties: DeviceProperties
+) -> RequirementResult:
+    """Look for the required firmware version in the build ids of the device.
+
+    Firmware versions in the configs are often names like `MiUI 12.5 (Q)`, so a version which
+    is not found is unknown rather than wrong.
+    """
+    builds = [properties.get(name) for name in FIRMWARE_PROPERTIES]
+    builds = [build for build in builds if build]
+    if any(required.lower() in build.lower() for build in builds):
+        return RequirementResult(
+            name="firmware",
+            status=CompatibilityStatus.COMPATIBLE,
+            message=f"Firmware {required} is installed.",
+        )
+    installed = builds[0] if builds else "unknown"
+    return RequirementResult(
+        name="firmware",
+        status=CompatibilityStatus.UNKNOWN,
+        message=f"The device reports the build {installed}. Make sure firmware {required} is installed.",
+    )
+
+
+def check_battery_level(
+    properties: DeviceProperties, min_level: int = MIN_BATTERY_LEVEL
+) -> RequirementResult:
+    """Check if the battery is charged enough to install safely."""
+    level = properties.battery_level
+    if level is None:
+        return RequirementResult(
+            name="battery",
+            status=CompatibilityStatus.UNKNOWN,
+            message="Could not read the battery level.",
+        )
+    if level >= min_level:
+        return RequirementResult(
+            name="battery",
+            status=CompatibilityStatus.COMPATIBLE,
+            message=f"The battery level is {level}%.",
+        )
+    return RequirementResult(
+        name="battery",
+        status=CompatibilityStatus.INCOMPATIBLE,
+        message=f"The battery level is {level}%. Charge the device to over {min_level}%.",
+    )
+
+
+def check_requirements(
+    requirements: Optional[dict],
+    properties: DeviceProperties,
+    min_battery_level: int = MIN_BATTERY_LEVEL,
+) -> RequirementsReport:
+    """Evaluate the `requirements` block of a config and the default requirements.
+
+    Args:
+        requirements: Requirements of the config, like `{"android": 12, "firmware": "..."}`.
+        properties: Properties of the connected device.
+        min_battery_level: Battery level in percent needed to install.
+
+    Returns:
+        Report with the results of all requirements.
+    """
+    requirements = requirements or {}
+    report = RequirementsReport(properties=properties)
+    if requirements.get("android"):
+        report.results.append(
+            check_android_version(str(requirements["android"]), properties)
+        )
+    if requirements.get("firmware"):
+        report.results.append(
+            check_firmware_version(str(requirements["firmware"]), properties)
+        )
+    report.results.append(check_battery_level(properties, min_level=min_battery_level))
+    locked = properties.bootloader_locked
+    if locked is not None:
+        report.results.append(
+            RequirementResult(
+                name="bootloader",
+                status=CompatibilityStatus.COMPATIBLE,
+                message=f"The bootloader is {'locked' if locked else 'unlocked'}.",
+            )
+        )
+    return report
+
+
+def check_device_requirements(
+    requirements: Optional[dict],
+    bin_path: Path,
+    serial: Optional[str] = None,
+    min_battery_level: int = MIN_BATTERY_LEVEL,
+) -> RequirementsReport:
+    """Read the properties of the connected device and check the requirements.
+
+    The properties are read again in one `adb shell` call, since e.g. the battery level changes.
+    If no device can be reached, all requirements are unknown.
+    """
+    try:
+        properties = get_device_properties(bin_path, serial=serial, refresh=True)
+    except (CalledProcessError, OSError) as e:
+        logger.error(f"Failed to read the device properties: {e}")
+        properties = DeviceProperties(serial=serial, values={})
+    report = check_requirements(
+        requirements, properties, min_battery_level=min_battery_level
+    )
+    logger.info(
+        "Checked requirements: "
+        + ", ".join(f"{r.name}={r.status.name}" for r in report.results)
+    )
+    return report
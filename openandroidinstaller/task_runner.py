@@ -0,0 +1,152 @@
+"""This module contains a class to run the flows of the tooling module without blocking the UI."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Union
+
+from loguru import logger
+from progress import RateLimiter
+from tooling import TerminalResponse, terminate_command
+
+Batch = List[Union[str, bool]]
+
+
+class TaskRunner:
+    """Run a flow of the tooling module on a background thread.
+
+    The output of the flow is collected and passed to `on_output` in batches, at most every
+    `batch_interval` seconds, so the view is only updated a few times per second. A batch is also
+    passed on after the interval if the flow blocks, like while waiting for the device. The
+    callbacks are called from background threads; flet controls can be updated from there.
+
+    Call `shutdown` once the runner isn't needed anymore to stop its thread.
+
+    Pass the `cancel_event` on to the flow, so waiting for the device stops on cancel too.
+
+    Attributes:
+        batch_interval: Seconds to collect output before passing it on.
+        cancel_event: Set if the running flow should stop; a new one is created if none is given.
+    """
+
+    def __init__(
+        self,
+        batch_interval: float = 0.1,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        self.batch_interval = batch_interval
+        self.cancel_event = cancel_event or threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task")
+        self._future: Optional[Future] = None
+        self._thread_id: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        """True while a flow is running."""
+        return self._future is not None and not self._future.done()
+
+    @property
+    def cancelled(self) -> bool:
+        """True if the last flow was cancelled."""
+        return self.cancel_event.is_set()
+
+    def start(
+        self,
+        flow: Callable[[], TerminalResponse],
+        on_output: Callable[[Batch], None],
+        on_done: Callable[[bool], None],
+    ) -> Future:
+        """Run the flow in the background.
+
+        Args:
+            flow: Function returning the generator to run, like a tooling function with all arguments bound.
+            on_output: Called with the lines yielded by the flow since the last call.
+            on_done: Called with the success of the flow once it finished. Cancelled flows failed.
+
+        Returns:
+            Future of the success of the flow.
+
+        Raises:
+            RuntimeError: If a flow is running already.
+        """
+        if self.running:
+            raise RuntimeError("A task is running already.")
+        self.cancel_event.clear()
+        self._future = self._executor.submit(self._run, flow, on_output, on_done)
+        return self._future
+
+    def cancel(self):
+        """Stop the running flow and the command it is waiting for."""
+        if not self.running:
+            return
+        logger.info("Cancel the running task.")
+        self.cancel_event.set()
+        if self._thread_id is not None:
+            terminate_command(self._thread_id)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[bool]:
+        """Wait for the running flow and return its success."""
+        if self._future is None:
+            return None
+        return self._future.result(timeout=timeout)
+
+    def _run(
+        self,
+        flow: Callable[[], TerminalResponse],
+        on_output: Callable[[Batch], None],
+        on_done: Callable[[bool], None],
+    ) -> bool:
+        self._thread_id = threading.get_ident()
+        batch: Batch = []
+        batch_lock = threading.Lock()
+
+        def flush():
+            nonlocal batch
+            # the lock keeps the batches in order if the timer of the limiter flushes too
+            with batch_lock:
+                lines, batch = batch, []
+                if lines:
+                    on_output(lines)
+
+        limiter = RateLimiter(self.batch_interval)
+        # the first batch is passed on after the interval too
+        limiter.ready()
+        line: Union[str, bool] = False
+        generator = None
+        try:
+            generator = flow()
+            for line in generator:
+                with batch_lock:
+                    batch.append(line)
+                if self.cancel_event.is_set():
+                    break
+                limiter.run(flush)
+            success = (line is True) and not self.cancel_event.is_set()
+        except Exception as e:
+            logger.error(f"Task failed: {e}")
+            success = False
+        finally:
+            # stop the flow, like a generator in the middle of a command after cancelling
+            if hasattr(generator, "close"):
+                generator.close()
+            self._thread_id = None
+        if self.cancel_event.is_set():
+            logger.info("Task was cancelled.")
+        limiter.cancel()
+        flush()
+        on_done(success)
+        return success
+
+    def shutdown(self):
+        """Cancel the running flow and stop the background thread."""
+        self.cancel()
+        self._executor.shutdown(wait=False)
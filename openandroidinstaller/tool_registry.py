@@ -0,0 +1,202 @@
+"""This module contains the registry of the tools (adb, fastboot, heimdall) shipped with the application."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional
+
+import regex as re
+from loguru import logger
+from tooling import PLATFORM, run_command
+from utils import get_cache_dir
+
+# command printing the version of each tool
+VERSION_COMMANDS = {
+    "adb": "adb version",
+    "fastboot": "fastboot --version",
+    "heimdall": "heimdall info",
+}
+# what the application uses the tools for
+TOOL_CAPABILITIES = {
+    "adb": frozenset({"reboot", "sideload", "shell"}),
+    "fastboot": frozenset({"boot", "flash", "unlock"}),
+    "heimdall": frozenset({"flash"}),
+}
+VERSION_PATTERN = re.compile(r"(?:[Vv]ersion\s+|v)(\d+\.\d+[\w.\-]*)")
+CACHE_FILE = "tool-versions.json"
+
+
+@dataclass(frozen=True)
+class ToolInfo:
+    """Information about a tool.
+
+    Attributes:
+        name: Name of the tool: adb, fastboot or heimdall.
+        path: Path to the binary.
+        available: True if the tool could be run.
+        version: Version reported by the tool.
+        output: First line of the version output, as reported by the tool.
+        capabilities: What the tool can be used for, empty if it's not available.
+    """
+
+    name: str
+    path: Path
+    available: bool
+    version: Optional[str] = None
+    output: str = ""
+    capabilities: FrozenSet[str] = frozenset()
+
+
+def parse_version(lines: List[str]) -> Optional[str]:
+    """Get the version from the version output of a tool.
+
+    For adb the version of the platform tools (`Version 34.0.5-10900879`) is preferred over the
+    protocol version (`Android Debug Bridge version 1.0.41`).
+    """
+    versions = [
+        result.group(1) for result in map(VERSION_PATTERN.search, lines) if result
+    ]
+    if not versions:
+        return None
+    return versions[1] if len(versions) > 1 else versions[0]
+
+
+class ToolRegistry:
+    """Probe the tools concurrently in the background and provide their `ToolInfo`.
+
+    Results are cached on disk by path and modification time of the binaries, so the tools are
+    only run again after they changed.
+    """
+
+    def __init__(self, bin_path: Path, cache_path: Optional[Path] = None):
+        self.bin_path = bin_path
+        self.cache_path = cache_path or get_cache_dir().joinpath(CACHE_FILE)
+        self._lock = threading.Lock()
+        self._probe: Optional[Future] = None
+
+    def binary_path(self, tool: str) -> Path:
+        """Get the path of the binary of the tool."""
+        suffix = ".exe" if PLATFORM == "win32" else ""
+        return self.bin_path.joinpath(tool + suffix)
+
+    def probe(self) -> "Future[Dict[str, ToolInfo]]":
+        """Start probing all tools in the background, unless it was started already."""
+        with self._lock:
+            if self._probe is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tools")
+                self._probe = executor.submit(self._probe_all)
+                executor.shutdown(wait=False)
+            return self._probe
+
+    def get(self, tool: str, timeout: Optional[float] = None) -> ToolInfo:
+        """Get the information about the tool, waiting for the probe if necessary."""
+        return self.probe().result(timeout=timeout)[tool]
+
+    def available(self, tool: str, timeout: Optional[float] = None) -> bool:
+        """Check if the tool can be used."""
+        return self.get(tool, timeout=timeout).available
+
+    def _probe_all(self) -> Dict[str, ToolInfo]:
+        """Probe all tools concurrently."""
+        with ThreadPoolExecutor(max_workers=len(VERSION_COMMANDS)) as executor:
+            infos = dict(
+                zip(VERSION_COMMANDS, executor.map(self._probe_tool, VERSION_COMMANDS))
+            )
+        self._write_cache(infos)
+        return infos
+
+    def _probe_tool(self, tool: str) -> ToolInfo:
+        path = self.binary_path(tool)
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            logger.warning(f"{tool} not found at {path}.")
+            return ToolInfo(name=tool, path=path, available=False)
+        cached = self._read_cache().get(str(path))
+        if cached and cached.get("mtime_ns") == mtime_ns:
+            return ToolInfo(
+                name=tool,
+                path=path,
+                available=cached["available"],
+                version=cached["version"],
+                output=cached["output"],
+                capabilities=(
+                    TOOL_CAPABILITIES[tool] if cached["available"] else frozenset()
+                ),
+            )
+        lines = []
+        success = False
+        try:
+            for line in run_command(
+                VERSION_COMMANDS[tool], self.bin_path, enable_logging=False
+            ):
+                if isinstance(line, bool):
+                    success = line
+                elif not line.startswith("$"):
+                    lines.append(line)
+        except OSError as e:
+            logger.warning(f"Can't run {tool}: {e}")
+        # a tool printing its version is usable, even if the info command exits with an error
+        available = success or bool(lines)
+        return ToolInfo(
+            name=tool,
+            path=path,
+            available=available,
+            version=parse_version(lines),
+            output=lines[0].strip() if lines else "",
+            capabilities=TOOL_CAPABILITIES[tool] if available else frozenset(),
+        )
+
+    def _read_cache(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as stream:
+                cache = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def _write_cache(self, infos: Dict[str, ToolInfo]):
+        """Persist the results; failing to do so only costs probing again on the next start."""
+        cache = self._read_cache()
+        for info in infos.values():
+            try:
+                mtime_ns = info.path.stat().st_mtime_ns
+            except OSError:
+                cache.pop(str(info.path), None)
+                continue
+            entry = asdict(info)
+            del entry["capabilities"]
+            entry["path"] = str(info.path)
+            entry["mtime_ns"] = mtime_ns
+            cache[str(info.path)] = entry
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as stream:
+                json.dump(cache, stream)
+            tmp_path.replace(self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist the tool versions: {e}")
+
+
+_registries: Dict[Path, ToolRegistry] = {}
+
+
+def get_tool_registry(bin_path: Path) -> ToolRegistry:
+    """Get the shared tool registry for the given directory."""
+    registry = _registries.get(bin_path)
+    if registry is None:
+        registry = _registries[bin_path] = ToolRegistry(bin_path)
+    return registry
@@ -11,33 +11,74 @@
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
 import shlex
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import partial
 import subprocess
 import sys
+import threading
 from pathlib import Path
 from subprocess import PIPE, STDOUT, CalledProcessError, check_output
-from time import sleep
-from typing import Callable, Generator, Optional, Union
+from time import monotonic, sleep
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Union
 
+from adb_client import AdbClient, DeviceInfo, parse_devices
 from loguru import logger
+import regex as re
+from progress import ProgressEvent, TransferProgress
+from usb_watcher import (
+    SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+    SAMSUNG_VENDOR_ID,
+    usb_sysfs_available,
+    wait_for_usb_device,
+)
 
-TerminalResponse = Generator[Union[str, bool], None, None]
+TerminalResponse = Generator[Union[str, bool, ProgressEvent], None, None]
 
 
 PLATFORM = sys.platform
 
+# state of a device which is not listed by adb or fastboot
+DISCONNECTED = "disconnected"
+
+# processes started by run_command by the id of the thread running them
+_running_processes: Dict[int, subprocess.Popen] = {}
+_running_processes_lock = threading.Lock()
+
+# adb commands run through a running adb server instead of spawning the adb binary
+_adb_client = AdbClient()
+
 
 def run_command(
     full_command: str,
     bin_path: Path,
     target: Optional[Union[str, Path]] = None,
     enable_logging: bool = True,
+    serial: Optional[str] = None,
 ) -> TerminalResponse:
-    """Run a command with a tool (adb, fastboot, heimdall)."""
+    """Run a command with a tool (adb, fastboot, heimdall).
+
+    If a serial is given, the command is addressed to the device with this serial instead of
+    the only connected (USB) device. Heimdall can't select a device, so the serial is ignored there.
+
+    `adb shell`, `adb reboot` and `adb sideload` are sent to the adb server directly if one is
+    running; otherwise, like all other commands, they run with the binary.
+    """
     # split the command and extract the tool part
     tool, *command = shlex.split(full_command)
     if tool not in ["adb", "fastboot", "heimdall"]:
         raise Exception(f"Unknown tool {tool}. Use adb, fastboot or heimdall.")
+    if tool == "adb":
+        service = _adb_service(command, target, serial)
+        if service is not None and _adb_client.is_available():
+            yield from _run_adb_service(full_command, service, enable_logging)
+            return
+    if serial and tool in ("adb", "fastboot"):
+        # `-s` replaces the device selector following the tool, like `-d` for the only USB device
+        if command[:1] == ["-d"]:
+            command = command[1:]
+        elif command[:1] == ["-s"]:
+            command = command[2:]
+        command = ["-s", serial] + command
     if PLATFORM == "win32":
         command_list = [str(bin_path.joinpath(Path(f"{tool}"))) + ".exe"] + command
         # prevent Windows from opening terminal windows
@@ -60,15 +101,109 @@ def run_command(
         universal_newlines=True,
         startupinfo=si,
     ) as p:
-        for line in p.stdout:  # type: ignore
-            if enable_logging:
-                logger.info(line.strip())
-            yield line.strip()
+        thread_id = threading.get_ident()
+        with _running_processes_lock:
+            _running_processes[thread_id] = p
+        try:
+            for line in p.stdout:  # type: ignore
+                if enable_logging:
+                    logger.info(line.strip())
+                yield line.strip()
+        finally:
+            with _running_processes_lock:
+                _running_processes.pop(thread_id, None)
 
     # finally return if the command was successful
     yield p.returncode == 0
 
 
+def _adb_service(
+    command: List[str],
+    target: Optional[Union[str, Path]],
+    serial: Optional[str],
+) -> Optional[Callable[[], Generator[Union[str, bool], None, None]]]:
+    """Get the command of the adb client doing the same as the adb command, if there is one."""
+    usb = False
+    if command[:1] == ["-d"]:
+        usb, command = True, command[1:]
+    elif command[:1] == ["-s"] and len(command) > 1:
+        serial, command = serial or command[1], command[2:]
+    if not command:
+        return None
+    name, *args = command
+    if name == "shell" and args:
+        return partial(_adb_client.shell, " ".join(args), serial=serial, usb=usb)
+    if name == "reboot" and len(args) <= 1 and not target:
+        return partial(
+            _adb_client.reboot, args[0] if args else "", serial=serial, usb=usb
+        )
+    if name == "sideload" and not args and target:
+        return partial(_adb_client.sideload, str(target), serial=serial, usb=usb)
+    return None
+
+
+def _run_adb_service(
+    full_command: str,
+    service: Callable[[], Generator[Union[str, bool], None, None]],
+    enable_logging: bool,
+) -> TerminalResponse:
+    """Run the command of the adb client and yield its output like `run_command`."""
+    if enable_logging:
+        logger.info(f"Run command through the adb server: {full_command}")
+    yield f"${full_command}"
+    for line in service():
+        if enable_logging and isinstance(line, str):
+            logger.info(line)
+        yield line
+
+
+def run_flash_command(
+    full_command: str,
+    bin_path: Path,
+    image: str,
+    progress: Optional[TransferProgress] = None,
+    serial: Optional[str] = None,
+) -> TerminalResponse:
+    """Run a command transferring an image to the device and report the progress.
+
+    Besides the output lines, `ProgressEvent`s with the bytes sent, the transfer rate and the
+    remaining time are yielded. Pass the same `progress` to all commands of a flow to track the
+    progress over all images.
+    """
+    if progress is None:
+        progress = TransferProgress([image])
+    progress.start_image(image)
+    for line in run_command(full_command, bin_path, target=image, serial=serial):
+        if isinstance(line, bool):
+            if line:
+                yield progress.finish_image()
+            yield line
+            return
+        yield line
+        event = progress.feed(line)
+        if event:
+            yield event
+
+
+def terminate_command(thread_id: int) -> bool:
+    """Terminate the command started by run_command in the given thread, if there is one.
+
+    The output of the command ends and run_command reports a failure.
+
+    Returns:
+        True if a running command was terminated.
+    """
+    if _adb_client.abort(thread_id):
+        return True
+    with _running_processes_lock:
+        process = _running_processes.get(thread_id)
+    if process is None or process.poll() is not None:
+        return False
+    logger.info(f"Terminate command {process.args}.")
+    process.terminate()
+    return True
+
+
 def add_logging(step_desc: str, return_if_fail: bool = False) -> Callable:
     """Logging decorator to wrap functions that yield lines.
 
@@ -95,106 +230,163 @@ def add_logging(step_desc: str, return_if_fail: bool = False) -> Callable:
     return logging_decorator
 
 
+def pause(seconds: float, cancel_event: Optional[threading.Event] = None) -> bool:
+    """Pause the flow for some seconds, unless it is cancelled before.
+
+    Returns:
+        True if the flow can continue, False if it was cancelled.
+    """
+    if cancel_event is None:
+        sleep(seconds)
+        return True
+    return not cancel_event.wait(seconds)
+
+
 @add_logging("Rebooting device with adb.")
-def adb_reboot(bin_path: Path) -> TerminalResponse:
+def adb_reboot(bin_path: Path, serial: Optional[str] = None) -> TerminalResponse:
     """Run adb reboot on the device and return success."""
-    for line in run_command("adb -d reboot", bin_path):
+    for line in run_command("adb -d reboot", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Rebooting device into bootloader with adb.", return_if_fail=True)
-def adb_reboot_bootloader(bin_path: Path) -> TerminalResponse:
+def adb_reboot_bootloader(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
     """Reboot the device into bootloader and return success."""
-    for line in run_command("adb -d reboot bootloader", bin_path):
+    for line in run_command("adb -d reboot bootloader", bin_path, serial=serial):
         yield line
     # wait for the bootloader to become available
-    for line in fastboot_wait_for_bootloader(bin_path=bin_path):
+    for line in fastboot_wait_for_bootloader(
+        bin_path=bin_path, serial=serial, cancel_event=cancel_event
+    ):
         yield line
 
 
 @add_logging("Rebooting device into download mode with adb.")
-def adb_reboot_download(bin_path: Path) -> TerminalResponse:
-    """Reboot the device into download mode of samsung devices and return success."""
-    for line in run_command("adb -d reboot download", bin_path):
+def adb_reboot_download(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
+    """Reboot the device into download mode of samsung devices and return success.
+
+    Waiting for the download mode stops once the `cancel_event` is set.
+    """
+    for line in run_command("adb -d reboot download", bin_path, serial=serial):
         yield line
-    yield heimdall_wait_for_download_available(bin_path=bin_path)
+    yield heimdall_wait_for_download_available(
+        bin_path=bin_path, serial=serial, cancel_event=cancel_event
+    )
 
 
 @add_logging("Sideload the target to device with adb.")
-def adb_sideload(bin_path: Path, target: str) -> TerminalResponse:
+def adb_sideload(
+    bin_path: Path, target: str, serial: Optional[str] = None
+) -> TerminalResponse:
     """Sideload the target to device and return success."""
-    for line in run_command("adb -d sideload", target=target, bin_path=bin_path):
+    for line in run_command(
+        "adb -d sideload", target=target, bin_path=bin_path, serial=serial
+    ):
         yield line
 
 
 @add_logging("Activate sideloading in TWRP.", return_if_fail=False)
-def activate_sideload(bin_path: Path) -> TerminalResponse:
+def activate_sideload(bin_path: Path, serial: Optional[str] = None) -> TerminalResponse:
     """Activate sideload with adb shell in twrp."""
-    for line in run_command("adb -d shell twrp sideload", bin_path):
+    for line in run_command("adb -d shell twrp sideload", bin_path, serial=serial):
         yield line
-    for line in adb_wait_for_sideload(bin_path=bin_path):
+    for line in adb_wait_for_sideload(bin_path=bin_path, serial=serial):
         yield line
 
 
 @add_logging("Wait for device")
-def adb_wait_for_device(bin_path: Path) -> TerminalResponse:
+def adb_wait_for_device(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Use adb to wait for the device to become available."""
-    for line in run_command("adb -d wait-for-device", bin_path):
+    for line in run_command("adb -d wait-for-device", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Wait for recovery")
-def adb_wait_for_recovery(bin_path: Path) -> TerminalResponse:
+def adb_wait_for_recovery(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Use adb to wait for the recovery to become available."""
-    for line in run_command("adb -d wait-for-recovery", bin_path):
+    for line in run_command("adb -d wait-for-recovery", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Wait for sideload")
-def adb_wait_for_sideload(bin_path: Path) -> TerminalResponse:
+def adb_wait_for_sideload(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Use adb to wait for the sideload to become available."""
-    for line in run_command("adb -d wait-for-sideload", bin_path):
+    for line in run_command("adb -d wait-for-sideload", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Reboot to recovery with adb")
-def adb_reboot_recovery(bin_path: Path) -> TerminalResponse:
+def adb_reboot_recovery(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Reboot to recovery with adb."""
-    for line in run_command("adb -d reboot recovery", bin_path):
+    for line in run_command("adb -d reboot recovery", bin_path, serial=serial):
         yield line
-    for line in adb_wait_for_recovery(bin_path=bin_path):
+    for line in adb_wait_for_recovery(bin_path=bin_path, serial=serial):
         yield line
 
 
-def adb_twrp_copy_partitions(bin_path: Path, config_path: Path) -> TerminalResponse:
+def adb_twrp_copy_partitions(
+    bin_path: Path,
+    config_path: Path,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
     # some devices like one plus 6t or motorola moto g7 power need the partitions copied to prevent a hard brick
     logger.info("Sideload copy_partitions script with adb.")
     # activate sideload
-    for line in activate_sideload(bin_path):
+    for line in activate_sideload(bin_path, serial=serial):
         yield line
     # now sideload the script
     logger.info("Sideload the copy_partitions script")
     for line in adb_sideload(
         bin_path=bin_path,
         target=f"{config_path.parent.joinpath(Path('copy-partitions-20220613-signed.zip'))}",
+        serial=serial,
     ):
         yield line
-    sleep(10)
+    # the script runs on the device, afterwards TWRP is back in recovery mode
+    if not wait_for_device_state(
+        bin_path, "recovery", timeout=30, serial=serial, cancel_event=cancel_event
+    ):
+        # cancelled or the device didn't get there in time
+        yield False
+        return
     # reboot into the bootloader again
-    for line in adb_reboot_bootloader(bin_path):
+    for line in adb_reboot_bootloader(
+        bin_path, serial=serial, cancel_event=cancel_event
+    ):
         yield line
     # Copy partitions end #
     yield True
 
 
 @add_logging("Perform a factory reset with adb and twrp.", return_if_fail=True)
-def adb_twrp_format_data(bin_path: Path) -> TerminalResponse:
+def adb_twrp_format_data(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
     """Perform a factory reset with twrp and adb.
 
     If `format data` fails (for example because of old TWRP versions) we fall back to `wipe data`.
     """
     unknown_command = False
-    for line in run_command("adb -d shell twrp format data", bin_path):
+    for line in run_command("adb -d shell twrp format data", bin_path, serial=serial):
         if isinstance(line, str) and ("Unrecognized script command" in line):
             unknown_command = True
         yield line
@@ -204,15 +396,24 @@ def adb_twrp_format_data(bin_path: Path) -> TerminalResponse:
         logger.info(
             "Factory reset with `adb twrp format data` failed. Trying `adb twrp wipe data` now."
         )
-        sleep(1)
-        for line in adb_twrp_wipe_partition(bin_path=bin_path, partition="data"):
+        # TWRP stays in recovery, but needs a moment before it accepts the next command
+        if not pause(1, cancel_event):
+            yield False
+            return
+        for line in adb_twrp_wipe_partition(
+            bin_path=bin_path, partition="data", serial=serial
+        ):
             yield line
 
 
 @add_logging("Wipe the selected partition with adb and twrp.", return_if_fail=True)
-def adb_twrp_wipe_partition(bin_path: Path, partition: str) -> TerminalResponse:
+def adb_twrp_wipe_partition(
+    bin_path: Path, partition: str, serial: Optional[str] = None
+) -> TerminalResponse:
     """Perform a factory reset with twrp and adb."""
-    for line in run_command(f"adb -d shell twrp wipe {partition}", bin_path):
+    for line in run_command(
+        f"adb -d shell twrp wipe {partition}", bin_path, serial=serial
+    ):
         yield line
 
 
@@ -223,192 +424,267 @@ def adb_twrp_wipe_and_install(
     is_ab: bool,
     install_addons=True,
     recovery: Optional[str] = None,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
 ) -> TerminalResponse:
     """Wipe and format data with twrp, then flash os image with adb.
 
-    Only works for twrp recovery.
+    Only works for twrp recovery. Waiting for the device stops once the `cancel_event` is set.
     """
     logger.info("Wipe and format data with twrp, then install os image.")
-    for line in adb_wait_for_recovery(bin_path):
+    for line in adb_wait_for_recovery(bin_path, serial=serial):
         yield line
 
     # now perform a factory reset
-    for line in adb_twrp_format_data(bin_path):
+    for line in adb_twrp_format_data(
+        bin_path, serial=serial, cancel_event=cancel_event
+    ):
         yield line
 
-    sleep(1)
+    # TWRP stays in recovery after a wipe, but needs a moment before it accepts the next command
+    if not pause(1, cancel_event):
+        yield False
+        return
     # wipe some partitions
     for partition in ["cache", "system"]:
-        for line in adb_twrp_wipe_partition(bin_path=bin_path, partition=partition):
+        for line in adb_twrp_wipe_partition(
+            bin_path=bin_path, partition=partition, serial=serial
+        ):
             yield line
-        sleep(1)
+        if not pause(1, cancel_event):
+            yield False
+            return
 
     # activate sideload
     logger.info("Wiping is done, now activate sideload.")
-    for line in activate_sideload(bin_path=bin_path):
+    for line in activate_sideload(bin_path=bin_path, serial=serial):
         yield line
     # now flash os image
     logger.info("Sideload and install os image.")
-    for line in adb_sideload(bin_path=bin_path, target=target):
+    for line in adb_sideload(bin_path=bin_path, target=target, serial=serial):
         yield line
-    # wipe some cache partitions
-    sleep(7)
+    # wipe some cache partitions once TWRP is back from sideload mode
+    if not wait_for_device_state(
+        bin_path, "recovery", timeout=30, serial=serial, cancel_event=cancel_event
+    ):
+        # cancelled or the device didn't get there in time
+        yield False
+        return
     for partition in ["dalvik", "cache"]:
-        for line in run_command(f"adb shell twrp wipe {partition}", bin_path):
+        for line in run_command(
+            f"adb shell twrp wipe {partition}", bin_path, serial=serial
+        ):
             yield line
-        sleep(3)
         if isinstance(line, bool) and not line:
             logger.error(f"Wiping {partition} failed.")
             # TODO: if this fails, a fix can be to just sideload something and then adb reboot
             for line in adb_sideload(
                 target=f"{config_path.parent.joinpath(Path('helper.txt'))}",
                 bin_path=bin_path,
+                serial=serial,
             ):
                 yield line
-            sleep(1)
             if isinstance(line, bool) and not line:
                 yield False
+            # TWRP is back in recovery once the helper file was sideloaded
+            if not wait_for_device_state(
+                bin_path,
+                "recovery",
+                timeout=10,
+                serial=serial,
+                cancel_event=cancel_event,
+            ):
+                yield False
+                return
             break
-        sleep(2)
+        if not wait_for_device_state(
+            bin_path, "recovery", timeout=10, serial=serial, cancel_event=cancel_event
+        ):
+            yield False
+            return
     # finally reboot into os or to fastboot for flashing addons
-    for line in adb_wait_for_recovery(bin_path):
+    for line in adb_wait_for_recovery(bin_path, serial=serial):
         yield line
     if install_addons:
         if is_ab:
             # reboot into the bootloader again
-            for line in adb_reboot_bootloader(bin_path):
+            for line in adb_reboot_bootloader(
+                bin_path, serial=serial, cancel_event=cancel_event
+            ):
                 yield line
-            sleep(3)
             # boot to TWRP again
             for line in fastboot_boot_recovery(
-                bin_path=bin_path, recovery=recovery, is_ab=is_ab
+                bin_path=bin_path, recovery=recovery, is_ab=is_ab, serial=serial
             ):
                 yield line
         else:
             # if not an a/b-device just stay in twrp
             pass
     else:
-        for line in adb_reboot(bin_path=bin_path):
+        for line in adb_reboot(bin_path=bin_path, serial=serial):
             yield line
 
 
 def adb_twrp_install_addon(
-    bin_path: Path, addon_path: str, is_ab: bool
+    bin_path: Path,
+    addon_path: str,
+    is_ab: bool,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
 ) -> TerminalResponse:
     """Flash addon through adb and twrp.
 
-    Only works for twrp recovery.
+    Only works for twrp recovery. Waiting for the device stops once the `cancel_event` is set.
     """
     logger.info(f"Install addon {addon_path} with twrp.")
-    sleep(0.5)
-    if is_ab:
-        adb_wait_for_recovery(bin_path=bin_path)
+    if not wait_for_device_state(
+        bin_path, "recovery", timeout=30, serial=serial, cancel_event=cancel_event
+    ):
+        # cancelled or the device didn't get there in time
+        yield False
+        return
     # activate sideload
     logger.info("Activate sideload.")
-    for line in activate_sideload(bin_path=bin_path):
+    for line in activate_sideload(bin_path=bin_path, serial=serial):
         yield line
     logger.info("Sideload and install addon.")
     # now flash the addon
-    for line in adb_sideload(bin_path=bin_path, target=addon_path):
+    for line in adb_sideload(bin_path=bin_path, target=addon_path, serial=serial):
         yield line
     logger.info("done.")
 
 
-def adb_twrp_finish_install_addons(bin_path: Path, is_ab: bool) -> TerminalResponse:
+def adb_twrp_finish_install_addons(
+    bin_path: Path,
+    is_ab: bool,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
     """Finish the process of flashing addons with TWRP and reboot.
 
-    Only works for twrp recovery.
+    Only works for twrp recovery. Waiting for the device stops once the `cancel_event` is set.
     """
-    sleep(3)
-    for line in adb_wait_for_recovery(bin_path):
+    for line in adb_wait_for_recovery(bin_path, serial=serial):
         yield line
     # finally reboot into os
     if is_ab:
         logger.info("Switch partitions on a/b-partitioned device.")
         # reboot into the bootloader again
-        for line in adb_reboot_bootloader(bin_path=bin_path):
+        for line in adb_reboot_bootloader(
+            bin_path=bin_path, serial=serial, cancel_event=cancel_event
+        ):
             yield line
-        # switch active boot partition
-        for line in fastboot_switch_partition(bin_path=bin_path):
+        # switch active boot partition; the bootloader needs a moment after switching
+        for line in fastboot_switch_partition(bin_path=bin_path, serial=serial):
             yield line
-        sleep(1)
-        for line in fastboot_switch_partition(bin_path=bin_path):
+        if not pause(1, cancel_event):
+            yield False
+            return
+        for line in fastboot_switch_partition(bin_path=bin_path, serial=serial):
             yield line
-        sleep(1)
+        if not pause(1, cancel_event):
+            yield False
+            return
         # reboot with fastboot
         logger.info("Reboot into OS.")
-        for line in fastboot_reboot(bin_path=bin_path):
+        for line in fastboot_reboot(bin_path=bin_path, serial=serial):
             yield line
     else:
         # reboot with adb
         logger.info("Reboot into OS.")
-        for line in adb_reboot(bin_path=bin_path):
+        for line in adb_reboot(bin_path=bin_path, serial=serial):
             yield line
 
 
 @add_logging("Wait for bootloader")
-def fastboot_wait_for_bootloader(bin_path: Path) -> TerminalResponse:
-    """Use adb to wait for the bootloader to become available."""
-    for line in run_command("fastboot devices", bin_path):
+def fastboot_wait_for_bootloader(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> TerminalResponse:
+    """Wait for the bootloader to become available and list it with fastboot."""
+    if not wait_for_device_state(
+        bin_path, "bootloader", timeout=60, serial=serial, cancel_event=cancel_event
+    ):
+        # cancelled or the device didn't get there in time
+        yield False
+        return
+    for line in run_command("fastboot devices", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Switch active boot partitions.", return_if_fail=True)
-def fastboot_switch_partition(bin_path: Path) -> TerminalResponse:
+def fastboot_switch_partition(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Switch the active boot partition with fastboot."""
-    for line in run_command("fastboot set_active other", bin_path):
+    for line in run_command("fastboot set_active other", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Unlock the device with fastboot and code.")
-def fastboot_unlock_with_code(bin_path: Path, unlock_code: str) -> TerminalResponse:
+def fastboot_unlock_with_code(
+    bin_path: Path, unlock_code: str, serial: Optional[str] = None
+) -> TerminalResponse:
     """Unlock the device with fastboot and code given."""
-    for line in run_command(f"fastboot oem unlock {unlock_code}", bin_path):
+    for line in run_command(
+        f"fastboot oem unlock {unlock_code}", bin_path, serial=serial
+    ):
         yield line
 
 
 @add_logging("Unlock the device with fastboot without code.")
-def fastboot_unlock(bin_path: Path) -> TerminalResponse:
+def fastboot_unlock(bin_path: Path, serial: Optional[str] = None) -> TerminalResponse:
     """Unlock the device with fastboot and without code."""
-    for line in run_command("fastboot flashing unlock", bin_path):
+    for line in run_command("fastboot flashing unlock", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Critically unlocking the device with fastboot without code.")
-def fastboot_unlock_critical(bin_path: Path) -> TerminalResponse:
+def fastboot_unlock_critical(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Unlock critical the device with fastboot and without code."""
-    for line in run_command("fastboot flashing unlock_critical", bin_path):
+    for line in run_command(
+        "fastboot flashing unlock_critical", bin_path, serial=serial
+    ):
         yield line
 
 
 @add_logging("OEM unlocking the device with fastboot.")
-def fastboot_oem_unlock(bin_path: Path) -> TerminalResponse:
+def fastboot_oem_unlock(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """OEM unlock the device with fastboot and without code."""
-    for line in run_command("fastboot oem unlock", bin_path):
+    for line in run_command("fastboot oem unlock", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Get unlock data with fastboot")
-def fastboot_get_unlock_data(bin_path: Path) -> TerminalResponse:
+def fastboot_get_unlock_data(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Get the unlock data with fastboot"""
-    for line in run_command("fastboot oem get_unlock_data", bin_path):
+    for line in run_command("fastboot oem get_unlock_data", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Rebooting device with fastboot.")
-def fastboot_reboot(bin_path: Path) -> TerminalResponse:
+def fastboot_reboot(bin_path: Path, serial: Optional[str] = None) -> TerminalResponse:
     """Reboot with fastboot"""
-    for line in run_command("fastboot reboot", bin_path):
+    for line in run_command("fastboot reboot", bin_path, serial=serial):
         yield line
 
 
 @add_logging("Boot custom recovery with fastboot.")
 def fastboot_boot_recovery(
-    bin_path: Path, recovery: str, is_ab: bool = True
+    bin_path: Path, recovery: str, is_ab: bool = True, serial: Optional[str] = None
 ) -> TerminalResponse:
     """Temporarily, boot custom recovery with fastboot."""
     logger.info("Boot custom recovery with fastboot.")
-    for line in run_command("fastboot boot", target=f"{recovery}", bin_path=bin_path):
+    for line in run_command(
+        "fastboot boot", target=f"{recovery}", bin_path=bin_path, serial=serial
+    ):
         yield line
     if not is_ab:
         if isinstance(line, bool) and not line:
@@ -416,15 +692,17 @@ def fastboot_boot_recovery(
             yield False
         else:
             yield True
-    for line in adb_wait_for_recovery(bin_path=bin_path):
+    for line in adb_wait_for_recovery(bin_path=bin_path, serial=serial):
         yield line
 
 
-def fastboot_flash_boot(bin_path: Path, recovery: str) -> TerminalResponse:
+def fastboot_flash_boot(
+    bin_path: Path, recovery: str, serial: Optional[str] = None
+) -> TerminalResponse:
     """Flash custom recovery with fastboot to boot partition."""
     logger.info("Flash custom recovery with fastboot.")
     for line in run_command(
-        "fastboot flash boot", target=f"{recovery}", bin_path=bin_path
+        "fastboot flash boot", target=f"{recovery}", bin_path=bin_path, serial=serial
     ):
         yield line
     if isinstance(line, bool) and not line:
@@ -434,9 +712,9 @@ def fastboot_flash_boot(bin_path: Path, recovery: str) -> TerminalResponse:
         yield True
     # reboot
     logger.info("Boot into TWRP with fastboot.")
-    for line in run_command("fastboot reboot", bin_path):
+    for line in run_command("fastboot reboot", bin_path, serial=serial):
         yield line
-    for line in adb_wait_for_recovery(bin_path=bin_path):
+    for line in adb_wait_for_recovery(bin_path=bin_path, serial=serial):
         yield line
     if isinstance(line, bool) and not line:
         logger.error("Booting recovery failed.")
@@ -454,11 +732,13 @@ def fastboot_flash_recovery(
     dtbo: Optional[str] = None,
     vbmeta: Optional[str] = None,
     super_empty: Optional[str] = None,
+    serial: Optional[str] = None,
 ) -> TerminalResponse:
     """Flash custom recovery with fastboot.
 
     If necessary, flash additional partitions (dtbo, vbmeta, super_empty) with fastboot before.
     """
+    progress = TransferProgress([dtbo, vbmeta, super_empty, vendor_boot, recovery])
     if any([dtbo, vbmeta, super_empty, vendor_boot]):
         for line in fastboot_flash_additional_partitions(
             bin_path=bin_path,
@@ -467,11 +747,17 @@ def fastboot_flash_recovery(
             super_empty=super_empty,
             vendor_boot=vendor_boot,
             is_ab=is_ab,
+            serial=serial,
+            progress=progress,
         ):
             yield line
 
-    for line in run_command(
-        "fastboot flash recovery ", target=f"{recovery}", bin_path=bin_path
+    for line in run_flash_command(
+        "fastboot flash recovery",
+        bin_path=bin_path,
+        image=recovery,
+        progress=progress,
+        serial=serial,
     ):
         yield line
     if not is_ab:
@@ -483,13 +769,15 @@ def fastboot_flash_recovery(
 
 
 @add_logging("Rebooting device to recovery.")
-def fastboot_reboot_recovery(bin_path: Path) -> TerminalResponse:
+def fastboot_reboot_recovery(
+    bin_path: Path, serial: Optional[str] = None
+) -> TerminalResponse:
     """Reboot to recovery with fastboot.
 
     Currently, it should only be used with Xiaomi devices.
     WARNING: On some devices, users need to press a specific key combo to make it work.
     """
-    for line in run_command("fastboot reboot-recovery", bin_path):
+    for line in run_command("fastboot reboot-recovery", bin_path, serial=serial):
         yield line
 
 
@@ -501,13 +789,24 @@ def fastboot_flash_additional_partitions(
     super_empty: Optional[str],
     vendor_boot: Optional[str],
     is_ab: bool = True,
+    serial: Optional[str] = None,
+    progress: Optional[TransferProgress] = None,
 ) -> TerminalResponse:
-    """Flash additional partitions (dtbo, vbmeta, super_empty) with fastboot."""
+    """Flash additional partitions (dtbo, vbmeta, super_empty) with fastboot.
+
+    The progress of the transfer is tracked with `progress`, if given, or over the given images.
+    """
     logger.info("Flash additional partitions with fastboot.")
+    if progress is None:
+        progress = TransferProgress([dtbo, vbmeta, super_empty, vendor_boot])
     if dtbo:
         logger.info("dtbo selected. Flashing dtbo partition.")
-        for line in run_command(
-            "fastboot flash dtbo ", target=f"{dtbo}", bin_path=bin_path
+        for line in run_flash_command(
+            "fastboot flash dtbo",
+            bin_path=bin_path,
+            image=dtbo,
+            progress=progress,
+            serial=serial,
         ):
             yield line
         if not is_ab:
@@ -521,10 +820,12 @@ def fastboot_flash_additional_partitions(
 
     if vbmeta:
         logger.info("vbmeta selected. Flashing vbmeta partition.")
-        for line in run_command(
-            "fastboot --disable-verity --disable-verification flash vbmeta ",
-            target=f"{vbmeta}",
+        for line in run_flash_command(
+            "fastboot --disable-verity --disable-verification flash vbmeta",
             bin_path=bin_path,
+            image=vbmeta,
+            progress=progress,
+            serial=serial,
         ):
             yield line
         if not is_ab:
@@ -536,8 +837,12 @@ def fastboot_flash_additional_partitions(
 
     if super_empty:
         logger.info("super_empty selected. Wiping super partition.")
-        for line in run_command(
-            "fastboot wipe-super ", target=f"{super_empty}", bin_path=bin_path
+        for line in run_flash_command(
+            "fastboot wipe-super",
+            bin_path=bin_path,
+            image=super_empty,
+            progress=progress,
+            serial=serial,
         ):
             yield line
         if not is_ab:
@@ -549,8 +854,12 @@ def fastboot_flash_additional_partitions(
 
     if vendor_boot:
         logger.info("vendor_boot selected. Flashing vendor_boot partition.")
-        for line in run_command(
-            "fastboot flash vendor_boot ", target=f"{vendor_boot}", bin_path=bin_path
+        for line in run_flash_command(
+            "fastboot flash vendor_boot",
+            bin_path=bin_path,
+            image=vendor_boot,
+            progress=progress,
+            serial=serial,
         ):
             yield line
         if not is_ab:
@@ -561,25 +870,280 @@ def fastboot_flash_additional_partitions(
                 yield True
 
 
-def heimdall_wait_for_download_available(bin_path: Path) -> bool:
-    """Use heimdall detect to wait for download mode to become available on the device."""
+def heimdall_wait_for_download_available(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    timeout: float = 300,
+    cancel_event: Optional[threading.Event] = None,
+) -> bool:
+    """Wait for download mode to become available on the device.
+
+    On Linux the USB devices are watched through sysfs for a Samsung device in download mode.
+    Elsewhere `heimdall detect` is run every second. Gives up after `timeout` seconds or once the
+    `cancel_event` is set.
+    """
     logger.info("Wait for download mode to become available.")
-    while True:
-        sleep(1)
-        for line in run_command("heimdall detect", bin_path=bin_path):
+    if usb_sysfs_available():
+        return wait_for_usb_device(
+            SAMSUNG_VENDOR_ID,
+            SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+            timeout=timeout,
+            cancel_event=cancel_event,
+        )
+    cancel_event = cancel_event or threading.Event()
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        for line in run_command(
+            "heimdall detect", bin_path=bin_path, serial=serial, enable_logging=False
+        ):
             if isinstance(line, bool) and line:
                 return True
+        if cancel_event.wait(1):
+            logger.info("Stopped waiting for download mode.")
+            return False
+    logger.error(f"Download mode did not become available within {timeout}s.")
+    return False
 
 
 @add_logging("Flash custom recovery with heimdall.")
-def heimdall_flash_recovery(bin_path: Path, recovery: str) -> TerminalResponse:
+def heimdall_flash_recovery(
+    bin_path: Path, recovery: str, serial: Optional[str] = None
+) -> TerminalResponse:
     """Temporarily, flash custom recovery with heimdall."""
-    for line in run_command(
-        "heimdall flash --no-reboot --RECOVERY", target=f"{recovery}", bin_path=bin_path
+    for line in run_flash_command(
+        "heimdall flash --no-reboot --RECOVERY",
+        bin_path=bin_path,
+        image=recovery,
+        serial=serial,
     ):
         yield line
 
 
+def get_command_functions(
+    bin_path: Path,
+    config_path: Path,
+    is_ab: bool,
+    image: Optional[str] = None,
+    recovery: Optional[str] = None,
+    dtbo: Optional[str] = None,
+    vbmeta: Optional[str] = None,
+    super_empty: Optional[str] = None,
+    vendor_boot: Optional[str] = None,
+    unlock_code: Optional[str] = None,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Dict[str, Callable[[], TerminalResponse]]:
+    """Get the functions to run for the commands of the config steps, with all arguments bound.
+
+    The `cancel_event` stops the commands waiting for the device once it is set.
+    """
+    commands: Dict[str, Callable[..., TerminalResponse]] = {
+        "adb_reboot": adb_reboot,
+        "adb_reboot_bootloader": partial(
+            adb_reboot_bootloader, cancel_event=cancel_event
+        ),
+        "adb_reboot_download": partial(adb_reboot_download, cancel_event=cancel_event),
+        "adb_reboot_recovery": adb_reboot_recovery,
+        "adb_sideload": partial(adb_sideload, target=image),
+        "adb_twrp_copy_partitions": partial(
+            adb_twrp_copy_partitions,
+            config_path=config_path,
+            cancel_event=cancel_event,
+        ),
+        "adb_twrp_wipe_and_install": partial(
+            adb_twrp_wipe_and_install,
+            target=image,
+            config_path=config_path,
+            is_ab=is_ab,
+            install_addons=False,
+            recovery=recovery,
+            cancel_event=cancel_event,
+        ),
+        "fastboot_unlock": fastboot_unlock,
+        "fastboot_unlock_critical": fastboot_unlock_critical,
+        "fastboot_unlock_with_code": partial(
+            fastboot_unlock_with_code, unlock_code=unlock_code
+        ),
+        "fastboot_oem_unlock": fastboot_oem_unlock,
+        "fastboot_get_unlock_data": fastboot_get_unlock_data,
+        "fastboot_boot_recovery": partial(
+            fastboot_boot_recovery, recovery=recovery, is_ab=is_ab
+        ),
+        "fastboot_flash_boot": partial(fastboot_flash_boot, recovery=recovery),
+        "fastboot_flash_recovery": partial(
+            fastboot_flash_recovery,
+            recovery=recovery,
+            is_ab=is_ab,
+            dtbo=dtbo,
+            vbmeta=vbmeta,
+            super_empty=super_empty,
+            vendor_boot=vendor_boot,
+        ),
+        "fastboot_reboot_recovery": fastboot_reboot_recovery,
+        "fastboot_flash_additional_partitions": partial(
+            fastboot_flash_additional_partitions,
+            dtbo=dtbo,
+            vbmeta=vbmeta,
+            super_empty=super_empty,
+            vendor_boot=vendor_boot,
+            is_ab=is_ab,
+        ),
+        "fastboot_reboot": fastboot_reboot,
+        "heimdall_flash_recovery": partial(heimdall_flash_recovery, recovery=recovery),
+    }
+    return {
+        command: partial(function, bin_path=bin_path, serial=serial)
+        for command, function in commands.items()
+    }
+
+
+# properties read from the device in a single `adb shell` call
+DEVICE_PROPERTIES = (
+    "ro.serialno",
+    "ro.product.device",
+    "ro.product.vendor.device",
+    "ro.build.version.release",
+    "ro.build.version.sdk",
+    "ro.build.version.incremental",
+    "ro.build.display.id",
+    "ro.build.id",
+    "ro.boot.slot_suffix",
+    "ro.boot.flash.locked",
+    "ro.boot.vbmeta.device_state",
+)
+# values which are not system properties, with the shell command reading them on the device
+DEVICE_VALUES = {
+    "battery.level": "dumpsys battery 2>/dev/null | sed -n 's/^ *level: *//p'",
+}
+# getprop output format: [ro.product.device]: [sargo]
+PROPERTY_PATTERN = re.compile(r"^\[([^\]]+)\]: \[(.*)\]$")
+
+# properties of the devices by serial, read once per session
+_property_cache: Dict[str, "DeviceProperties"] = {}
+_property_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class DeviceProperties:
+    """Properties of a connected device.
+
+    Attributes:
+        serial: Serial number of the device.
+        values: All properties read from the device by name; missing ones are empty strings.
+    """
+
+    serial: Optional[str]
+    values: Dict[str, str]
+
+    def get(self, name: str) -> Optional[str]:
+        """Get the value of a property or None if the device doesn't have it."""
+        return self.values.get(name) or None
+
+    @property
+    def device_code(self) -> Optional[str]:
+        return self.get("ro.product.device") or self.get("ro.product.vendor.device")
+
+    @property
+    def android_version(self) -> Optional[str]:
+        return self.get("ro.build.version.release")
+
+    @property
+    def sdk_version(self) -> Optional[int]:
+        return _to_int(self.get("ro.build.version.sdk"))
+
+    @property
+    def slot_suffix(self) -> Optional[str]:
+        return self.get("ro.boot.slot_suffix")
+
+    @property
+    def battery_level(self) -> Optional[int]:
+        return _to_int(self.get("battery.level"))
+
+    @property
+    def bootloader_locked(self) -> Optional[bool]:
+        """True if the bootloader is locked, None if the device doesn't tell."""
+        flash_locked = self.get("ro.boot.flash.locked")
+        if flash_locked in ("0", "1"):
+            return flash_locked == "1"
+        device_state = self.get("ro.boot.vbmeta.device_state")
+        if device_state in ("locked", "unlocked"):
+            return device_state == "locked"
+        return None
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)  # type: ignore
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_properties(output: str) -> Dict[str, str]:
+    """Parse properties in the output format of `getprop`."""
+    values = {}
+    for line in output.splitlines():
+        result = PROPERTY_PATTERN.match(line.strip())
+        if result:
+            values[result.group(1)] = result.group(2).strip()
+    return values
+
+
+def property_command(names: Iterable[str] = DEVICE_PROPERTIES) -> str:
+    """Build the shell command printing the given properties and values in the format of `getprop`."""
+    commands = [f'echo "[{name}]: [$(getprop {name})]"' for name in names]
+    commands += [
+        f'echo "[{name}]: [$({command})]"' for name, command in DEVICE_VALUES.items()
+    ]
+    return "; ".join(commands)
+
+
+def get_device_properties(
+    bin_path: Path,
+    serial: Optional[str] = None,
+    platform: str = PLATFORM,
+    refresh: bool = False,
+) -> DeviceProperties:
+    """Read the properties of the connected device.
+
+    Only the properties in `DEVICE_PROPERTIES` are queried, all in one `adb shell` call. The
+    result is cached by serial for the session; pass `refresh=True` to read them again. Without
+    a serial, the only device connected via USB is queried.
+
+    Raises:
+        CalledProcessError: If adb fails, e.g. if no device is connected.
+    """
+    if serial and not refresh:
+        with _property_cache_lock:
+            cached = _property_cache.get(serial)
+        if cached:
+            return cached
+    adb = "adb.exe" if platform in ("windows", "win32") else "adb"
+    command = [
+        str(bin_path.joinpath(Path(adb))),
+        *(["-s", serial] if serial else []),
+        "shell",
+        property_command(),
+    ]
+    output = check_output(command, stderr=STDOUT).decode(errors="replace")
+    values = parse_properties(output)
+    properties = DeviceProperties(
+        serial=serial or values.get("ro.serialno") or None, values=values
+    )
+    if properties.serial:
+        with _property_cache_lock:
+            _property_cache[properties.serial] = properties
+    return properties
+
+
+def clear_property_cache(serial: Optional[str] = None):
+    """Forget the cached properties of the device with the serial or of all devices."""
+    with _property_cache_lock:
+        if serial is None:
+            _property_cache.clear()
+        else:
+            _property_cache.pop(serial, None)
+
+
 @dataclass(frozen=True)
 class SearchResult:
     """Result of the device search.
@@ -587,58 +1151,181 @@ class SearchResult:
     Attributes:
         device_code: The device code of the connected device.
         msg: Message describing the result.
+        properties: Properties of the connected device.
     """
 
     device_code: str = None
     msg: str = None
+    properties: Optional[DeviceProperties] = None
 
 
-def search_device(platform: str, bin_path: Path) -> SearchResult:
-    """Search for a connected device."""
+def search_device(
+    platform: str, bin_path: Path, serial: Optional[str] = None
+) -> SearchResult:
+    """Search for a connected device and read its properties."""
     logger.info(f"Search devices on {platform} with {bin_path}...")
     try:
-        # read device code
-        if platform in ("linux", "darwin"):
-            # run the command to get the device code
-            command = [
-                str(bin_path.joinpath(Path("adb"))),
-                "shell",
-                "getprop",
-                # "|",
-                # "grep",
-                # "ro.product.device",
-            ]
-            device_prop = check_output(
-                command,
-                stderr=STDOUT,
-            ).decode()
-            output = [
-                line for line in device_prop.split("\n") if "ro.product.device" in line
-            ][0]
-        elif platform in ("windows", "win32"):
-            # run the command to get the device code on windows
-            output = check_output(
-                [
-                    str(bin_path.joinpath(Path("adb.exe"))),
-                    "shell",
-                    "getprop",
-                    "|",
-                    "findstr",
-                    "ro.product.device",
-                ],
-                stderr=STDOUT,
-                shell=True,
-            ).decode()
-        else:
-            raise Exception(f"Unknown platform {platform}.")
-        device_code = output.split("[")[-1].strip()[:-1].strip()
-        logger.info(f"Found device code '{device_code}'")
-        return SearchResult(
-            device_code=device_code,
-            msg=f"Found device with device code '{device_code}'.",
+        # searching again reads the current state of the device
+        properties = get_device_properties(
+            bin_path, serial=serial, platform=platform, refresh=True
         )
     except CalledProcessError:
         logger.error("Failed to detect a device")
         return SearchResult(
             msg="Failed to detect a device. Connect to USB and try again."
         )
+    device_code = properties.device_code
+    if not device_code:
+        logger.error("Failed to read the device code")
+        return SearchResult(
+            msg="Failed to read the device code. Connect to USB and try again.",
+            properties=properties,
+        )
+    logger.info(f"Found device code '{device_code}'")
+    return SearchResult(
+        device_code=device_code,
+        msg=f"Found device with device code '{device_code}'.",
+        properties=properties,
+    )
+
+
+def list_devices(bin_path: Path) -> List[DeviceInfo]:
+    """List the devices connected in adb and fastboot mode.
+
+    Devices in fastboot mode are reported with the state `bootloader`.
+    """
+    devices = _list_tool_devices("adb", bin_path)
+    for device in _list_tool_devices("fastboot", bin_path):
+        devices.append(replace(device, state="bootloader"))
+    logger.info(f"Found devices: {[device.serial for device in devices]}")
+    return devices
+
+
+def _list_tool_devices(tool: str, bin_path: Path) -> List[DeviceInfo]:
+    """List the devices with `adb devices -l` or `fastboot devices -l`."""
+    output = []
+    try:
+        for line in run_command(f"{tool} devices -l", bin_path, enable_logging=False):
+            if isinstance(line, str) and not line.startswith("$"):
+                output.append(line)
+    except OSError as e:
+        logger.error(f"Failed to list devices with {tool}: {e}")
+    return parse_devices("\n".join(output))
+
+
+class DeviceStateWatcher:
+    """Watch the state of a device by tracking the device lists of adb and fastboot.
+
+    The adb device list is requested from a running adb server without spawning a process and
+    from `adb devices -l` otherwise. Devices in fastboot mode are reported in the state `bootloader`
+    and devices which are not listed at all in the state `disconnected`.
+
+    Args:
+        bin_path: Path to the directory with the tools.
+        serial: Serial of the device to watch. If not given, the first device found is watched.
+        poll_interval: Seconds between the first looks at the device lists. While the state of
+            the device stays the same, the interval grows up to `max_poll_interval`.
+        max_poll_interval: Maximal seconds between two looks at the device lists.
+        client: Client for the adb server.
+    """
+
+    def __init__(
+        self,
+        bin_path: Path,
+        serial: Optional[str] = None,
+        poll_interval: float = 0.25,
+        max_poll_interval: float = 2.0,
+        client: Optional[AdbClient] = None,
+    ):
+        self.bin_path = bin_path
+        self.serial = serial
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.client = client if client is not None else AdbClient(timeout=2)
+
+    def adb_states(self) -> Dict[str, str]:
+        """Get the state of all devices listed by adb by serial."""
+        try:
+            devices = self.client.devices()
+        except Exception:
+            # no adb server running, so use the adb binary which also starts one
+            devices = _list_tool_devices("adb", self.bin_path)
+        return {device.serial: device.state for device in devices}
+
+    def fastboot_states(self) -> Dict[str, str]:
+        """Get the state of all devices listed by fastboot by serial."""
+        return {
+            device.serial: "bootloader"
+            for device in _list_tool_devices("fastboot", self.bin_path)
+        }
+
+    def current_state(self, check_fastboot: bool = True) -> str:
+        """Get the current state of the watched device."""
+        state = self._select(self.adb_states())
+        if state == DISCONNECTED and check_fastboot:
+            state = self._select(self.fastboot_states())
+        return state
+
+    def wait_for(
+        self,
+        states: Union[str, Iterable[str]],
+        timeout: float,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> bool:
+        """Wait until the device is in one of the given states.
+
+        Returns:
+            True if the state was reached before the timeout, False otherwise or if waiting was
+            cancelled with the `cancel_event`.
+        """
+        cancel_event = cancel_event or threading.Event()
+        states = {states} if isinstance(states, str) else set(states)
+        # fastboot only needs to be checked if a bootloader state could be the target
+        check_fastboot = "bootloader" in states or DISCONNECTED in states
+        deadline = monotonic() + timeout
+        interval = self.poll_interval
+        last_state = None
+        while True:
+            state = self.current_state(check_fastboot=check_fastboot)
+            if state in states:
+                logger.info(f"Device is in state '{state}'.")
+                return True
+            if monotonic() >= deadline:
+                logger.warning(
+                    f"Device did not reach any of the states {sorted(states)} within {timeout}s. Current state: '{state}'."
+                )
+                return False
+            # a reboot takes many seconds, so look less often while nothing happens, which
+            # spawns less adb and fastboot processes, but look closely again once the state changes
+            if state != last_state:
+                interval = self.poll_interval
+            else:
+                interval = min(interval * 1.5, self.max_poll_interval)
+            last_state = state
+            if cancel_event.wait(min(interval, max(deadline - monotonic(), 0))):
+                logger.info(f"Stopped waiting for the states {sorted(states)}.")
+                return False
+
+    def _select(self, states: Dict[str, str]) -> str:
+        if self.serial:
+            return states.get(self.serial, DISCONNECTED)
+        return next(iter(states.values()), DISCONNECTED)
+
+
+def wait_for_device_state(
+    bin_path: Path,
+    states: Union[str, Iterable[str]],
+    timeout: float,
+    serial: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> bool:
+    """Wait until the device is in one of the given states or the timeout is reached.
+
+    Waiting stops early once the `cancel_event` is set.
+
+    Returns:
+        True if the device reached one of the states; a timeout or cancelling is a failure.
+    """
+    return DeviceStateWatcher(bin_path=bin_path, serial=serial).wait_for(
+        states, timeout=timeout, cancel_event=cancel_event
+    )
@@ -0,0 +1,138 @@
+"""This module contains functions to detect USB devices without spawning any tools."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import select
+import socket
+import threading
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Iterable, List, Optional
+
+from loguru import logger
+
+SYSFS_USB_DEVICES = Path("/sys/bus/usb/devices")
+
+# Samsung devices in download (odin) mode
+SAMSUNG_VENDOR_ID = "04e8"
+SAMSUNG_DOWNLOAD_PRODUCT_IDS = ("685d", "68c3")
+
+# netlink protocol and multicast group of kernel uevents
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+
+
+def usb_sysfs_available(sysfs_root: Path = SYSFS_USB_DEVICES) -> bool:
+    """Check if USB devices can be detected with sysfs."""
+    return sysfs_root.is_dir()
+
+
+def find_usb_devices(
+    vendor_id: str,
+    product_ids: Iterable[str],
+    sysfs_root: Path = SYSFS_USB_DEVICES,
+) -> List[str]:
+    """Find connected USB devices with the given vendor and product ids in sysfs.
+
+    Returns:
+        Names of the matching devices in sysfs like `1-1.2`.
+    """
+    product_ids = {product_id.lower() for product_id in product_ids}
+    devices = []
+    try:
+        device_dirs = list(sysfs_root.iterdir())
+    except OSError:
+        return devices
+    for device_dir in device_dirs:
+        try:
+            device_vendor = device_dir.joinpath("idVendor").read_text().strip()
+            device_product = device_dir.joinpath("idProduct").read_text().strip()
+        except OSError:
+            # interfaces and hubs without ids
+            continue
+        if device_vendor.lower() == vendor_id.lower() and (
+            device_product.lower() in product_ids
+        ):
+            devices.append(device_dir.name)
+    return devices
+
+
+def _open_uevent_socket() -> Optional[socket.socket]:
+    """Open a netlink socket receiving kernel uevents, if possible on this system."""
+    if not hasattr(socket, "AF_NETLINK"):
+        return None
+    try:
+        sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT
+        )
+        sock.bind((0, UEVENT_KERNEL_GROUP))
+        sock.setblocking(False)
+        return sock
+    except OSError as e:
+        logger.info(f"Can't listen to uevents, polling USB devices instead: {e}")
+        return None
+
+
+def wait_for_usb_device(
+    vendor_id: str,
+    product_ids: Iterable[str],
+    timeout: float,
+    sysfs_root: Path = SYSFS_USB_DEVICES,
+    poll_interval: float = 0.5,
+    cancel_event: Optional[threading.Event] = None,
+    use_uevents: bool = True,
+) -> bool:
+    """Wait until a USB device with the given vendor and product ids is connected.
+
+    Sysfs is checked again whenever the kernel reports a uevent and at least every `poll_interval`
+    seconds, so the function returns right after the device appears.
+
+    Args:
+        vendor_id: USB vendor id as hex string.
+        product_ids: USB product ids as hex strings.
+        timeout: Seconds to wait at most.
+        sysfs_root: Directory listing the USB devices.
+        poll_interval: Seconds between two checks if no uevent arrives.
+        cancel_event: Event to stop waiting early.
+        use_uevents: Listen to kernel uevents if possible.
+
+    Returns:
+        True if the device was found, False if the timeout was reached or waiting was cancelled.
+    """
+    product_ids = tuple(product_ids)
+    deadline = monotonic() + timeout
+    sock = _open_uevent_socket() if use_uevents else None
+    try:
+        while True:
+            if find_usb_devices(vendor_id, product_ids, sysfs_root=sysfs_root):
+                return True
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                logger.warning(f"No USB device {vendor_id}:{product_ids} found.")
+                return False
+            if cancel_event and cancel_event.is_set():
+                logger.info("Stopped waiting for USB device.")
+                return False
+            wait_time = min(poll_interval, remaining)
+            if sock:
+                readable, _, _ = select.select([sock], [], [], wait_time)
+                if readable:
+                    # drain the queued events, sysfs is checked again anyway
+                    try:
+                        while sock.recv(8192):
+                            pass
+                    except BlockingIOError:
+                        pass
+            else:
+                sleep(wait_time)
+    finally:
+        if sock:
+            sock.close()
@@ -10,12 +10,15 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import os
+import sys
 import zipfile
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
 
-import requests
 from loguru import logger
 
 
@@ -40,24 +43,84 @@ class CheckResult:
     message: str
 
 
-def get_download_link(devicecode: str) -> Optional[str]:
-    """Check if a lineageOS version for this device exists on download.lineageos.com and return the respective download link."""
-    url = f"https://download.lineageos.org/api/v2/devices/{devicecode}"
-    try:
-        logger.info(f"Checking {url}")
-        # Get Url
-        res = requests.get(url, timeout=5)
-        # if the request succeeds
-        if res.status_code == 200:
-            download_url = f"https://download.lineageos.org/devices/{devicecode}/builds"
-            logger.info(f"{download_url} exists.")
-            return download_url
-        else:
-            logger.info(f"{url} doesn't exist, status_code: {res.status_code}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"{url} doesn't exist, error: {e}")
-        return None
+def get_cache_dir() -> Path:
+    """Get the directory to store persistent caches of the application in.
+
+    The location can be overwritten with the `OPENANDROIDINSTALLER_CACHE_DIR` environment variable.
+    The directory is not created by this function.
+    """
+    custom_dir = os.environ.get("OPENANDROIDINSTALLER_CACHE_DIR")
+    if custom_dir:
+        return Path(custom_dir)
+    if sys.platform == "win32":
+        base_dir = Path(os.environ.get("LOCALAPPDATA", Path.home()))
+        return base_dir.joinpath("openandroidinstaller", "cache")
+    if sys.platform == "darwin":
+        return Path.home().joinpath("Library", "Caches", "openandroidinstaller")
+    base_dir = Path(os.environ.get("XDG_CACHE_HOME", Path.home().joinpath(".cache")))
+    return base_dir.joinpath("openandroidinstaller")
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """Dataclass for the information read from an OS image zip file.
+
+    Attributes:
+        metadata: Content of the metadata file of the image.
+        entries: Names of all files in the zip.
+        has_payload: True if the image contains a `payload.bin`.
+        compressed_size: Size of all files in the zip.
+        uncompressed_size: Size of all files after extraction.
+    """
+
+    metadata: Dict[str, str]
+    entries: Tuple[str, ...]
+    has_payload: bool
+    compressed_size: int
+    uncompressed_size: int
+
+
+def inspect_image(image_path: str) -> ImageInfo:
+    """Read metadata, entries and sizes of an OS image zip in one pass.
+
+    The result is cached by path, size and modification time of the file, so selecting or
+    checking the same image again doesn't read the zip again.
+
+    Raises:
+        FileNotFoundError: If the image doesn't exist.
+        zipfile.BadZipFile: If the image is not a zip file.
+    """
+    stat = os.stat(image_path)
+    return _inspect_image(os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=16)
+def _inspect_image(image_path: str, size: int, mtime_ns: int) -> ImageInfo:
+    metapath = "META-INF/com/android/metadata"
+    # only the central directory at the end of the file and the metadata file are read
+    with zipfile.ZipFile(image_path) as image_zip:
+        infos = image_zip.infolist()
+        try:
+            raw_metadata = image_zip.read(metapath)
+        except KeyError:
+            logger.error(
+                f"Metadata file {metapath} not found in {Path(image_path).name}."
+            )
+            raw_metadata = b""
+    metadata = {}
+    for line in raw_metadata.decode("utf-8").splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            metadata[key] = value
+    entries = tuple(info.filename for info in infos)
+    logger.info(f"Inspected image {Path(image_path).name}.")
+    return ImageInfo(
+        metadata=metadata,
+        entries=entries,
+        has_payload="payload.bin" in entries,
+        compressed_size=sum(info.compress_size for info in infos),
+        uncompressed_size=sum(info.file_size for info in infos),
+    )
 
 
 def retrieve_image_metadata(image_path: str) -> dict:
@@ -69,24 +132,10 @@ def retrieve_image_metadata(image_path: str) -> dict:
     Returns:
         Dictionary containing the metadata.
     """
-    metapath = "META-INF/com/android/metadata"
     try:
-        with zipfile.ZipFile(image_path) as image_zip:
-            with image_zip.open(metapath, mode="r") as image_metadata:
-                metadata = image_metadata.readlines()
-            metadata_dict = {}
-            for line in metadata:
-                metadata_dict[line[: line.find(b"=")].decode("utf-8")] = line[
-                    line.find(b"=") + 1 : -1
-                ].decode("utf-8")
-            logger.info(f"Metadata retrieved from image {image_path.split('/')[-1]}.")
-            return metadata_dict
-    except zipfile.BadZipFile as e:
-        raise e
-    except (FileNotFoundError, KeyError):
-        logger.error(
-            f"Metadata file {metapath} not found in {image_path.split('/')[-1]}."
-        )
+        return dict(inspect_image(image_path).metadata)
+    except FileNotFoundError:
+        logger.error(f"Image file {image_path} not found.")
         return dict()
 
 
@@ -188,25 +237,3 @@ def recovery_works_with_device(
             CompatibilityStatus.INCOMPATIBLE,
             f"Recovery file {recovery_file_name} is not supported by device code in file name.",
         )
-
-
-def send_tracking_info(device_code: str, event: str):
-    # Plausible API endpoint for tracking events
-    url = "https://plausible.io/api/event"
-
-    # Prepare the JSON payload.
-    data = {
-        "name": event,
-        "url": "app://openandroidinstaller",
-        "domain": "openandroidinstaller.org",
-        "props": {"device_code": device_code},
-    }
-
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "Desktop-App",
-    }
-
-    # Send the POST request
-    _ = requests.post(url, json=data, headers=headers)
-    logger.info(f"Sent tracking event '{event}' for device '{device_code}'.")
@@ -51,6 +51,9 @@ class BaseView(Column):
             margin=margin.only(left=10, top=0, right=50, bottom=5),
         )
 
+    def release(self):
+        """Free the resources of the view once it won't be shown again."""
+
     def clear(
         self,
     ):
@@ -10,17 +10,25 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+from functools import partial
 from pathlib import Path
-from time import sleep
 from typing import Callable
 
 from app_state import AppState
 from flet import Column, ElevatedButton, Row, Switch, Colors, Icons
+from flow import CommandNode, FlowError
 from loguru import logger
 from styles import Markdown, Text
-from tooling import adb_reboot, adb_twrp_finish_install_addons, adb_twrp_install_addon
+from task_runner import TaskRunner
+from tooling import DISCONNECTED, wait_for_device_state
 from views import BaseView
-from widgets import ProgressIndicator, TerminalBox, confirm_button, get_title
+from widgets import (
+    ProgressIndicator,
+    TerminalBox,
+    cancel_button,
+    confirm_button,
+    get_title,
+)
 
 
 class InstallAddonsView(BaseView):
@@ -31,6 +39,12 @@ class InstallAddonsView(BaseView):
     ):
         super().__init__(state=state)
         self.on_confirm = on_confirm
+        # runs the installation in the background
+        self.task_runner = TaskRunner(cancel_event=self.state.cancel_event)
+
+    def release(self):
+        """Stop the thread running the commands."""
+        self.task_runner.shutdown()
 
     def build(self):
         """Create the content of the view."""
@@ -92,6 +106,7 @@ This might take a while. At the end your phone will boot into the new OS.
             expand=True,
             icon=Icons.DIRECTIONS_RUN_OUTLINED,
         )
+        self.cancel_button = cancel_button(lambda _: self.task_runner.cancel())
         # build the view
         self.right_view.controls.extend(
             [
@@ -101,7 +116,13 @@ This might take a while. At the end your phone will boot into the new OS.
                 Column(
                     [
                         self.advanced_switch,
-                        Row([self.install_button, self.confirm_button]),
+                        Row(
+                            [
+                                self.install_button,
+                                self.cancel_button,
+                                self.confirm_button,
+                            ]
+                        ),
                     ]
                 ),
                 Row([self.terminal_box]),
@@ -129,8 +150,15 @@ This might take a while. At the end your phone will boot into the new OS.
         """
         Run the addon installation process through twrp.
 
-        Some parts of the command are changed by placeholders.
+        The addon nodes of the install flow, compiled again with the selected addons, run.
         """
+        try:
+            install_flow = self.state.compile_install_flow()
+        except FlowError as e:
+            logger.error(f"Can't install the addons: {e}")
+            self.error_text.value = str(e)
+            self.right_view.update()
+            return
         # disable the call button while the command is running
         self.install_button.disabled = True
         self.error_text.value = ""
@@ -138,51 +166,68 @@ This might take a while. At the end your phone will boot into the new OS.
         # reset terminal output
         if self.state.advanced:
             self.terminal_box.clear()
+        self.cancel_button.disabled = False
         self.right_view.update()
 
-        # run the install script
-        for addon_num, addon_path in enumerate(self.state.addon_paths):
-            # reset the progress indicators
-            self.progress_indicator.clear()
-            # inform about the currently installed addon
-            self.addon_info_text.value = f"{addon_num + 1}/{len(self.state.addon_paths)}: Installing {Path(addon_path).name} ..."
-            self.right_view.update()
+        # run the addon nodes in the background; the first node installed the OS already
+        self.task_runner.start(
+            partial(
+                install_flow.run,
+                start=1,
+                on_node_start=self.show_node,
+                on_node_done=self.node_done,
+            ),
+            on_output=self.write_lines,
+            on_done=self.install_finished,
+        )
 
-            # install one addon at the time
-            for line in adb_twrp_install_addon(
-                addon_path=addon_path,
-                bin_path=self.state.bin_path,
-                is_ab=self.state.config.is_ab,
-            ):
-                # write the line to advanced output terminal
-                self.terminal_box.write_line(line)
-                # in case the install command is run, we want to update the progress bar
-                self.progress_indicator.display_progress_bar(line)
-                self.progress_indicator.update()
-            sleep(7)
-
-        if self.state.addon_paths:
-            # reboot after installing the addons; here we might switch partitions on ab-partitioned devices
-            for line in adb_twrp_finish_install_addons(
-                bin_path=self.state.bin_path,
-                is_ab=self.state.config.is_ab,
-            ):
-                self.terminal_box.write_line(line)
+    def show_node(self, node: CommandNode):
+        """Inform about the addon installed by the node."""
+        # reset the progress indicators
+        self.progress_indicator.clear()
+        if node.command == "adb_twrp_install_addon":
+            addon_num = node.index - 1
+            addon_path = self.state.addon_paths[addon_num]
+            self.addon_info_text.value = f"{addon_num + 1}/{len(self.state.addon_paths)}: Installing {Path(addon_path).name} ..."
         else:
-            logger.info("No addons selected. Rebooting to OS.")
-            for line in adb_reboot(bin_path=self.state.bin_path):
-                # write the line to advanced output terminal
-                self.terminal_box.write_line(line)
-        success = line  # the last element of the iterable is a boolean encoding success/failure
+            self.addon_info_text.value = node.step.content
+        self.right_view.update()
 
-        # update the view accordingly
+    def node_done(self, node: CommandNode, success: bool):
+        """Journal the completed node."""
+        if success and self.state.journal:
+            self.state.journal.record_install(node)
+
+    def write_lines(self, lines):
+        """Write the output lines to the terminal and update the progress bar."""
+        for line in lines:
+            # write the line to advanced output terminal
+            self.terminal_box.write_line(line)
+            # in case the install command is run, we want to update the progress bar
+            # the progress bar limits its own updates
+            self.progress_indicator.display_progress_bar(line)
+
+    def install_finished(self, success: bool):
+        """Update the view once the installation finished."""
+        if success:
+            # make sure the device left the recovery to boot into the OS
+            success = wait_for_device_state(
+                self.state.bin_path,
+                ("device", DISCONNECTED),
+                timeout=10,
+                serial=self.state.serial,
+                cancel_event=self.task_runner.cancel_event,
+            )
+        self.cancel_button.disabled = True
         if not success:
             # enable call button to retry
             self.install_button.disabled = False
             # also remove the last error text if it happened
-            self.error_text.value = "Installation failed! Try again or make sure everything is setup correctly."
+            if self.task_runner.cancelled:
+                self.error_text.value = "Installation was cancelled."
+            else:
+                self.error_text.value = "Installation failed! Try again or make sure everything is setup correctly."
         else:
-            sleep(4)  # wait to make sure everything is fine
             self.progress_indicator.set_progress_bar(100)
             self.progress_indicator.update()
             logger.success("Installation process was successful. Allow to continue.")
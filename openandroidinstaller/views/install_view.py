@@ -10,16 +10,23 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
-from time import sleep
 from typing import Callable
 
 from app_state import AppState
 from flet import Column, ElevatedButton, Row, Switch, Colors, Icons
+from flow import FlowError
 from loguru import logger
 from styles import Markdown, Text
-from tooling import adb_twrp_wipe_and_install
+from task_runner import TaskRunner
+from tooling import DISCONNECTED, wait_for_device_state
 from views import BaseView
-from widgets import ProgressIndicator, TerminalBox, confirm_button, get_title
+from widgets import (
+    ProgressIndicator,
+    TerminalBox,
+    cancel_button,
+    confirm_button,
+    get_title,
+)
 
 
 class InstallView(BaseView):
@@ -30,6 +37,12 @@ class InstallView(BaseView):
     ):
         super().__init__(state=state)
         self.on_confirm = on_confirm
+        # runs the installation in the background
+        self.task_runner = TaskRunner(cancel_event=self.state.cancel_event)
+
+    def release(self):
+        """Stop the thread running the commands."""
+        self.task_runner.shutdown()
 
     def build(self):
         """Create the content of the view."""
@@ -117,6 +130,7 @@ Don't try to add addons like Google Apps if your OS ROM already has Google Apps
             expand=True,
             icon=Icons.DIRECTIONS_RUN_OUTLINED,
         )
+        self.cancel_button = cancel_button(lambda _: self.task_runner.cancel())
         # build the view
         self.right_view.controls.extend(
             [
@@ -126,7 +140,13 @@ Don't try to add addons like Google Apps if your OS ROM already has Google Apps
                     [
                         self.install_addons_switch,
                         self.advanced_switch,
-                        Row([self.install_button, self.confirm_button]),
+                        Row(
+                            [
+                                self.install_button,
+                                self.cancel_button,
+                                self.confirm_button,
+                            ]
+                        ),
                     ]
                 ),
                 Row([self.terminal_box]),
@@ -154,8 +174,16 @@ Don't try to add addons like Google Apps if your OS ROM already has Google Apps
         """
         Run the installation process through twrp.
 
-        Some parts of the command are changed by placeholders.
+        The installation runs the first node of the install flow compiled from the state.
         """
+        try:
+            install_flow = self.state.compile_install_flow()
+        except FlowError as e:
+            logger.error(f"Can't start the installation: {e}")
+            self.error_text.value = str(e)
+            self.error_text.color = Colors.RED
+            self.right_view.update()
+            return
         # disable the call button while the command is running
         self.install_button.disabled = True
         self.install_addons_switch.disabled = True
@@ -166,33 +194,50 @@ Don't try to add addons like Google Apps if your OS ROM already has Google Apps
         # reset terminal output
         if self.state.advanced:
             self.terminal_box.clear()
+        self.cancel_button.disabled = False
         self.right_view.update()
 
-        # run the install script
-        for line in adb_twrp_wipe_and_install(
-            target=self.state.image_path,
-            config_path=self.state.config_path,
-            bin_path=self.state.bin_path,
-            install_addons=self.state.install_addons,
-            is_ab=self.state.config.is_ab,
-            recovery=self.state.recovery_path,
-        ):
+        # run the install node in the background; the addons are installed in their own view
+        self.task_runner.start(
+            install_flow.nodes[0].run,
+            on_output=self.write_lines,
+            on_done=self.install_finished,
+        )
+
+    def write_lines(self, lines):
+        """Write the output lines to the terminal and update the progress bar."""
+        for line in lines:
             # write the line to advanced output terminal
             self.terminal_box.write_line(line)
             # in case the install command is run, we want to update the progress bar
+            # the progress bar limits its own updates
             self.progress_indicator.display_progress_bar(line)
-            self.progress_indicator.update()
-        success = line  # the last element of the iterable is a boolean encoding success/failure
 
-        # update the view accordingly
+    def install_finished(self, success: bool):
+        """Update the view once the installation finished."""
+        if success:
+            # make sure the device is in recovery to install addons or left it to boot into the OS
+            success = wait_for_device_state(
+                self.state.bin_path,
+                "recovery" if self.state.install_addons else ("device", DISCONNECTED),
+                timeout=10,
+                serial=self.state.serial,
+                cancel_event=self.task_runner.cancel_event,
+            )
+        if success and self.state.journal:
+            # a resumed installation continues with the addons
+            self.state.journal.record_install(self.state.install_flow.nodes[0])
+        self.cancel_button.disabled = True
         if not success:
             # enable call button to retry
             self.install_button.disabled = False
             # also remove the last error text if it happened
-            self.error_text.value = "Installation failed! Try again or make sure everything is setup correctly."
+            if self.task_runner.cancelled:
+                self.error_text.value = "Installation was cancelled."
+            else:
+                self.error_text.value = "Installation failed! Try again or make sure everything is setup correctly."
             self.error_text.color = Colors.RED
         else:
-            sleep(5)  # wait to make sure everything is fine
             self.progress_indicator.set_progress_bar(100)
             self.progress_indicator.update()
             logger.success("Installation process was successful. Allow to continue.")
@@ -10,7 +10,8 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
-from typing import Callable
+import threading
+from typing import Callable, Dict, Tuple
 
 from app_state import AppState
 from flet import (
@@ -29,7 +30,9 @@ from flet import (
     ContinuousRectangleBorder,
 )
 from loguru import logger
+from requirements import RequirementsReport, check_device_requirements
 from styles import Markdown, Text
+from utils import CompatibilityStatus
 from views import BaseView
 from widgets import get_title
 
@@ -56,6 +59,16 @@ class RequirementsView(BaseView):
         # checkboxes list
         self.checkboxes = []
         self.checkbox_cards = []
+        # checkboxes and result texts of the requirements checked automatically by name
+        self.requirement_checks: Dict[str, Tuple[Checkbox, Text]] = {}
+        self._check_run = 0
+        self.check_text = Text("")
+        self.check_button = OutlinedButton(
+            "Check the device",
+            on_click=lambda _: self.start_requirements_check(),
+            icon=Icons.PHONELINK_SETUP,
+            tooltip="Read the Android version, firmware and battery level from the connected device.",
+        )
         # continue button
         self.continue_button = ElevatedButton(
             "Continue",
@@ -136,6 +149,11 @@ On some devices, the build version is basically the firmware version.""",
                         label="The required android version is installed.\n(Or I know the risk of continuing)",
                         on_change=self.enable_continue_button,
                     )
+                    android_text = Text("")
+                    self.requirement_checks["android"] = (
+                        android_checkbox,
+                        android_text,
+                    )
                     android_version_check = Card(
                         Container(
                             content=Column(
@@ -157,6 +175,7 @@ If your current installation is newer or older than Android {required_android_ve
 version before proceeding (guides can be found on the internet!).
                         """
                                     ),
+                                    android_text,
                                     android_checkbox,
                                 ]
                             ),
@@ -175,6 +194,11 @@ version before proceeding (guides can be found on the internet!).
                         label="The required firmware version is installed. (Or I know the risk of continuing)",
                         on_change=self.enable_continue_button,
                     )
+                    firmware_text = Text("")
+                    self.requirement_checks["firmware"] = (
+                        firmware_checkbox,
+                        firmware_text,
+                    )
                     firmware_version_check = Card(
                         Container(
                             content=Column(
@@ -195,6 +219,7 @@ To discern this, you can run the command `adb shell getprop ro.build.display.id`
 If the device is not on the specified version, please follow the instructions below to install it.
                         """
                                     ),
+                                    firmware_text,
                                     firmware_checkbox,
                                 ]
                             ),
@@ -216,13 +241,18 @@ If the device is not on the specified version, please follow the instructions be
             self.checkboxes.append(lock_checkbox)
             self.checkbox_cards.append(lock_check_card)
 
-        # add the checkbox cards
+        # add the button to check the requirements automatically and the checkbox cards
+        self.right_view.controls.append(
+            Row([self.check_button, self.check_text], wrap=True)
+        )
         self.right_view.controls.extend(self.checkbox_cards)
 
         # add the final confirm and continue button
         self.right_view.controls.append(
             Row([self.back_button, self.continue_button], alignment="center")
         )
+        if not self.state.test:
+            self.start_requirements_check()
         return self.view
 
     def get_battery_check(self):
@@ -231,6 +261,8 @@ If the device is not on the specified version, please follow the instructions be
             label="The battery level is over 80%.",
             on_change=self.enable_continue_button,
         )
+        battery_text = Text("")
+        self.requirement_checks["battery"] = (battery_checkbox, battery_text)
         battery_check_card = Card(
             Container(
                 content=Column(
@@ -241,6 +273,7 @@ If the device is not on the specified version, please follow the instructions be
 Before continuing make sure your device battery level is above 80%.
             """
                         ),
+                        battery_text,
                         battery_checkbox,
                     ]
                 ),
@@ -307,6 +340,66 @@ otherwise it won\'t work on your custom ROM either! Additionally, some devices r
         self.continue_button.disabled = False
         self.right_view.update()
 
+    def start_requirements_check(self):
+        """Check the requirements with the connected device in the background."""
+        self._check_run += 1
+        self.check_button.disabled = True
+        self.check_text.value = "Checking the device..."
+        self.check_text.color = None
+        if self.check_text.page:
+            self.right_view.update()
+        threading.Thread(
+            target=self.check_requirements,
+            args=(self._check_run,),
+            daemon=True,
+        ).start()
+
+    def check_requirements(self, run: int):
+        """Check the requirements and show the report, unless a newer check was started."""
+        report = check_device_requirements(
+            self.state.config.requirements, bin_path=self.state.bin_path
+        )
+        if run == self._check_run:
+            self.show_requirements_report(report)
+
+    def show_requirements_report(self, report: RequirementsReport):
+        """Tick the requirements which are met and show why the others are not."""
+        self.state.device_properties = report.properties
+        colors = {
+            CompatibilityStatus.COMPATIBLE: Colors.GREEN,
+            CompatibilityStatus.UNKNOWN: Colors.ORANGE,
+            CompatibilityStatus.INCOMPATIBLE: Colors.RED,
+        }
+        for name, (checkbox, text) in self.requirement_checks.items():
+            result = report.get(name)
+            if not result:
+                continue
+            text.value = f"> {result.message}"
+            text.color = colors[result.status]
+            # unknown requirements are left to the user
+            if result.status == CompatibilityStatus.COMPATIBLE:
+                checkbox.value = True
+            elif result.status == CompatibilityStatus.INCOMPATIBLE:
+                checkbox.value = False
+        bootloader = report.get("bootloader")
+        if report.failed:
+            self.check_text.value = f"{len(report.failed)} requirement(s) not met."
+            self.check_text.color = Colors.RED
+        elif not report.device_read:
+            self.check_text.value = "Couldn't read the device. Make sure it's connected with USB debugging enabled, or check the requirements by hand."
+            self.check_text.color = Colors.ORANGE
+        else:
+            self.check_text.value = "Checked the device." + (
+                f" {bootloader.message}" if bootloader else ""
+            )
+            self.check_text.color = Colors.GREEN
+        self.check_button.disabled = False
+        self.continue_button.disabled = not all(
+            checkbox.value for checkbox in self.checkboxes
+        )
+        if self.check_text.page:
+            self.right_view.update()
+
     def open_find_version_dlg(self, e):
         """Open the dialog to explain how to find the android and firmware version."""
         self.page.dialog = self.dlg_howto_find_versions
@@ -10,10 +10,12 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import threading
 import webbrowser
-from typing import Callable
+from typing import Callable, Optional
 
 from app_state import AppState
+from checksum import verify_image_checksum
 from flet import (
     AlertDialog,
     Checkbox,
@@ -26,23 +28,23 @@ from flet import (
     OutlinedButton,
     Row,
     TextButton,
+    TextField,
     Colors,
     Icons,
     ContinuousRectangleBorder,
 )
 from loguru import logger
+from network import get_network_client
 from styles import Markdown, Text
 from utils import (
     CheckResult,
     CompatibilityStatus,
-    get_download_link,
     image_sdk_level,
     image_works_with_device,
     recovery_works_with_device,
-    send_tracking_info,
 )
 from views import BaseView
-from widgets import confirm_button, get_title
+from widgets import ProgressIndicator, confirm_button, get_title
 
 
 class SelectFilesView(BaseView):
@@ -107,6 +109,15 @@ OpenAndroidInstaller works with the [TWRP recovery project](https://twrp.me/abou
         )
 
         self.selected_image = Text("Selected image: ")
+        # checksum verification of the image
+        self.checksum_field = TextField(
+            label="SHA-256 checksum (optional)",
+            hint_text="Leave empty to use the .sha256 file next to the image.",
+            on_submit=lambda _: self.start_checksum_verification(),
+            dense=True,
+        )
+        self.checksum_progress = ProgressIndicator(expand=False)
+        self.checksum_text = Text("")
         self.selected_recovery = Text("Selected recovery: ")
         self.selected_dtbo = Checkbox(
             fill_color=Colors.RED, value=None, disabled=True, tristate=True
@@ -123,7 +134,7 @@ OpenAndroidInstaller works with the [TWRP recovery project](https://twrp.me/abou
 
         def confirm_with_tracking(e):
             if self.state.test is False:
-                send_tracking_info(
+                get_network_client().send_tracking_info(
                     device_code=self.state.config.device_code, event="started"
                 )
             self.on_confirm(e)
@@ -148,14 +159,16 @@ OpenAndroidInstaller works with the [TWRP recovery project](https://twrp.me/abou
         # store image and recovery compatibility
         self.image_compatibility: CheckResult | None = None
         self.recovery_compatibility: CheckResult | None = None
+        self.checksum_verification: CheckResult | None = None
+        # counts the verifications, so results for a previously selected image are dropped
+        self._checksum_run = 0
 
     def build(self):
         self.clear()
 
-        # download link
-        self.download_link = get_download_link(
-            self.state.config.metadata.get("device_code", "NOTFOUND")
-        )
+        # download links are shown once it is known if there is an official download
+        self.download_link = None
+        self.download_links = Column()
 
         # attach hidden dialogues
         self.right_view.controls.extend(
@@ -208,40 +221,12 @@ OpenAndroidInstaller works with the [TWRP recovery project](https://twrp.me/abou
                 ]
             )
 
-        # if there is an available download, show the button to the page
-        if self.download_link:
-            twrp_download_link = f"https://dl.twrp.me/{self.state.config.twrp_link if self.state.config.twrp_link else self.state.config.device_code}"
-            self.right_view.controls.append(Divider())
-            self.right_view.controls.append(
-                Column(
-                    [
-                        Text(
-                            "You can bring your own image and recovery or you download the officially supported image file for your device here:"
-                        ),
-                        Row(
-                            [
-                                ElevatedButton(
-                                    "Download LineageOS image",
-                                    icon=Icons.DOWNLOAD_OUTLINED,
-                                    on_click=lambda _: webbrowser.open(
-                                        self.download_link
-                                    ),
-                                    expand=True,
-                                ),
-                                ElevatedButton(
-                                    "Download TWRP recovery",
-                                    icon=Icons.DOWNLOAD_OUTLINED,
-                                    on_click=lambda _: webbrowser.open(
-                                        twrp_download_link
-                                    ),
-                                    expand=True,
-                                ),
-                            ]
-                        ),
-                        Divider(),
-                    ]
-                )
-            )
+        self.right_view.controls.append(self.download_links)
+        get_network_client().get_download_link(
+            self.state.config.metadata.get("device_code", "NOTFOUND"),
+            callback=self.show_download_links,
+        )
+
         # attach the controls for uploading image and recovery
         self.right_view.controls.extend(
             [
@@ -265,6 +250,9 @@ The image file should look something like `lineage-22.1-20241101-nightly-{self.s
                     ]
                 ),
                 self.selected_image,
+                self.checksum_field,
+                self.checksum_progress,
+                self.checksum_text,
                 Divider(),
             ]
         )
@@ -317,6 +305,43 @@ The recovery image should look something like `twrp-3.7.1_12-0-{self.state.confi
         )
         return self.view
 
+    def show_download_links(self, download_link: Optional[str]):
+        """Show the buttons to download the official image and recovery, if there is a download for the device."""
+        if not download_link:
+            return
+        self.download_link = download_link
+        twrp_download_link = f"https://dl.twrp.me/{self.state.config.twrp_link if self.state.config.twrp_link else self.state.config.device_code}"
+        self.download_links.controls = [
+            Divider(),
+            Column(
+                [
+                    Text(
+                        "You can bring your own image and recovery or you download the officially supported image file for your device here:"
+                    ),
+                    Row(
+                        [
+                            ElevatedButton(
+                                "Download LineageOS image",
+                                icon=Icons.DOWNLOAD_OUTLINED,
+                                on_click=lambda _: webbrowser.open(self.download_link),
+                                expand=True,
+                            ),
+                            ElevatedButton(
+                                "Download TWRP recovery",
+                                icon=Icons.DOWNLOAD_OUTLINED,
+                                on_click=lambda _: webbrowser.open(twrp_download_link),
+                                expand=True,
+                            ),
+                        ]
+                    ),
+                    Divider(),
+                ]
+            ),
+        ]
+        # the link might be known before the view is shown
+        if self.download_links.page:
+            self.download_links.update()
+
     def get_notes(self) -> str:
         """Prepare and get notes for the specific device from config.
 
@@ -548,6 +573,7 @@ Make sure the file is for **your exact phone model!**""",
             else:
                 self.selected_image.color = Colors.RED
             self.selected_image.value += f"\n> {self.image_compatibility.message}"
+            self.start_checksum_verification()
         # if the image works and the sdk level is 33 or higher, show the additional image selection
         if self.state.flash_recovery:
             if (
@@ -562,6 +588,56 @@ Make sure the file is for **your exact phone model!**""",
         self.enable_button_if_ready(None)
         self.selected_image.update()
 
+    def start_checksum_verification(self):
+        """Verify the checksum of the selected image in the background."""
+        if not self.state.image_path:
+            return
+        self._checksum_run += 1
+        self.checksum_verification = None
+        self.checksum_text.value = "Verifying the checksum of the image..."
+        self.checksum_text.color = None
+        self.checksum_progress.clear()
+        self.checksum_progress.display_progress_bar("")
+        # the buttons stay disabled until the checksum is verified
+        self.enable_button_if_ready(None)
+        threading.Thread(
+            target=self.verify_checksum,
+            args=(self._checksum_run, self.state.image_path, self.checksum_field.value),
+            daemon=True,
+        ).start()
+
+    def verify_checksum(self, run: int, image_path: str, expected: str):
+        """Compute and compare the checksum of the image and show the result."""
+        last_percentage = 0
+
+        def on_progress(done: int, total: int):
+            nonlocal last_percentage
+            percentage = done * 100 // total if total else 100
+            # only update the view if the displayed percentage changes
+            if run == self._checksum_run and percentage != last_percentage:
+                last_percentage = percentage
+                self.checksum_progress.set_progress_bar(percentage)
+                if self.checksum_progress.page:
+                    self.checksum_progress.update()
+
+        result = verify_image_checksum(
+            image_path, expected=expected, progress_callback=on_progress
+        )
+        if run != self._checksum_run:
+            # another image was selected in the meantime
+            return
+        self.checksum_verification = result
+        self.checksum_progress.clear()
+        self.checksum_text.value = f"> {result.message}"
+        if result.status == CompatibilityStatus.COMPATIBLE:
+            self.checksum_text.color = Colors.GREEN
+        elif result.status == CompatibilityStatus.UNKNOWN:
+            self.checksum_text.color = Colors.ORANGE
+        else:
+            self.checksum_text.color = Colors.RED
+        # the view might have been left while the image was hashed
+        self.enable_button_if_ready(None)
+
     def pick_recovery_result(self, e: FilePickerResultEvent):
         path = ", ".join(map(lambda f: f.name, e.files)) if e.files else "Cancelled!"
         # update the textfield with the name of the file
@@ -667,8 +743,40 @@ Make sure the file is for **your exact phone model!**""",
         self.enable_button_if_ready(None)
         self.selected_vendor_boot.update()
 
+    @property
+    def checksum_pending(self) -> bool:
+        """True while the checksum of the selected image is verified."""
+        return self._checksum_run > 0 and self.checksum_verification is None
+
+    def update_right_view(self):
+        """Update the right view, unless it isn't shown while a background thread finished."""
+        if self.right_view.page:
+            self.right_view.update()
+
     def enable_button_if_ready(self, e):
         """Enable the confirm button if both files have been selected."""
+        if self.checksum_pending:
+            self.info_field.controls = []
+            self.confirm_button.disabled = True
+            self.continue_eitherway_button.disabled = True
+            self.update_right_view()
+            return
+        if (
+            self.checksum_verification
+            and self.checksum_verification.status == CompatibilityStatus.INCOMPATIBLE
+        ):
+            logger.error("The checksum of the image doesn't match.")
+            self.info_field.controls = [
+                Text(
+                    "The selected image seems to be corrupted.",
+                    color=Colors.RED,
+                    weight="bold",
+                )
+            ]
+            self.confirm_button.disabled = True
+            self.continue_eitherway_button.disabled = True
+            self.update_right_view()
+            return
         if (".zip" in self.selected_image.value) and (
             ".img" in self.selected_recovery.value
         ):
@@ -690,7 +798,7 @@ Make sure the file is for **your exact phone model!**""",
                 ]
                 self.confirm_button.disabled = True
                 self.continue_eitherway_button.disabled = True
-                self.right_view.update()
+                self.update_right_view()
                 return
 
             self.continue_eitherway_button.disabled = False
@@ -717,14 +825,14 @@ Make sure the file is for **your exact phone model!**""",
                     )
                 ]
                 self.confirm_button.disabled = True
-                self.right_view.update()
+                self.update_right_view()
                 return
 
             logger.info("Image and recovery work with the device. You can continue.")
             self.info_field.controls = []
             self.confirm_button.disabled = False
             self.continue_eitherway_button.disabled = True
-            self.right_view.update()
+            self.update_right_view()
         elif (".zip" in self.selected_image.value) and (not self.state.flash_recovery):
             if self.image_compatibility.status != CompatibilityStatus.COMPATIBLE:
                 # if image works for device allow to move on, otherwise display message
@@ -738,13 +846,13 @@ Make sure the file is for **your exact phone model!**""",
                 ]
                 self.confirm_button.disabled = True
                 self.continue_eitherway_button.disabled = True
-                self.right_view.update()
+                self.update_right_view()
                 return
 
             logger.info("Image works with the device. You can continue.")
             self.info_field.controls = []
             self.confirm_button.disabled = False
             self.continue_eitherway_button.disabled = True
-            self.right_view.update()
+            self.update_right_view()
         else:
             self.confirm_button.disabled = True
@@ -11,39 +11,22 @@
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
 from functools import partial
-from time import sleep
-from typing import Callable
+from typing import Callable, Optional
 
 from app_state import AppState
+from flow import CommandNode
 from flet import Column, ElevatedButton, Row, Switch, TextField, Colors, Icons
 from installer_config import Step
 from loguru import logger
+from progress import ProgressEvent
 from styles import Markdown, Text
-from tooling import (
-    adb_reboot,
-    adb_reboot_bootloader,
-    adb_reboot_download,
-    adb_reboot_recovery,
-    adb_sideload,
-    adb_twrp_copy_partitions,
-    fastboot_boot_recovery,
-    fastboot_flash_additional_partitions,
-    fastboot_flash_boot,
-    fastboot_flash_recovery,
-    fastboot_get_unlock_data,
-    fastboot_oem_unlock,
-    fastboot_reboot,
-    fastboot_reboot_recovery,
-    fastboot_unlock,
-    fastboot_unlock_critical,
-    fastboot_unlock_with_code,
-    heimdall_flash_recovery,
-)
+from task_runner import TaskRunner
 from views import BaseView
 from widgets import (
     ProgressIndicator,
     TerminalBox,
     call_button,
+    cancel_button,
     confirm_button,
     get_title,
     link_button,
@@ -56,16 +39,28 @@ class StepView(BaseView):
         step: Step,
         state: AppState,
         on_confirm: Callable,
+        node: Optional[CommandNode] = None,
+        on_skip: Optional[Callable] = None,
     ):
         super().__init__(state=state, image=step.img)
         self.step = step
+        # node of the compiled flow running the command of the step
+        self.node = node
         self.on_confirm = on_confirm
+        # skipping a step continues like confirming it, unless told apart
+        self.on_skip = on_skip or on_confirm
+        # runs the commands in the background
+        self.task_runner = TaskRunner(cancel_event=self.state.cancel_event)
 
         # text input
         self.inputtext = TextField(
             hint_text="your unlock code", expand=False
         )  # textfield for the unlock code
 
+    def release(self):
+        """Stop the thread running the commands."""
+        self.task_runner.shutdown()
+
     def build(self):
         """Create the content of a view from step."""
         # error text
@@ -115,6 +110,7 @@ class StepView(BaseView):
         # basic view depending on step.type
         logger.info(f"Starting step of type {self.step.type}.")
         self.confirm_button = confirm_button(self.on_confirm)
+        self.cancel_button = cancel_button(lambda _: self.task_runner.cancel())
         if self.step.type == "confirm_button":
             self.right_view.controls.append(Row([self.confirm_button]))
         elif self.step.type == "call_button":
@@ -129,7 +125,13 @@ class StepView(BaseView):
                     Column(
                         [
                             self.advanced_switch,
-                            Row([self.call_button, self.confirm_button]),
+                            Row(
+                                [
+                                    self.call_button,
+                                    self.cancel_button,
+                                    self.confirm_button,
+                                ]
+                            ),
                         ]
                     ),
                     Row([self.terminal_box]),
@@ -148,7 +150,13 @@ class StepView(BaseView):
                     Column(
                         [
                             self.advanced_switch,
-                            Row([self.call_button, self.confirm_button]),
+                            Row(
+                                [
+                                    self.call_button,
+                                    self.cancel_button,
+                                    self.confirm_button,
+                                ]
+                            ),
                         ]
                     ),
                     Row([self.terminal_box]),
@@ -169,7 +177,7 @@ class StepView(BaseView):
                         Text("Do you want to skip?"),
                         ElevatedButton(
                             "Skip",
-                            on_click=self.on_confirm,
+                            on_click=self.on_skip,
                             icon=Icons.NEXT_PLAN_OUTLINED,
                             expand=True,
                         ),
@@ -195,77 +203,42 @@ class StepView(BaseView):
             self.terminal_box.clear()
         self.right_view.update()
 
-        # get the appropriate function to run for every possible command.
-        cmd_mapping = {
-            "adb_reboot": adb_reboot,
-            "adb_reboot_bootloader": adb_reboot_bootloader,
-            "adb_reboot_download": adb_reboot_download,
-            "adb_reboot_recovery": adb_reboot_recovery,
-            "adb_sideload": partial(adb_sideload, target=self.state.image_path),
-            "adb_twrp_copy_partitions": partial(
-                adb_twrp_copy_partitions, config_path=self.state.config_path
-            ),
-            "fastboot_unlock": fastboot_unlock,
-            "fastboot_unlock_critical": fastboot_unlock_critical,
-            "fastboot_unlock_with_code": partial(
-                fastboot_unlock_with_code, unlock_code=self.inputtext.value
-            ),
-            "fastboot_oem_unlock": fastboot_oem_unlock,
-            "fastboot_get_unlock_data": fastboot_get_unlock_data,
-            "fastboot_boot_recovery": partial(
-                fastboot_boot_recovery,
-                recovery=self.state.recovery_path,
-                is_ab=self.state.config.is_ab,
-            ),
-            "fastboot_flash_boot": partial(
-                fastboot_flash_boot,
-                recovery=self.state.recovery_path,
-            ),
-            "fastboot_flash_recovery": partial(
-                fastboot_flash_recovery,
-                recovery=self.state.recovery_path,
-                is_ab=self.state.config.is_ab,
-                dtbo=self.state.dtbo_path,
-                vbmeta=self.state.vbmeta_path,
-                super_empty=self.state.super_empty_path,
-                vendor_boot=self.state.vendor_boot_path,
-            ),
-            "fastboot_reboot_recovery": fastboot_reboot_recovery,
-            "fastboot_flash_additional_partitions": partial(
-                fastboot_flash_additional_partitions,
-                dtbo=self.state.dtbo_path,
-                vbmeta=self.state.vbmeta_path,
-                super_empty=self.state.super_empty_path,
-                vendor_boot=self.state.vendor_boot_path,
-                is_ab=self.state.config.is_ab,
-            ),
-            "fastboot_reboot": fastboot_reboot,
-            "heimdall_flash_recovery": partial(
-                heimdall_flash_recovery, recovery=self.state.recovery_path
-            ),
-        }
-
-        # run the right command
-        if command in cmd_mapping.keys():
-            for line in cmd_mapping.get(command)(bin_path=self.state.bin_path):  # type: ignore
-                # write the line to advanced output terminal
-                self.terminal_box.write_line(line)
-                self.progress_indicator.display_progress_ring()
-        else:
+        # run the command of the compiled flow
+        if self.node is None or self.node.function is None:
             msg = f"Unknown command type: {command}. Stopping."
             logger.error(msg)
             self.error_text.value = msg
             raise Exception(msg)
-        success = line  # the last element of the iterable is a boolean encoding success/failure
+        self.cancel_button.disabled = False
+        self.cancel_button.update()
+        self.progress_indicator.display_progress_ring()
+        self.task_runner.start(
+            partial(self.node.run, user_input=self.inputtext.value),
+            on_output=self.write_lines,
+            on_done=partial(self.command_finished, command=command),
+        )
 
-        # update the view accordingly
+    def write_lines(self, lines):
+        """Write the output lines of the running command to the advanced output terminal."""
+        for line in lines:
+            self.terminal_box.write_line(line)
+            # flashes report the progress of the transfer of the images
+            if isinstance(line, ProgressEvent):
+                self.progress_indicator.display_progress_bar(line)
+
+    def command_finished(self, success: bool, command: str):
+        """Update the view once the command finished."""
+        self.cancel_button.disabled = True
         if not success:
             # enable call button to retry
             self.call_button.disabled = False
             # also remove the last error text if it happened
-            self.error_text.value = f"Command {command} failed! Try again or make sure everything is setup correctly."
+            if self.task_runner.cancelled:
+                self.error_text.value = f"Command {command} was cancelled."
+            else:
+                self.error_text.value = f"Command {command} failed! Try again or make sure everything is setup correctly."
         else:
-            sleep(5)  # wait to make sure everything is fine
+            # the commands wait for the device to reach their target state themselves
             logger.success(f"Command {command} run successfully. Allow to continue.")
             # enable the confirm button and disable the call button
             self.confirm_button.disabled = False
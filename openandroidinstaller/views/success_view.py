@@ -16,7 +16,7 @@ from loguru import logger
 from styles import Markdown, Text
 from views import BaseView
 from widgets import get_title
-from utils import send_tracking_info
+from network import get_network_client
 
 
 class SuccessView(BaseView):
@@ -28,9 +28,12 @@ class SuccessView(BaseView):
     ):
         def close_window(e):
             if self.state.test is False:
-                send_tracking_info(
+                network_client = get_network_client()
+                network_client.send_tracking_info(
                     event="finished", device_code=self.state.config.device_code
                 )
+                # send the event before the application exits
+                network_client.flush(timeout=3)
             logger.success("Success! Close the window.")
             # close the window
             self.page.window.close()
@@ -10,11 +10,15 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
-from typing import Callable
+import threading
+from datetime import datetime
+from typing import Callable, Optional
 
 from app_state import AppState
-from flet import Divider, ElevatedButton, Row, Icons
+from flet import Colors, Column, Divider, ElevatedButton, Row, Icons
+from loguru import logger
 from styles import Markdown, Text
+from utils import CompatibilityStatus
 from views import BaseView
 from widgets import get_title
 
@@ -24,9 +28,11 @@ class WelcomeView(BaseView):
         self,
         state: AppState,
         on_confirm: Callable,
+        on_resume: Optional[Callable[[], None]] = None,
     ):
         super().__init__(state=state, image="connect-to-usb.png")
         self.on_confirm = on_confirm
+        self.on_resume = on_resume
 
         self.init_visuals()
 
@@ -41,6 +47,13 @@ class WelcomeView(BaseView):
             disabled=False,
             expand=True,
         )
+        self.resume_button = ElevatedButton(
+            "Resume installation",
+            on_click=lambda _: self.start_resume(),
+            icon=Icons.RESTORE,
+            expand=True,
+        )
+        self.resume_text = Text("")
 
     def build(self):
         self.clear()
@@ -87,4 +100,50 @@ Please note, that vendor specific back-ups will most likely not work on LineageO
                 ),
             ]
         )
+        if self.state.checkpoint and self.on_resume:
+            self.right_view.controls.extend([Divider(), self.resume_section()])
         return self.view
+
+    def resume_section(self) -> Column:
+        """Offer to resume the interrupted installation."""
+        checkpoint = self.state.checkpoint
+        started = datetime.fromtimestamp(checkpoint.started).strftime("%Y-%m-%d %H:%M")
+        return Column(
+            [
+                Markdown(
+                    f"""
+#### Resume the interrupted installation
+The installation on the device `{checkpoint.device_code}` ({checkpoint.serial}) started {started}
+was interrupted after {checkpoint.next_index} of {len(checkpoint.commands)} steps.
+Connect the device to continue with the first step which didn't complete.
+                """
+                ),
+                self.resume_text,
+                Row([self.resume_button], alignment="center"),
+            ]
+        )
+
+    def start_resume(self):
+        """Check the device and the images in the background before resuming."""
+        self.resume_button.disabled = True
+        self.resume_text.value = "Checking the device and the images..."
+        self.resume_text.color = None
+        self.right_view.update()
+        threading.Thread(target=self.resume, daemon=True).start()
+
+    def resume(self):
+        """Resume the installation or show why it can't be resumed."""
+        result = self.state.resume_install(self.state.checkpoint)
+        if result.status == CompatibilityStatus.COMPATIBLE:
+            logger.info(result.message)
+            self.on_resume()
+            return
+        self.resume_text.value = result.message
+        self.resume_text.color = (
+            Colors.ORANGE
+            if result.status == CompatibilityStatus.UNKNOWN
+            else Colors.RED
+        )
+        self.resume_button.disabled = False
+        if self.resume_text.page:
+            self.right_view.update()
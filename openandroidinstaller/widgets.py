@@ -10,11 +10,13 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import threading
 import webbrowser
+from collections import deque
 from functools import partial
-from typing import Callable, Optional
+from time import monotonic
+from typing import Callable, Deque, Optional, Union
 
-import regex as re
 from flet import (
     Column,
     Container,
@@ -28,13 +30,31 @@ from flet import (
     Colors,
     Icons,
 )
+from progress import ProgressEvent, ProgressParser, RateLimiter
 from styles import Text
 
 
 class TerminalBox(Row):
-    def __init__(self, expand: bool = True, visible: bool = False):
+    """Box showing the last lines of the output of the tools.
+
+    Lines are kept in a ring buffer of `max_lines` lines and the box is updated at most
+    `max_updates_per_second` times per second. The full output is written to the log file.
+    """
+
+    def __init__(
+        self,
+        expand: bool = True,
+        visible: bool = False,
+        max_lines: int = 500,
+        max_updates_per_second: float = 4,
+    ):
         super().__init__(expand=expand)
         self.visible = visible
+        self._lines: Deque[str] = deque(maxlen=max_lines)
+        self._update_interval = 1 / max_updates_per_second
+        self._last_update = 0.0
+        self._pending_update: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
 
     def build(self):
         self._box = Container(
@@ -62,11 +82,32 @@ class TerminalBox(Row):
         Ignores empty lines.
         """
         if isinstance(line, str) and line.strip():
-            self._box.content.controls[0].value += f"\n>{line.strip()}"
-            self._box.content.controls[0].value = self._box.content.controls[
-                0
-            ].value.strip("\n")
-            self.update()
+            self._lines.append(f">{line.strip()}")
+            self._schedule_update()
+
+    def flush(self):
+        """Show all written lines right away."""
+        with self._lock:
+            if self._pending_update:
+                self._pending_update.cancel()
+                self._pending_update = None
+            self._last_update = monotonic()
+        self._box.content.controls[0].value = "\n".join(self._lines)
+        self.update()
+
+    def _schedule_update(self):
+        """Update the box now or after the update interval, if it was updated just before."""
+        with self._lock:
+            if self._pending_update:
+                # the pending update will show this line too
+                return
+            wait_time = self._last_update + self._update_interval - monotonic()
+            if wait_time > 0:
+                self._pending_update = threading.Timer(wait_time, self.flush)
+                self._pending_update.daemon = True
+                self._pending_update.start()
+                return
+        self.flush()
 
     def toggle_visibility(self):
         """Toggle the visibility of the terminal box."""
@@ -76,17 +117,20 @@ class TerminalBox(Row):
 
     def clear(self):
         """Clear terminal output."""
-        self._box.content.controls[0].value = ""
-        self.update()
+        self._lines.clear()
+        self.flush()
 
 
 class ProgressIndicator(Row):
-    def __init__(self, expand: bool = True):
+    def __init__(self, expand: bool = True, max_updates_per_second: float = 10):
         super().__init__(expand=expand)
         # placeholder for the flashing progressbar
         self.progress_bar = None
         # progress ring to display
         self.progress_ring = None
+        # get the progress from the output lines and limit the updates of the progress bar
+        self.progress_parser = ProgressParser()
+        self._update_limiter = RateLimiter(1 / max_updates_per_second)
 
     def build(self):
         self._container = Container(
@@ -99,12 +143,17 @@ class ProgressIndicator(Row):
         )
         return self._container
 
-    def display_progress_bar(self, line: str):
-        """Display and update the progress bar for the given line."""
-        percentage_done = None
-        result = None
+    def display_progress_bar(self, line: Union[str, ProgressEvent]):
+        """Display and update the progress bar for the given line or progress event of a flash.
+
+        The view is only updated if the progress increased, and at most `max_updates_per_second` times per second.
+        The last progress is shown once the interval passed.
+        """
         # create the progress bar
         if not self.progress_bar:
+            # the progress bar replaces the progress ring
+            self._container.content.controls = []
+            self.progress_ring = None
             self.progress_bar = ProgressBar(
                 value=1 / 100,
                 width=500,
@@ -114,24 +163,20 @@ class ProgressIndicator(Row):
             )
             # text to display the percentage
             self.percentage_text = Text("1%")
+            # text to display the transfer rate and remaining time of flashes
+            self.transfer_text = Text("")
             self._container.content.controls.append(
-                Row([self.percentage_text, self.progress_bar])
+                Row([self.percentage_text, self.progress_bar, self.transfer_text])
             )
+            self.update()
         # get the progress numbers from the output lines
-        if isinstance(line, str) and line.strip():
-            result = re.search(
-                r"\(\~(\d{1,3})\%\)|(Total xfer:|adb: failed to read command: Success)",
-                line.strip(),
-            )
-        if result:
-            if result.group(2):
-                percentage_done = 99
-            elif result.group(1):
-                percentage_done = int(result.group(1))
-                percentage_done = max(1, min(99, percentage_done))
+        percentage_done = self.progress_parser.feed(line)
+        if percentage_done is not None:
             # update the progress bar
             self.set_progress_bar(percentage_done)
-        self.update()
+            if isinstance(line, ProgressEvent):
+                self.transfer_text.value = line.describe()
+            self._update_limiter.run(self.update, force=percentage_done >= 99)
 
     def set_progress_bar(self, percentage_done: int):
         """Set the progress bar to the given percentage.
@@ -158,9 +203,11 @@ class ProgressIndicator(Row):
 
     def clear(self):
         """Clear output."""
+        self._update_limiter.cancel()
         self._container.content.controls = []
         self.progress_ring = None
         self.progress_bar = None
+        self.progress_parser.reset()
         self.update()
 
 
@@ -219,6 +266,16 @@ def call_button(
     )
 
 
+def cancel_button(cancel_func: Callable, cancel_text: str = "Cancel") -> ElevatedButton:
+    """Get a button to cancel a running task. It is disabled until a task runs."""
+    return ElevatedButton(
+        f"{cancel_text}",
+        on_click=cancel_func,
+        icon=Icons.STOP_CIRCLE_OUTLINED,
+        disabled=True,
+    )
+
+
 def link_button(link: str, text: str) -> ElevatedButton:
     """Get a button that opens a link in a browser."""
     return ElevatedButton(
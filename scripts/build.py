@@ -12,15 +12,39 @@
 # Author: Tobias Sterbak
 import subprocess
 import sys
+from pathlib import Path
 
 from loguru import logger
 
+sys.path.insert(0, "openandroidinstaller")
+from installer_config import compile_config_bundle  # noqa: E402
+
+ASSETS_PATH = Path("openandroidinstaller/assets")
+CONFIG_PATH = ASSETS_PATH.joinpath("configs")
+# the app loads the bundle from `assets/configs.sqlite` instead of the YAML files
+BUNDLE_PATH = Path("build/config-bundle/configs.sqlite")
+
+# ship the compiled config bundle instead of the config files
 added_files = [
-    ("openandroidinstaller/assets", "assets"),
+    (str(path), f"assets/{path.name}" if path.is_dir() else "assets")
+    for path in sorted(ASSETS_PATH.iterdir())
+    if path != CONFIG_PATH
+] + [
+    (str(BUNDLE_PATH), "assets"),
     ("openandroidinstaller/bin", "bin"),
 ]
 
 
+def build_config_bundle():
+    """Validate all configs and compile them into the bundle shipped with the app."""
+    errors = compile_config_bundle(CONFIG_PATH, BUNDLE_PATH)
+    for file_errors in errors.values():
+        for error in file_errors:
+            logger.error(str(error))
+    if errors:
+        raise RuntimeError(f"{len(errors)} invalid configs. Fix them to build the app.")
+
+
 def build_linux():
     added_data = [f"--add-data={src}:{dst}" for src, dst in added_files]
     pyinstaller_options = [
@@ -90,6 +114,7 @@ def build_windows():
 
 def build():
     """Run the build for your OS and save it in the current directory."""
+    build_config_bundle()
     if sys.platform.startswith("linux"):
         logger.info("Building for Linux")
         _ = build_linux()
@@ -12,7 +12,38 @@ from pathlib import Path
 
 import pytest
 
+from .device_simulator import DeviceProfile, DeviceSimulator
+
 
 @pytest.fixture
 def config_path():
     return Path("openandroidinstaller/assets/configs")
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep persistent caches of the application out of the user's cache directory."""
+    path = tmp_path.joinpath("cache")
+    monkeypatch.setenv("OPENANDROIDINSTALLER_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def no_adb_server(monkeypatch):
+    """Run the adb commands of the tooling with the (fake) binaries, not an adb server on this machine."""
+    monkeypatch.setattr("adb_client.AdbClient.is_available", lambda self: False)
+
+
+@pytest.fixture
+def fake_device(tmp_path, monkeypatch):
+    """Get a simulated device; use `fake_device.bin_path` as `bin_path` of the tooling.
+
+    Configure the device with `fake_device.set(...)`, see `DeviceProfile`.
+    """
+
+    def no_adb_server(self):
+        raise ConnectionRefusedError("No adb server in the tests.")
+
+    # the device is only known to the fake tools, not to an adb server running on this machine
+    monkeypatch.setattr("adb_client.AdbClient.devices", no_adb_server)
+    return DeviceSimulator(tmp_path.joinpath("bin"), DeviceProfile())
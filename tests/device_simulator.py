@@ -0,0 +1,612 @@
+"""A simulated device behind fake adb, fastboot and heimdall binaries.
+
+`DeviceSimulator` writes small wrapper scripts named like the tools into a directory, which can
+be used as `bin_path`. Every call of a tool runs this module as a script, which reads the state
+of the device from a JSON file next to the wrappers, answers like the real tool and writes the
+new state back. This allows to run complete flows of the tooling module without a phone.
+
+The device has a mode (system, recovery, sideload, bootloader, download or off) which changes on
+reboots. Reboots, commands and transfers take as long as configured, and transfers print the
+progress like the real tools. Only POSIX systems are supported.
+"""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import fcntl
+import json
+import os
+import re
+import shlex
+import stat
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+STATE_FILE = "device.json"
+LOG_FILE = "commands.log"
+TOOLS = ("adb", "fastboot", "heimdall")
+MODES = ("system", "recovery", "sideload", "bootloader", "download", "off")
+# state of the device as listed by `adb devices` by mode
+ADB_STATES = {"system": "device", "recovery": "recovery", "sideload": "sideload"}
+# target modes of `adb reboot <target>`
+ADB_REBOOT_TARGETS = {
+    "": "system",
+    "bootloader": "bootloader",
+    "recovery": "recovery",
+    "download": "download",
+    "sideload": "sideload",
+}
+# seconds the `adb wait-for-*` commands wait at most
+WAIT_TIMEOUT = 60
+POLL_INTERVAL = 0.02
+
+PROPERTY_NAME_PATTERN = re.compile(r"\[([^\]]+)\]: \[\$\(")
+
+
+@dataclass
+class DeviceProfile:
+    """The simulated device and how fast it is.
+
+    Attributes:
+        serial: Serial number of the device.
+        device_code: Device code reported in the device lists and properties.
+        mode: Mode the device starts in.
+        unlocked: True if the bootloader is unlocked.
+        slot: Active slot of a/b-devices.
+        properties: System properties besides the ones derived from the other attributes.
+        command_latency: Seconds every command takes.
+        reboot_time: Seconds the device is gone while rebooting.
+        install_time: Seconds TWRP needs to install a sideloaded zip before it's back in recovery.
+        transfer_rate: Bytes per second of image transfers; 0 for instant transfers.
+        progress_lines: Number of progress lines printed per transfer.
+        sparse_limit: Images larger than this are sent by fastboot in sparse chunks.
+        twrp_format_data: False to simulate an old TWRP without `twrp format data`.
+        failures: Commands like `fastboot flashing unlock` which fail, with the number of times
+            they fail; negative numbers fail forever.
+    """
+
+    serial: str = "SIM0001"
+    device_code: str = "sargo"
+    mode: str = "system"
+    unlocked: bool = False
+    slot: str = "a"
+    properties: Dict[str, str] = field(default_factory=dict)
+    command_latency: float = 0.0
+    reboot_time: float = 0.0
+    install_time: float = 0.0
+    transfer_rate: float = 0.0
+    progress_lines: int = 4
+    sparse_limit: int = 512 * 1024 * 1024
+    twrp_format_data: bool = True
+    failures: Dict[str, int] = field(default_factory=dict)
+
+
+class DeviceSimulator:
+    """Fake adb, fastboot and heimdall binaries in `bin_path`, all talking to one simulated device."""
+
+    def __init__(self, bin_path: Path, profile: Optional[DeviceProfile] = None):
+        self.bin_path = Path(bin_path)
+        self.bin_path.mkdir(parents=True, exist_ok=True)
+        profile = profile or DeviceProfile()
+        if profile.mode not in MODES:
+            raise ValueError(f"Unknown mode {profile.mode}. Use one of {MODES}.")
+        state = dict(asdict(profile), booting=None)
+        with self._locked() as lock:
+            _write_state(lock, state)
+        self.log_path.write_text("")
+        for tool in TOOLS:
+            self._write_wrapper(tool)
+
+    @property
+    def state_path(self) -> Path:
+        return self.bin_path.joinpath(STATE_FILE)
+
+    @property
+    def log_path(self) -> Path:
+        return self.bin_path.joinpath(LOG_FILE)
+
+    @property
+    def state(self) -> dict:
+        """Current state of the device, with finished reboots applied."""
+        with self._locked() as lock:
+            return _resolve(_read_state(lock))
+
+    @property
+    def mode(self) -> str:
+        return self.state["mode"]
+
+    def set(self, **values):
+        """Change the state of the device, e.g. `set(mode="recovery", transfer_rate=1e6)`."""
+        with self._locked() as lock:
+            state = _resolve(_read_state(lock))
+            state.update(values)
+            _write_state(lock, state)
+
+    def commands(self) -> List[str]:
+        """All commands run so far, like `adb reboot bootloader`, without the device selectors."""
+        with open(self.log_path, "r", encoding="utf-8") as stream:
+            return [json.loads(line)["command"] for line in stream if line.strip()]
+
+    def modes(self) -> List[str]:
+        """Mode of the device at the time of every command run so far."""
+        with open(self.log_path, "r", encoding="utf-8") as stream:
+            return [json.loads(line)["mode"] for line in stream if line.strip()]
+
+    def _write_wrapper(self, tool: str):
+        path = self.bin_path.joinpath(tool)
+        path.write_text(
+            "#!/bin/sh\n"
+            f"exec {shlex.quote(sys.executable)} {shlex.quote(str(Path(__file__).resolve()))} "
+            f'"$(dirname "$0")" {tool} "$@"\n'
+        )
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    @contextmanager
+    def _locked(self) -> Iterator[Path]:
+        with _locked(self.bin_path) as lock:
+            yield lock
+
+
+@contextmanager
+def _locked(bin_path: Path) -> Iterator[Path]:
+    """Lock the state of the device against the other running tools."""
+    with open(bin_path.joinpath(STATE_FILE + ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield bin_path.joinpath(STATE_FILE)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_state(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def _write_state(path: Path, state: dict):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as stream:
+        json.dump(state, stream)
+    os.replace(tmp_path, path)
+
+
+def _resolve(state: dict) -> dict:
+    """Finish a reboot once its time is up."""
+    booting = state.get("booting")
+    if booting and time.time() >= booting["until"]:
+        state["mode"] = booting["mode"]
+        state["booting"] = None
+    return state
+
+
+def _reboot(state: dict, mode: str, duration: Optional[float] = None):
+    """Start a reboot into the mode; the device is gone until it finished."""
+    duration = state["reboot_time"] if duration is None else duration
+    if duration <= 0:
+        state["mode"] = mode
+        state["booting"] = None
+        return
+    state["mode"] = "off"
+    state["booting"] = {"mode": mode, "until": time.time() + duration}
+
+
+class SimulatedTool:
+    """One call of a simulated tool. The handlers print like the tool and return the exit code."""
+
+    def __init__(self, bin_path: Path, tool: str, args: List[str]):
+        self.bin_path = bin_path
+        self.tool = tool
+        self.serial: Optional[str] = None
+        self.args = self._strip_selectors(args)
+
+    def run(self) -> int:
+        with _locked(self.bin_path) as path:
+            state = _resolve(_read_state(path))
+            command = " ".join([self.tool] + self.args)
+            with open(
+                self.bin_path.joinpath(LOG_FILE), "a", encoding="utf-8"
+            ) as stream:
+                stream.write(
+                    json.dumps(dict(command=command, mode=state["mode"])) + "\n"
+                )
+            failure = self._take_failure(state, command)
+            _write_state(path, state)
+        time.sleep(state["command_latency"])
+        if failure:
+            print(f"error: simulated failure of '{command}'")
+            return 1
+        if self.serial and self.serial != state["serial"]:
+            print(f"error: device '{self.serial}' not found")
+            return 1
+        handler = getattr(
+            self,
+            f"{self.tool}_{self.args[0] if self.args else ''}".replace("-", "_"),
+            None,
+        )
+        if handler is None:
+            print(f"{self.tool}: unknown command {' '.join(self.args)}")
+            return 1
+        return handler(state, *self.args[1:])
+
+    def _strip_selectors(self, args: List[str]) -> List[str]:
+        stripped = []
+        args = iter(args)
+        for arg in args:
+            if arg == "-d" and self.tool == "adb":
+                continue
+            if arg == "-s" and self.tool in ("adb", "fastboot"):
+                self.serial = next(args, None)
+                continue
+            stripped.append(arg)
+        return stripped
+
+    @staticmethod
+    def _take_failure(state: dict, command: str) -> bool:
+        for prefix, times in state["failures"].items():
+            if command.startswith(prefix) and times != 0:
+                state["failures"][prefix] = times - 1 if times > 0 else times
+                return True
+        return False
+
+    def _update(self, change) -> dict:
+        """Change the state of the device under the lock and return it."""
+        with _locked(self.bin_path) as path:
+            state = _resolve(_read_state(path))
+            change(state)
+            _write_state(path, state)
+        return state
+
+    def _current(self) -> dict:
+        with _locked(self.bin_path) as path:
+            return _resolve(_read_state(path))
+
+    def _transfer(self, state: dict, image: str) -> Iterator[int]:
+        """Spend the time to transfer the image and yield the progress in percent."""
+        size = os.path.getsize(image)
+        duration = size / state["transfer_rate"] if state["transfer_rate"] else 0
+        steps = max(1, state["progress_lines"])
+        for step in range(1, steps + 1):
+            time.sleep(duration / steps)
+            yield step * 100 // steps
+
+    # adb
+
+    def adb_version(self, state: dict) -> int:
+        print("Android Debug Bridge version 1.0.41")
+        print("Version 34.0.5-simulated")
+        return 0
+
+    def adb_start_server(self, state: dict) -> int:
+        return 0
+
+    adb_kill_server = adb_start_server
+
+    def adb_devices(self, state: dict, *options) -> int:
+        print("List of devices attached")
+        adb_state = ADB_STATES.get(state["mode"])
+        if adb_state:
+            line = f"{state['serial']}\t{adb_state}"
+            if "-l" in options:
+                code = state["device_code"]
+                line += f" usb:1-1 product:{code} model:Simulated device:{code} transport_id:1"
+            print(line)
+        print()
+        return 0
+
+    def adb_get_state(self, state: dict) -> int:
+        adb_state = ADB_STATES.get(state["mode"])
+        if not adb_state:
+            print("error: no devices/emulators found")
+            return 1
+        print(adb_state)
+        return 0
+
+    def _wait_for(self, mode: str) -> int:
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while self._current()["mode"] != mode:
+            if time.monotonic() > deadline:
+                print(f"error: timeout waiting for {mode}")
+                return 1
+            time.sleep(POLL_INTERVAL)
+        return 0
+
+    def adb_wait_for_device(self, state: dict) -> int:
+        return self._wait_for("system")
+
+    def adb_wait_for_recovery(self, state: dict) -> int:
+        return self._wait_for("recovery")
+
+    def adb_wait_for_sideload(self, state: dict) -> int:
+        return self._wait_for("sideload")
+
+    def adb_reboot(self, state: dict, target: str = "") -> int:
+        if state["mode"] not in ADB_STATES:
+            print("error: no devices/emulators found")
+            return 1
+        if target not in ADB_REBOOT_TARGETS:
+            print(f"error: unknown reboot target '{target}'")
+            return 1
+        self._update(lambda state: _reboot(state, ADB_REBOOT_TARGETS[target]))
+        return 0
+
+    def adb_sideload(self, state: dict, image: str = "") -> int:
+        if state["mode"] != "sideload":
+            print("adb: sideload connection failed: no devices/emulators found")
+            return 1
+        if not os.path.exists(image):
+            print(f"adb: failed to stat file {image}: No such file or directory")
+            return 1
+        name = os.path.basename(image)
+        for percentage in self._transfer(state, image):
+            print(f"serving: '{name}'  (~{min(percentage, 99)}%)    ", flush=True)
+        print("Total xfer: 1.00x")
+        # TWRP installs the zip and returns to recovery
+        self._update(lambda state: _reboot(state, "recovery", state["install_time"]))
+        return 0
+
+    def adb_shell(self, state: dict, *command) -> int:
+        if state["mode"] not in ("system", "recovery"):
+            print("error: closed")
+            return 1
+        text = " ".join(command)
+        if text.startswith("twrp"):
+            return self._twrp(state, command[1:])
+        if text.startswith("getprop"):
+            print(
+                self._properties(state).get(command[1], "") if len(command) > 1 else ""
+            )
+            return 0
+        values = self._properties(state)
+        for name in PROPERTY_NAME_PATTERN.findall(text):
+            print(f"[{name}]: [{values.get(name, '')}]")
+        return 0
+
+    def _twrp(self, state: dict, command) -> int:
+        if state["mode"] != "recovery":
+            print("/system/bin/sh: twrp: inaccessible or not found")
+            return 127
+        action, *arguments = command or ("",)
+        if action == "sideload":
+            self._update(lambda state: _reboot(state, "sideload", 0))
+            print("Starting ADB sideload feature...")
+        elif action == "format" and not state["twrp_format_data"]:
+            print("Unrecognized script command: 'format'")
+        elif action in ("format", "wipe"):
+            print(f"{action.capitalize()}ing {' '.join(arguments)}...")
+            print("Done.")
+        else:
+            print(f"Unrecognized script command: '{action}'")
+        return 0
+
+    @staticmethod
+    def _properties(state: dict) -> Dict[str, str]:
+        code = state["device_code"]
+        return {
+            "ro.serialno": state["serial"],
+            "ro.product.device": code,
+            "ro.product.vendor.device": code,
+            "ro.build.version.release": "12",
+            "ro.build.version.sdk": "31",
+            "ro.boot.slot_suffix": f"_{state['slot']}",
+            "ro.boot.flash.locked": "0" if state["unlocked"] else "1",
+            "ro.boot.vbmeta.device_state": (
+                "unlocked" if state["unlocked"] else "locked"
+            ),
+            "battery.level": "100",
+            **state["properties"],
+        }
+
+    # fastboot
+
+    def _fastboot_ready(self, state: dict) -> bool:
+        if state["mode"] != "bootloader":
+            print("< waiting for any device >")
+            return False
+        return True
+
+    @staticmethod
+    def _okay(seconds: float = 0.0):
+        print(f"OKAY [{seconds:7.3f}s]")
+        print(f"Finished. Total time: {seconds:.3f}s")
+
+    def fastboot___version(self, state: dict) -> int:
+        print("fastboot version 34.0.5-simulated")
+        return 0
+
+    def fastboot_devices(self, state: dict, *options) -> int:
+        if state["mode"] == "bootloader":
+            print(
+                f"{state['serial']}\tfastboot" + (" usb:1-1" if "-l" in options else "")
+            )
+        return 0
+
+    def fastboot_getvar(self, state: dict, name: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        values = {
+            "current-slot": state["slot"],
+            "unlocked": "yes" if state["unlocked"] else "no",
+            "product": state["device_code"],
+        }
+        print(f"{name}: {values.get(name, '')}")
+        print("Finished. Total time: 0.001s")
+        return 0
+
+    def _unlock(self, state: dict) -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        self._update(lambda state: state.update(unlocked=True))
+        self._okay()
+        return 0
+
+    def fastboot_flashing(self, state: dict, action: str = "") -> int:
+        if action in ("unlock", "unlock_critical"):
+            return self._unlock(state)
+        print(f"fastboot: usage: unknown 'flashing' command {action}")
+        return 1
+
+    def fastboot_oem(self, state: dict, action: str = "", *arguments) -> int:
+        if action == "unlock":
+            return self._unlock(state)
+        if action == "get_unlock_data":
+            if not self._fastboot_ready(state):
+                return 1
+            print("(bootloader) Unlock data:")
+            print(f"(bootloader) {state['serial']}#SIMULATED#UNLOCK#DATA")
+            self._okay()
+            return 0
+        print(f"FAILED (remote: 'unknown command {action}')")
+        return 1
+
+    def fastboot_reboot(self, state: dict, target: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        modes = {"": "system", "bootloader": "bootloader", "recovery": "recovery"}
+        if target not in modes:
+            print(f"fastboot: error: unknown reboot target {target}")
+            return 1
+        print("Rebooting" + (f" into {target}" if target else ""))
+        self._update(lambda state: _reboot(state, modes[target]))
+        self._okay()
+        return 0
+
+    def fastboot_reboot_recovery(self, state: dict) -> int:
+        return self.fastboot_reboot(state, "recovery")
+
+    def fastboot_set_active(self, state: dict, slot: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        new_slot = {"a": "b", "b": "a"}[state["slot"]] if slot == "other" else slot
+        print(f"Setting current slot to '{new_slot}'")
+        self._update(lambda state: state.update(slot=new_slot))
+        self._okay()
+        return 0
+
+    def _send(self, state: dict, label: str, image: str, write: bool = True) -> bool:
+        """Print the transfer of the image like fastboot, in sparse chunks if it's large."""
+        if not os.path.exists(image):
+            print(f"fastboot: error: cannot load '{image}': No such file or directory")
+            return False
+        size = os.path.getsize(image)
+        chunks = max(1, -(-size // state["sparse_limit"]))
+        started = time.monotonic()
+        progress = self._transfer(state, image)
+        for chunk in range(1, chunks + 1):
+            chunk_size = min(
+                state["sparse_limit"], size - (chunk - 1) * state["sparse_limit"]
+            )
+            # the time of the transfer is spread over the chunks
+            for _ in range(max(1, state["progress_lines"] // chunks)):
+                next(progress, None)
+            sparse = (
+                f"sparse '{label}' {chunk}/{chunks}" if chunks > 1 else f"'{label}'"
+            )
+            print(
+                f"Sending {sparse} ({chunk_size // 1024} KB)"
+                f"{'OKAY':>20} [{time.monotonic() - started:7.3f}s]",
+                flush=True,
+            )
+            if write:
+                print(f"Writing {sparse}{'OKAY':>20} [  0.000s]", flush=True)
+        for _ in progress:
+            pass
+        return True
+
+    def fastboot_boot(self, state: dict, image: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        if not state["unlocked"]:
+            print("FAILED (remote: 'Device is locked')")
+            return 1
+        if not self._send(state, "boot.img", image, write=False):
+            return 1
+        print("Booting")
+        self._update(lambda state: _reboot(state, "recovery"))
+        self._okay()
+        return 0
+
+    def fastboot_flash(self, state: dict, partition: str = "", image: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        if not state["unlocked"]:
+            print("FAILED (remote: 'Flashing is not allowed in Lock State')")
+            return 1
+        if not self._send(state, f"{partition}_{state['slot']}", image):
+            return 1
+        self._okay()
+        return 0
+
+    def fastboot___disable_verity(self, state: dict, *arguments) -> int:
+        arguments = [
+            argument for argument in arguments if argument != "--disable-verification"
+        ]
+        if not arguments or arguments[0] != "flash":
+            print("fastboot: usage: --disable-verity needs a flash command")
+            return 1
+        return self.fastboot_flash(state, *arguments[1:])
+
+    def fastboot_wipe_super(self, state: dict, image: str = "") -> int:
+        if not self._fastboot_ready(state):
+            return 1
+        if not self._send(state, "super", image):
+            return 1
+        self._okay()
+        return 0
+
+    # heimdall
+
+    def heimdall_info(self, state: dict) -> int:
+        print("Heimdall v2.0.1-simulated")
+        return 0
+
+    heimdall_version = heimdall_info
+
+    def heimdall_detect(self, state: dict) -> int:
+        if state["mode"] != "download":
+            print("ERROR: Failed to detect compatible download-mode device.")
+            return 1
+        print("Device detected")
+        return 0
+
+    def heimdall_flash(self, state: dict, *arguments) -> int:
+        if state["mode"] != "download":
+            print("ERROR: Failed to detect compatible download-mode device.")
+            return 1
+        no_reboot = "--no-reboot" in arguments
+        images = [argument for argument in arguments if not argument.startswith("--")]
+        partitions = [
+            argument[2:]
+            for argument in arguments
+            if argument.startswith("--") and argument != "--no-reboot"
+        ]
+        if not images or not os.path.exists(images[-1]):
+            print("ERROR: Failed to open file")
+            return 1
+        print("Initialising connection...")
+        print("Uploading " + " ".join(partitions))
+        for percentage in self._transfer(state, images[-1]):
+            print(f"{percentage}%", flush=True)
+        print(f"{' '.join(partitions)} upload successful")
+        if not no_reboot:
+            self._update(lambda state: _reboot(state, "system"))
+        return 0
+
+
+def main(argv: List[str]) -> int:
+    bin_path, tool, *args = argv
+    return SimulatedTool(Path(bin_path), tool, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+"""Test the client for the adb server protocol against a local fake server."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import socketserver
+import struct
+import threading
+
+import pytest
+
+from openandroidinstaller import tooling
+from openandroidinstaller.adb_client import AdbClient, AdbError, parse_devices
+
+DEVICES = "R58M123ABC   recovery usb:1-1.2 product:sargo model:Pixel_3a device:sargo transport_id:3\n"
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    """Serve the subset of the adb server protocol used by the client."""
+
+    def read_exactly(self, length):
+        data = b""
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError()
+            data += chunk
+        return data
+
+    def read_request(self):
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length).decode()
+
+    def okay(self, payload=None):
+        self.request.sendall(b"OKAY")
+        if payload is not None:
+            self.request.sendall(f"{len(payload):04x}{payload}".encode())
+
+    def fail(self, message):
+        self.request.sendall(f"FAIL{len(message):04x}{message}".encode())
+
+    def handle(self):
+        server = self.server
+        service = self.read_request()
+        server.requests.append(service)
+        if service == "host:version":
+            self.okay("0029")
+        elif service == "host:devices-l":
+            self.okay(DEVICES)
+        elif service.endswith(":features"):
+            self.okay("shell_v2,cmd")
+        elif service in ("host:transport-usb", "host:transport:R58M123ABC"):
+            self.okay()
+            self.handle_device_service(self.read_request())
+        else:
+            self.fail(f"unknown service {service}")
+
+    def handle_device_service(self, service):
+        server = self.server
+        server.requests.append(service)
+        if service == "shell,v2,raw:sleep":
+            self.okay()
+            # only ends once the client closes the connection
+            self.request.recv(1)
+        elif service.startswith("shell,v2,raw:"):
+            self.okay()
+            output = b"first line\nsecond line\n"
+            self.request.sendall(struct.pack("<BI", 1, len(output)) + output)
+            self.request.sendall(struct.pack("<BI", 3, 1) + bytes([server.exit_code]))
+        elif service.startswith("reboot:"):
+            self.okay()
+        elif service.startswith("sideload-host:"):
+            size, block_size = map(int, service.split(":")[1:])
+            self.okay()
+            received = b""
+            for block in range((size + block_size - 1) // block_size):
+                self.request.sendall(f"{block:08d}".encode())
+                received += self.read_exactly(
+                    min(block_size, size - block * block_size)
+                )
+            server.sideloaded = received
+            self.request.sendall(b"DONEDONE")
+        else:
+            self.fail("closed")
+
+
+@pytest.fixture
+def fake_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeAdbHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.exit_code = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(fake_server):
+    return AdbClient(port=fake_server.server_address[1], timeout=2)
+
+
+def test_parse_devices():
+    """Test if the output of `adb devices -l` is parsed properly."""
+    devices = parse_devices("List of devices attached\n" + DEVICES + "\n")
+
+    assert len(devices) == 1
+    assert devices[0].serial == "R58M123ABC"
+    assert devices[0].state == "recovery"
+    assert devices[0].usb == "1-1.2"
+    assert devices[0].model == "Pixel_3a"
+    assert devices[0].device == "sargo"
+
+
+def test_parse_devices_without_permissions():
+    """Test if states containing spaces are kept as a whole."""
+    devices = parse_devices(
+        "R58M123ABC   no permissions (missing udev rules? user is in the plugdev group); "
+        "see [http://developer.android.com/tools/device.html] usb:1-1.2 transport_id:3\n"
+    )
+
+    assert devices[0].state.startswith("no permissions (missing udev rules?")
+    assert devices[0].state.endswith("[http://developer.android.com/tools/device.html]")
+    assert devices[0].usb == "1-1.2"
+    assert devices[0].transport_id == "3"
+
+
+def test_devices(client):
+    """Test if the device list is requested from the server."""
+    assert client.is_available()
+    devices = client.devices()
+
+    assert [device.serial for device in devices] == ["R58M123ABC"]
+
+
+def test_unavailable_server():
+    """Test if a missing server is detected."""
+    assert not AdbClient(port=1, timeout=0.5).is_available()
+
+
+def test_read_error(client):
+    """Test if protocol errors raise an AdbError."""
+    with pytest.raises(AdbError):
+        with client._connect(timeout=2) as sock:
+            client._request(sock, "host:unknown")
+
+
+def test_shell(client, fake_server):
+    """Test if shell output and exit code are reported like run_command."""
+    output = list(client.shell("twrp wipe cache", serial="R58M123ABC"))
+
+    assert output == ["first line", "second line", True]
+    assert "shell,v2,raw:twrp wipe cache" in fake_server.requests
+
+    fake_server.exit_code = 1
+    assert list(client.shell("twrp wipe cache"))[-1] is False
+
+
+def test_reboot(client, fake_server):
+    """Test if a reboot is requested through the usb transport."""
+    output = list(client.reboot("bootloader"))
+
+    assert output[-1] is True
+    assert fake_server.requests[-2:] == ["host:transport-usb", "reboot:bootloader"]
+
+
+def test_unknown_transport(client):
+    """Test if errors of the server are reported as failure."""
+    output = list(client.reboot(serial="unknown"))
+
+    assert output[-1] is False
+
+
+def test_sideload(client, fake_server, tmp_path):
+    """Test if a file is served block by block and progress is reported."""
+    image = tmp_path.joinpath("image.zip")
+    content = bytes(range(256)) * 1000
+    image.write_bytes(content)
+
+    output = list(client.sideload(str(image), block_size=4096))
+
+    assert output[-1] is True
+    assert fake_server.sideloaded == content
+    assert "serving: 'image.zip'  (~48%)" in output
+    assert output[-2].startswith("Total xfer:")
+
+
+def test_run_command_through_server(client, fake_server, monkeypatch, tmp_path):
+    """Test if the tooling sends adb commands to a running server instead of spawning adb."""
+    monkeypatch.setattr(tooling, "_adb_client", client)
+    image = tmp_path.joinpath("image.zip")
+    image.write_bytes(b"lineage" * 100)
+
+    output = list(
+        tooling.run_command(
+            "adb -d reboot bootloader", tmp_path.joinpath("bin"), serial="R58M123ABC"
+        )
+    )
+    assert output == ["$adb -d reboot bootloader", True]
+    assert fake_server.requests[-2:] == [
+        "host:transport:R58M123ABC",
+        "reboot:bootloader",
+    ]
+
+    output = list(tooling.run_command("adb -d shell twrp sideload", tmp_path))
+    assert output == ["$adb -d shell twrp sideload", "first line", "second line", True]
+
+    output = list(tooling.run_command("adb -d sideload", tmp_path, target=image))
+    assert output[-1] is True
+    assert fake_server.sideloaded == image.read_bytes()
+
+
+def test_terminate_command_through_server(client, fake_server, monkeypatch, tmp_path):
+    """Test if a command running through the server can be terminated like a process."""
+    monkeypatch.setattr(tooling, "_adb_client", client)
+    output = []
+    thread = threading.Thread(
+        target=lambda: output.extend(
+            tooling.run_command("adb -d shell sleep", tmp_path)
+        )
+    )
+    thread.start()
+    while "shell,v2,raw:sleep" not in fake_server.requests:
+        thread.join(0.01)
+
+    assert tooling.terminate_command(thread.ident)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert output[-1] is False
@@ -10,6 +10,14 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+from pathlib import Path
+
+from openandroidinstaller.app_state import AppState, StepPlan
+from openandroidinstaller.installer_config import Step
+from openandroidinstaller.journal import InstallJournal, read_journal
+from openandroidinstaller.openandroidinstaller import MainView
+from openandroidinstaller.views import InstallAddonsView, SelectFilesView
+from openandroidinstaller.views.select_view import CheckResult, CompatibilityStatus
 
 
 class MockResult:
@@ -67,3 +75,187 @@ class MockConn:
 #         .right_view_header.controls[0]
 #         .content.controls[0]
 #     )
+
+
+def test_lazy_views(mocker):
+    """Test if views are created on first navigation and released once the user can't go back."""
+    mocker.patch("flet.Column.update")
+    state = AppState(
+        platform="linux",
+        config_path=Path("openandroidinstaller/assets/configs"),
+        bin_path=Path("bin"),
+        test=True,
+    )
+    main_view = MainView(state=state)
+    assert main_view.views == {}
+
+    main_view.build()
+    welcome_view = main_view.view.controls[0]
+    assert type(welcome_view).__name__ == "WelcomeView"
+    assert list(main_view.views) == ["welcome"]
+
+    # going back shows the same view again
+    main_view.to_next_view(None)
+    assert type(main_view.view.controls[0]).__name__ == "StartView"
+    main_view.to_previous_view(None)
+    assert main_view.view.controls[0] is welcome_view
+
+    for _ in range(3):
+        main_view.to_next_view(None)
+    assert type(main_view.view.controls[0]).__name__ == "SelectFilesView"
+    assert list(main_view.views) == ["welcome", "start", "requirements", "select_files"]
+
+    # there is no way back from the steps
+    state.load_config("sargo")
+    state.steps = StepPlan(
+        (Step(title="Unlock", type="confirm_button", content="Unlock"),)
+    )
+    main_view.to_next_view(None)
+    step_view = main_view.view.controls[0]
+    assert type(step_view).__name__ == "StepView"
+    assert main_view.views == {}
+
+    # released views stop the threads of their task runners
+    step_shutdown = mocker.spy(step_view.task_runner, "shutdown")
+    main_view.to_next_view(None)
+    install_view = main_view.view.controls[0]
+    assert type(install_view).__name__ == "InstallView"
+    assert list(main_view.views) == ["install"]
+    assert step_shutdown.call_count == 1
+    install_shutdown = mocker.spy(install_view.task_runner, "shutdown")
+    main_view.to_next_view(None)
+    assert list(main_view.views) == ["success"]
+    assert install_shutdown.call_count == 1
+
+
+def test_journal_steps(mocker, tmp_path):
+    """Test if skipped steps are journaled apart from the completed ones until the installation finished."""
+    mocker.patch("flet.Column.update")
+    state = AppState(
+        platform="linux",
+        config_path=Path("openandroidinstaller/assets/configs"),
+        bin_path=Path("bin"),
+        test=True,
+    )
+    main_view = MainView(state=state)
+    main_view.build()
+    for _ in range(3):
+        main_view.to_next_view(None)
+    state.load_config("sargo")
+    state.steps = StepPlan(
+        (
+            Step(title="Unlock", type="confirm_button", content="Unlock"),
+            Step(title="Boot", type="confirm_button", content="Boot"),
+        )
+    )
+    main_view.to_next_view(None)
+    journal = state.journal = InstallJournal("ABC123", tmp_path)
+    journal.start(state.config, state.flow)
+
+    main_view.view.controls[0].on_skip(None)
+    main_view.to_next_view(None)
+    checkpoint = read_journal(journal.path)
+    assert checkpoint.skipped == {0}
+    assert checkpoint.completed == {1}
+
+    main_view.to_next_view(None)
+    assert type(main_view.view.controls[0]).__name__ == "SuccessView"
+    assert state.journal is None
+    assert read_journal(journal.path).finished
+
+
+def test_missing_image(mocker):
+    """Test if the user stays on the current view if an image needed by a step is missing."""
+    mocker.patch("flet.Column.update")
+    state = AppState(
+        platform="linux",
+        config_path=Path("openandroidinstaller/assets/configs"),
+        bin_path=Path("bin"),
+        test=True,
+    )
+    main_view = MainView(state=state)
+    main_view.build()
+    for _ in range(3):
+        main_view.to_next_view(None)
+    select_view = main_view.view.controls[0]
+    state.load_config("sargo")
+    show_flow_error = mocker.patch.object(main_view, "show_flow_error")
+
+    main_view.to_next_view(None)
+
+    assert main_view.view.controls[0] is select_view
+    assert "needs the recovery image" in show_flow_error.call_args.args[0]
+    assert state.steps.cursor == 0
+
+    # once the images are selected, the steps start
+    state.image_path, state.recovery_path = "image.zip", "twrp.img"
+    main_view.to_next_view(None)
+    assert type(main_view.view.controls[0]).__name__ == "StepView"
+
+
+def test_checksum_verification(mocker, tmp_path):
+    """Test if the buttons stay disabled until the checksum of the image is verified."""
+    mocker.patch("flet.Control.update")
+    state = AppState(
+        platform="linux",
+        config_path=Path("openandroidinstaller/assets/configs"),
+        bin_path=Path("bin"),
+        test=True,
+    )
+    state.load_config("sargo")
+    state.flash_recovery = False
+    image = tmp_path.joinpath("lineage-21.0-20240101-nightly-sargo-signed.zip")
+    image.write_bytes(b"image")
+    state.image_path = str(image)
+    view = SelectFilesView(state=state, on_confirm=None, on_back=None)
+    view.build()
+    view.checksum_progress.build()
+    view.selected_image.value = f"Selected image: {image.name}"
+    view.image_compatibility = CheckResult(CompatibilityStatus.COMPATIBLE, "")
+    mocker.patch.object(view, "verify_checksum")
+
+    view.start_checksum_verification()
+    assert view.checksum_pending
+    assert view.confirm_button.disabled
+    assert view.continue_eitherway_button.disabled
+
+    # the view isn't shown on a page, so the result of the background thread isn't pushed
+    mocker.patch(
+        "openandroidinstaller.views.select_view.verify_image_checksum",
+        return_value=CheckResult(CompatibilityStatus.UNKNOWN, "No checksum found."),
+    )
+    SelectFilesView.verify_checksum(view, view._checksum_run, state.image_path, "")
+    assert not view.checksum_pending
+    assert not view.confirm_button.disabled
+
+
+def test_install_addons_view(mocker, fake_device, tmp_path):
+    """Test if the addon view runs the addon nodes of the install flow on the device."""
+    mocker.patch("flet.Control.update")
+    fake_device.set(mode="recovery", unlocked=True)
+    addon = tmp_path.joinpath("gapps.zip")
+    addon.write_bytes(b"\0" * 1024)
+    state = AppState(
+        platform="linux",
+        config_path=Path("openandroidinstaller/assets/configs"),
+        bin_path=fake_device.bin_path,
+    )
+    state.load_config("sargo")
+    state.image_path = "image.zip"
+    state.install_addons = True
+    state.addon_paths = [str(addon)]
+    view = InstallAddonsView(state=state, on_confirm=lambda _: None)
+    view.build()
+    # flet builds the widgets once they are added to a page
+    view.progress_indicator.build()
+    view.terminal_box.build()
+
+    view.run_install_addons(None)
+
+    assert view.task_runner.wait(timeout=30) is True
+    commands = fake_device.commands()
+    assert f"adb sideload {addon}" in commands
+    # the OS was installed by the install view before
+    assert "adb shell twrp wipe cache" not in commands
+    assert fake_device.mode == "system"
+    view.release()
@@ -0,0 +1,97 @@
+"""Test the step management of the app state."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+from openandroidinstaller.app_state import (
+    BOOT_FLASHED_RECOVERY_STEP,
+    AppState,
+    Step,
+    StepPlan,
+)
+
+
+@pytest.fixture
+def state(config_path):
+    state = AppState(platform="linux", config_path=config_path, bin_path=Path("bin"))
+    state.load_config("sargo")
+    return state
+
+
+def test_step_is_immutable():
+    """Test if steps can't be changed and get a default image."""
+    step = Step(title="Unlock the bootloader", type="text", content="Unlock")
+
+    assert step.img == "unlock-bootloader-default.png"
+    assert Step(title="Other", type="text", content="").img == "placeholder.png"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        step.command = "adb_reboot"
+    assert not hasattr(step, "__dict__")
+
+
+def test_step_plan():
+    """Test if the plan moves a cursor over the steps."""
+    steps = tuple(Step(title=str(num), type="text", content="") for num in range(3))
+    plan = StepPlan(steps)
+
+    assert len(plan) == 3
+    assert plan.current is steps[0]
+    assert [plan.advance() for _ in range(3)] == list(steps)
+    assert not plan
+    assert plan.current is None
+    with pytest.raises(IndexError):
+        plan.advance()
+
+
+def test_toggle_steps(state):
+    """Test if toggling the switches plans the steps of the config without copying them."""
+    config = state.config
+    assert state.steps.steps == config.unlock_bootloader + config.boot_recovery
+
+    state.toggle_flash_unlock_bootloader()
+    assert state.steps.steps is config.boot_recovery
+
+    state.toggle_flash_recovery()
+    assert state.steps.steps == (BOOT_FLASHED_RECOVERY_STEP,)
+
+    state.toggle_flash_unlock_bootloader()
+    assert state.steps.steps == (BOOT_FLASHED_RECOVERY_STEP,)
+
+    state.toggle_flash_recovery()
+    assert state.steps.steps[0] is config.unlock_bootloader[0]
+    assert len(state.steps) == len(config.unlock_bootloader + config.boot_recovery)
+
+
+def test_compile_install_flow(state, mocker):
+    """Test if the install flow installs the OS first and then the selected addons."""
+    state.image_path = "lineage.zip"
+    state.device_properties = mocker.Mock(serial="ABC123")
+
+    install_flow = state.compile_install_flow()
+    assert [node.command for node in install_flow.nodes] == [
+        "adb_twrp_wipe_and_install"
+    ]
+    assert install_flow.nodes[0].function.keywords["serial"] == "ABC123"
+
+    state.install_addons = True
+    state.addon_paths = ["gapps.zip"]
+    install_flow = state.compile_install_flow()
+    assert [node.command for node in install_flow.nodes] == [
+        "adb_twrp_wipe_and_install",
+        "adb_twrp_install_addon",
+        "adb_twrp_finish_install_addons",
+    ]
+    assert install_flow.nodes[0].function.keywords["install_addons"]
+    assert install_flow.nodes[1].function.keywords["addon_path"] == "gapps.zip"
@@ -0,0 +1,100 @@
+"""Test the checksum verification of OS images."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import hashlib
+
+import pytest
+
+from openandroidinstaller import checksum
+from openandroidinstaller.checksum import (
+    CompatibilityStatus,
+    normalize_checksum,
+    read_sidecar_checksum,
+    sha256_file,
+    verify_image_checksum,
+)
+
+CONTENT = bytes(range(256)) * 5000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path.joinpath("lineage-21.0-20240101-nightly-sargo-signed.zip")
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+def test_normalize_checksum():
+    """Test if checksums are read from the format of sha256sum."""
+    assert normalize_checksum(f"{DIGEST.upper()}  image.zip\n") == DIGEST
+    assert normalize_checksum("not a checksum") is None
+    assert normalize_checksum("") is None
+
+
+def test_sha256_file_progress(image_path):
+    """Test if the digest is streamed in blocks and the progress is reported."""
+    progress = []
+    digest = sha256_file(
+        image_path,
+        progress_callback=lambda done, total: progress.append((done, total)),
+        buffer_size=100000,
+    )
+
+    assert digest == DIGEST
+    assert len(progress) == 13
+    assert progress[-1] == (len(CONTENT), len(CONTENT))
+
+
+def test_sha256_file_cached(image_path, mocker):
+    """Test if an unchanged image is hashed only once."""
+    spy = mocker.spy(checksum.hashlib, "sha256")
+
+    assert sha256_file(image_path) == DIGEST
+    assert sha256_file(image_path) == DIGEST
+    assert spy.call_count == 1
+
+    # changing the file invalidates the cached digest
+    with open(image_path, "ab") as image:
+        image.write(b"more")
+    assert sha256_file(image_path) != DIGEST
+    assert spy.call_count == 2
+
+
+def test_verify_with_sidecar(mocker, image_path):
+    """Test if the checksum file next to the image is used."""
+    spy = mocker.spy(checksum.hashlib, "sha256")
+    assert read_sidecar_checksum(image_path) is None
+    assert verify_image_checksum(image_path).status == CompatibilityStatus.UNKNOWN
+    # without a checksum to compare with, the image isn't hashed
+    assert spy.call_count == 0
+
+    with open(image_path + ".sha256", "w") as sidecar:
+        sidecar.write(f"{DIGEST}  image.zip\n")
+    assert read_sidecar_checksum(image_path) == DIGEST
+    assert verify_image_checksum(image_path).status == CompatibilityStatus.COMPATIBLE
+
+
+def test_verify_with_given_checksum(image_path):
+    """Test if a checksum given by the user is compared."""
+    assert (
+        verify_image_checksum(image_path, expected=DIGEST).status
+        == CompatibilityStatus.COMPATIBLE
+    )
+    assert (
+        verify_image_checksum(image_path, expected="0" * 64).status
+        == CompatibilityStatus.INCOMPATIBLE
+    )
+    assert (
+        verify_image_checksum(image_path, expected="abc").status
+        == CompatibilityStatus.INCOMPATIBLE
+    )
@@ -10,13 +10,26 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import os
 from pathlib import Path
 
 import pytest
 import yaml
 
-from openandroidinstaller.installer_config import _load_config
-from openandroidinstaller.installer_config import validate_config
+from openandroidinstaller import installer_config
+from openandroidinstaller.installer_config import (
+    ConfigRegistry,
+    InstallerConfig,
+    _load_config,
+    compile_config_bundle,
+    get_config_bundle,
+)
+from openandroidinstaller.installer_config import (
+    get_config_schema,
+    validate_config,
+    validate_config_file,
+    validate_config_files,
+)
 
 
 @pytest.mark.parametrize(
@@ -49,3 +62,157 @@ def test_load_config_notfound(config_path):
 
     # assert some properties of the config
     assert config is None
+
+
+def test_config_registry_lookup(config_path, cache_dir):
+    """Test if the registry finds configs by device code and persists the index."""
+    registry = ConfigRegistry(config_path)
+
+    assert registry.lookup("sargo") == config_path.joinpath("sargo.yaml")
+    assert registry.lookup("nothing") is None
+    assert list(cache_dir.glob("config-index-*.json"))
+
+
+def test_config_registry_rebuild(tmp_path, mocker):
+    """Test if only new or changed configs are parsed when the index is rebuilt."""
+    config_dir = tmp_path.joinpath("configs")
+    config_dir.mkdir()
+    config_dir.joinpath("a.yaml").write_text(
+        "metadata:\n  supported_device_codes: [alpha]\n"
+    )
+    index_path = tmp_path.joinpath("index.json")
+    assert ConfigRegistry(config_dir, index_path).lookup("alpha")
+
+    # a fresh registry reuses the persisted index without parsing
+    parse = mocker.spy(installer_config, "_read_supported_device_codes")
+    registry = ConfigRegistry(config_dir, index_path)
+    assert registry.lookup("alpha") == config_dir.joinpath("a.yaml")
+    assert parse.call_count == 0
+
+    # adding a config is picked up and only the new file is parsed
+    config_dir.joinpath("b.yaml").write_text(
+        "metadata:\n  supported_device_codes: [beta, gamma]\n"
+    )
+    registry.rebuild()
+    assert registry.lookup("gamma") == config_dir.joinpath("b.yaml")
+    assert parse.call_count == 1
+
+
+def test_config_registry_edit_in_place(tmp_path):
+    """Test if configs edited in place are picked up without a change of the directory."""
+    config_dir = tmp_path.joinpath("configs")
+    config_dir.mkdir()
+    a_path = config_dir.joinpath("a.yaml")
+    b_path = config_dir.joinpath("b.yaml")
+    a_path.write_text("metadata:\n  supported_device_codes: [alpha]\n")
+    b_path.write_text("metadata:\n  supported_device_codes: [beta]\n")
+    registry = ConfigRegistry(config_dir, tmp_path.joinpath("index.json"))
+    assert registry.lookup("alpha") == a_path
+    dir_mtime_ns = config_dir.stat().st_mtime_ns
+
+    # move the device code from one config to the other
+    a_path.write_text("metadata:\n  supported_device_codes: [gamma, delta]\n")
+    b_path.write_text("metadata:\n  supported_device_codes: [beta, alpha]\n")
+    assert config_dir.stat().st_mtime_ns == dir_mtime_ns
+
+    assert registry.lookup("alpha") == b_path
+    assert registry.lookup("gamma") == a_path
+
+
+def test_config_registry_misses(tmp_path, mocker):
+    """Test if unknown device codes don't rescan the directory until it changes."""
+    config_dir = tmp_path.joinpath("configs")
+    config_dir.mkdir()
+    config_dir.joinpath("a.yaml").write_text(
+        "metadata:\n  supported_device_codes: [alpha]\n"
+    )
+    registry = ConfigRegistry(config_dir, tmp_path.joinpath("index.json"))
+    rebuild = mocker.spy(registry, "_rebuild")
+
+    assert registry.lookup("nothing") is None
+    assert registry.lookup("nothing") is None
+    assert rebuild.call_count == 1
+
+    # adding a config changes the directory
+    dir_mtime_ns = config_dir.stat().st_mtime_ns
+    config_dir.joinpath("b.yaml").write_text(
+        "metadata:\n  supported_device_codes: [nothing]\n"
+    )
+    # the clock of the file system may not have ticked since the index was built
+    os.utime(config_dir, ns=(dir_mtime_ns, dir_mtime_ns + 1_000_000))
+    assert registry.lookup("nothing") == config_dir.joinpath("b.yaml")
+    assert rebuild.call_count == 2
+
+
+def test_validate_config_files(config_path):
+    """Test if all configs are valid in batch mode and the schema is only built once."""
+    assert get_config_schema() is get_config_schema()
+
+    errors = validate_config_files(config_path.glob("*.yaml"))
+
+    assert len(errors) > 1
+    assert not any(errors.values())
+
+
+def test_validate_config_file_errors(tmp_path, config_path):
+    """Test if errors are reported with their location in the file."""
+    valid = config_path.joinpath("sargo.yaml").read_text(encoding="utf-8")
+    invalid = tmp_path.joinpath("invalid.yaml")
+    invalid.write_text(
+        valid.replace("command: adb_reboot_bootloader", "command: rm_rf", 1),
+        encoding="utf-8",
+    )
+    line = valid.splitlines().index("      command: adb_reboot_bootloader") + 1
+
+    (error,) = validate_config_file(invalid)
+
+    assert error.line == line
+    assert error.location == "steps.unlock_bootloader[0].command"
+    assert "'rm_rf' does not match" in error.message
+    assert str(error).startswith(f"{invalid}:{line}: steps.unlock_bootloader[0]")
+
+    broken = tmp_path.joinpath("broken.yaml")
+    broken.write_text("metadata:\n  maintainer: [\n", encoding="utf-8")
+    (error,) = validate_config_file(broken)
+    assert error.line == 3
+    assert error.message.startswith("Invalid YAML")
+
+
+def test_config_bundle(tmp_path, config_path):
+    """Test if configs are loaded from the compiled bundle next to the config directory."""
+    bundle_config_path = tmp_path.joinpath("configs")
+    bundle_path = tmp_path.joinpath("configs.sqlite")
+
+    assert compile_config_bundle(config_path, bundle_path) == {}
+
+    bundle = get_config_bundle(bundle_path)
+    assert "sargo" in bundle.device_codes()
+    config = _load_config(device_code="sargo", config_path=bundle_config_path)
+    expected = InstallerConfig.from_file(config_path.joinpath("sargo.yaml"))
+    assert config.metadata == expected.metadata
+    assert config.requirements == expected.requirements
+    assert [step.command for step in config.boot_recovery] == [
+        step.command for step in expected.boot_recovery
+    ]
+    assert _load_config(device_code="nothing", config_path=bundle_config_path) is None
+    bundle.close()
+
+
+def test_config_bundle_invalid(tmp_path, config_path):
+    """Test if no bundle is compiled from invalid configs."""
+    config_dir = tmp_path.joinpath("configs")
+    config_dir.mkdir()
+    valid = config_path.joinpath("sargo.yaml").read_text(encoding="utf-8")
+    config_dir.joinpath("sargo.yaml").write_text(valid, encoding="utf-8")
+    config_dir.joinpath("invalid.yaml").write_text(
+        valid.replace("is_ab_device: true", "is_ab_device: maybe"), encoding="utf-8"
+    )
+    bundle_path = tmp_path.joinpath("configs.sqlite")
+
+    errors = compile_config_bundle(config_dir, bundle_path)
+
+    assert list(errors) == [config_dir.joinpath("invalid.yaml")]
+    assert errors[config_dir.joinpath("invalid.yaml")][0].location == (
+        "metadata.is_ab_device"
+    )
+    assert not bundle_path.exists()
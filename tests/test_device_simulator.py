@@ -0,0 +1,219 @@
+"""Test complete flows of the tooling module against the simulated device."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import pytest
+
+from openandroidinstaller.flow import FlowOptions, compile_flow
+from openandroidinstaller.installer_config import _load_config
+from openandroidinstaller.progress import ProgressParser
+from openandroidinstaller.tooling import (
+    ProgressEvent,
+    adb_twrp_finish_install_addons,
+    adb_twrp_install_addon,
+    adb_twrp_wipe_and_install,
+    fastboot_flash_recovery,
+    get_device_properties,
+    heimdall_flash_recovery,
+    list_devices,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    """The flows wait between some commands for real devices; the simulated one is faster."""
+    monkeypatch.setattr("openandroidinstaller.tooling.sleep", lambda seconds: None)
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path.joinpath("lineage.zip")
+    path.write_bytes(b"\0" * 64 * 1024)
+    return str(path)
+
+
+def run(flow):
+    """Run the flow and return the output and its success."""
+    output = list(flow)
+    return output[:-1], output[-1]
+
+
+def test_device_lists(fake_device):
+    """Test if the device is listed by the tool of its mode."""
+    assert [
+        (device.serial, device.state) for device in list_devices(fake_device.bin_path)
+    ] == [("SIM0001", "device")]
+    assert list_devices(fake_device.bin_path)[0].device == "sargo"
+
+    fake_device.set(mode="bootloader")
+    assert [device.state for device in list_devices(fake_device.bin_path)] == [
+        "bootloader"
+    ]
+
+    fake_device.set(mode="off")
+    assert list_devices(fake_device.bin_path) == []
+
+
+def test_device_properties(fake_device):
+    """Test if the properties are read like from a real device."""
+    fake_device.set(properties={"ro.build.version.release": "13"})
+
+    properties = get_device_properties(fake_device.bin_path, refresh=True)
+
+    assert properties.device_code == "sargo"
+    assert properties.android_version == "13"
+    assert properties.battery_level == 100
+    assert properties.bootloader_locked
+
+
+def test_unlock_and_boot_recovery(fake_device, config_path, image):
+    """Test if the flow of the sargo config unlocks the device and boots the recovery."""
+    config = _load_config("sargo", config_path)
+    flow = compile_flow(
+        config,
+        FlowOptions(
+            bin_path=fake_device.bin_path,
+            config_path=config_path,
+            image=image,
+            recovery=image,
+        ),
+    )
+
+    output, success = run(flow.run())
+
+    assert success
+    assert fake_device.state["unlocked"]
+    assert fake_device.mode == "recovery"
+    commands = fake_device.commands()
+    assert commands.index("adb reboot bootloader") < commands.index(
+        "fastboot flashing unlock"
+    )
+    assert f"fastboot boot {image}" in commands
+
+
+def test_unlock_failure(fake_device, config_path, image):
+    """Test if a failing command stops the flow."""
+    fake_device.set(failures={"fastboot flashing unlock": 1})
+    config = _load_config("sargo", config_path)
+    flow = compile_flow(
+        config,
+        FlowOptions(
+            bin_path=fake_device.bin_path,
+            config_path=config_path,
+            recovery=image,
+        ),
+    )
+
+    _, success = run(flow.run())
+
+    assert not success
+    assert not fake_device.state["unlocked"]
+    assert "fastboot boot" not in " ".join(fake_device.commands())
+
+
+@pytest.mark.parametrize("twrp_format_data", [True, False])
+def test_wipe_and_install(fake_device, config_path, image, twrp_format_data):
+    """Test if the OS is installed with TWRP and the device boots it."""
+    fake_device.set(mode="recovery", unlocked=True, twrp_format_data=twrp_format_data)
+
+    output, success = run(
+        adb_twrp_wipe_and_install(
+            bin_path=fake_device.bin_path,
+            target=image,
+            config_path=config_path,
+            is_ab=True,
+            install_addons=False,
+        )
+    )
+
+    assert success
+    assert fake_device.mode == "system"
+    commands = fake_device.commands()
+    assert f"adb sideload {image}" in commands
+    assert ("adb shell twrp wipe data" in commands) != twrp_format_data
+    parser = ProgressParser()
+    assert max(filter(None, map(parser.feed, output))) == 99
+
+
+def test_install_addons(fake_device, config_path, image):
+    """Test if addons are installed and the a/b-device boots from the same slot again."""
+    fake_device.set(mode="recovery", unlocked=True)
+
+    for flow in (
+        adb_twrp_install_addon(
+            bin_path=fake_device.bin_path, addon_path=image, is_ab=True
+        ),
+        adb_twrp_finish_install_addons(bin_path=fake_device.bin_path, is_ab=True),
+    ):
+        _, success = run(flow)
+        assert success
+
+    assert fake_device.mode == "system"
+    assert fake_device.state["slot"] == "a"
+    assert fake_device.commands().count("fastboot set_active other") == 2
+
+
+def test_flash_progress(fake_device, tmp_path):
+    """Test if flashing in sparse chunks reports the transferred bytes."""
+    recovery = tmp_path.joinpath("twrp.img")
+    recovery.write_bytes(b"\0" * 300 * 1024)
+    fake_device.set(
+        mode="bootloader", unlocked=True, sparse_limit=128 * 1024, transfer_rate=30e6
+    )
+
+    output, success = run(
+        fastboot_flash_recovery(
+            bin_path=fake_device.bin_path, recovery=str(recovery), is_ab=False
+        )
+    )
+
+    assert success
+    events = [line for line in output if isinstance(line, ProgressEvent)]
+    # the last event is reported once fastboot finished
+    assert [event.bytes_done for event in events] == [
+        128 * 1024,
+        256 * 1024,
+        300 * 1024,
+        300 * 1024,
+    ]
+    assert "Sending sparse 'recovery_a' 3/3 (44 KB)" in " ".join(
+        line for line in output if isinstance(line, str)
+    )
+
+
+def test_reboot_time(fake_device, config_path, image):
+    """Test if the flows wait for the device while it reboots."""
+    fake_device.set(mode="recovery", unlocked=True, reboot_time=0.5)
+
+    _, success = run(
+        adb_twrp_finish_install_addons(bin_path=fake_device.bin_path, is_ab=True)
+    )
+
+    assert success
+    # the device was polled while it was gone for the reboot into the bootloader
+    assert "off" in fake_device.modes()
+    assert fake_device.state["booting"]["mode"] == "system"
+
+
+def test_heimdall(fake_device, tmp_path):
+    """Test if heimdall flashes the recovery in download mode."""
+    recovery = tmp_path.joinpath("twrp.img")
+    recovery.write_bytes(b"\0" * 1024)
+    fake_device.set(mode="download")
+
+    output, success = run(
+        heimdall_flash_recovery(bin_path=fake_device.bin_path, recovery=str(recovery))
+    )
+
+    assert success
+    assert fake_device.mode == "download"
+    assert output[-1].bytes_done == 1024
+    assert "100%" in output
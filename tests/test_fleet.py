@@ -0,0 +1,163 @@
+"""Test running flows on several devices with the fleet engine."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import sys
+import threading
+
+import pytest
+
+from openandroidinstaller.fleet import (
+    MAX_SESSION_LINES,
+    DeviceSession,
+    FleetEngine,
+    SessionStatus,
+)
+from openandroidinstaller.tooling import adb_sideload
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="Fake tools are shell scripts."
+)
+
+FAKE_ADB = """#!/bin/sh
+if [ "$1" = "devices" ]; then
+  echo "List of devices attached"
+  echo "A1  device usb:1-1 product:sargo model:Pixel_3a device:sargo"
+  echo "B2  recovery usb:1-2"
+  echo "X9  unauthorized usb:1-3"
+  exit 0
+fi
+echo "serving: '$2 $4'  (~50%)"
+case "$4" in
+  *broken*) echo "adb: failed to read command"; exit 1;;
+esac
+echo "Total xfer: 1.00x"
+"""
+FAKE_FASTBOOT = """#!/bin/sh
+echo "C3  fastboot usb:1-4"
+"""
+
+
+@pytest.fixture
+def bin_path(tmp_path):
+    path = tmp_path.joinpath("bin")
+    path.mkdir()
+    adb = path.joinpath("adb")
+    adb.write_text(FAKE_ADB)
+    adb.chmod(0o755)
+    fastboot = path.joinpath("fastboot")
+    fastboot.write_text(FAKE_FASTBOOT)
+    fastboot.chmod(0o755)
+    return path
+
+
+def sideload_flow(session: DeviceSession):
+    return adb_sideload(
+        bin_path=session.bin_path, target=session.image_path, serial=session.serial
+    )
+
+
+def test_run_fleet(bin_path, tmp_path):
+    """Test if the flows run concurrently and every session gets its own state."""
+    events = []
+    engine = FleetEngine(
+        max_workers=3, on_event=events.append, log_dir=tmp_path.joinpath("logs")
+    )
+    for serial, image in [("A1", "a.zip"), ("B2", "b.zip"), ("C3", "broken.zip")]:
+        engine.add_session(
+            DeviceSession(serial=serial, bin_path=bin_path, image_path=image)
+        )
+
+    # every flow only starts once all three are running, which breaks if they run one by one
+    barrier = threading.Barrier(3, timeout=5)
+
+    def concurrent_flow(session):
+        barrier.wait()
+        yield from sideload_flow(session)
+
+    results = engine.run(concurrent_flow)
+    engine.shutdown()
+
+    assert results == {"A1": True, "B2": True, "C3": False}
+    assert engine.sessions["A1"].status == SessionStatus.SUCCEEDED
+    assert engine.sessions["C3"].status == SessionStatus.FAILED
+    # the progress of the sideload and its end are reported
+    assert engine.sessions["A1"].progress == 99
+    assert engine.sessions["C3"].progress == 50
+    assert [
+        event.value
+        for event in events
+        if event.serial == "A1" and event.kind == "progress"
+    ] == [50, 99]
+    assert "Total xfer: 1.00x" in engine.sessions["B2"].lines
+    assert "Total xfer: 1.00x" not in engine.sessions["C3"].lines
+    # every flow is addressed to its own device
+    assert "serving: 'A1 a.zip'  (~50%)" in engine.sessions["A1"].lines
+    assert {event.serial for event in events if event.kind == "finished"} == {
+        "A1",
+        "B2",
+        "C3",
+    }
+    # every device has its own log file
+    log = tmp_path.joinpath("logs", "A1.log").read_text()
+    assert "a.zip" in log
+    assert "b.zip" not in log
+
+
+def test_discover(bin_path):
+    """Test if sessions are created for usable adb and fastboot devices."""
+    engine = FleetEngine()
+    engine.discover(bin_path)
+
+    assert sorted(engine.sessions) == ["A1", "B2", "C3"]
+    engine.shutdown()
+
+
+def test_duplicate_session(bin_path):
+    """Test if a device can only be added once."""
+    engine = FleetEngine()
+    engine.add_session(DeviceSession(serial="A1", bin_path=bin_path))
+    with pytest.raises(ValueError):
+        engine.add_session(DeviceSession(serial="A1", bin_path=bin_path))
+    engine.shutdown()
+
+
+def test_crashing_flow(bin_path):
+    """Test if an exception in a flow marks the session as failed."""
+
+    def crashing_flow(session):
+        yield "started"
+        raise RuntimeError("unplugged")
+
+    engine = FleetEngine()
+    engine.add_session(DeviceSession(serial="A1", bin_path=bin_path))
+
+    assert engine.run(crashing_flow) == {"A1": False}
+    assert engine.sessions["A1"].status == SessionStatus.FAILED
+    engine.shutdown()
+
+
+def test_session_lines_are_capped(bin_path):
+    """Test if a session only keeps the last output lines."""
+
+    def chatty_flow(session):
+        for number in range(MAX_SESSION_LINES + 10):
+            yield f"line {number}"
+        yield True
+
+    engine = FleetEngine()
+    engine.add_session(DeviceSession(serial="A1", bin_path=bin_path))
+
+    assert engine.run(chatty_flow) == {"A1": True}
+    lines = engine.sessions["A1"].lines
+    assert len(lines) == MAX_SESSION_LINES
+    assert lines[0] == "line 10"
+    engine.shutdown()
@@ -0,0 +1,201 @@
+"""Test the compiler of the flow graphs."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+from pathlib import Path
+
+import pytest
+
+from openandroidinstaller.flow import (
+    FlowError,
+    FlowOptions,
+    compile_flow,
+    plan_steps,
+    session_flow,
+)
+from openandroidinstaller.fleet import DeviceSession
+from openandroidinstaller.installer_config import _load_config
+
+
+@pytest.fixture
+def config(config_path):
+    return _load_config("sargo", config_path)
+
+
+def options(config_path, **kwargs):
+    kwargs = {"image": "image.zip", "recovery": "twrp.img", **kwargs}
+    return FlowOptions(bin_path=Path("bin"), config_path=config_path, **kwargs)
+
+
+def fake_commands(mocker, failing=()):
+    """Replace the command functions by fakes recording the commands which were run."""
+    calls = []
+
+    def command(name):
+        def flow(**kwargs):
+            calls.append((name, kwargs))
+            yield f"${name}"
+            yield name not in failing
+
+        return flow
+
+    names = [
+        "adb_reboot_bootloader",
+        "fastboot_unlock",
+        "fastboot_reboot",
+        "fastboot_boot_recovery",
+        "adb_twrp_wipe_and_install",
+    ]
+    mocker.patch(
+        "openandroidinstaller.flow.get_command_functions",
+        return_value={name: command(name) for name in names},
+    )
+    return calls
+
+
+def test_compile_flow(config, config_path):
+    """Test if the command steps get their functions and the other steps don't."""
+    flow = compile_flow(config, options(config_path, serial="ABC123"))
+
+    steps = plan_steps(config)
+    assert len(flow) == len(steps)
+    assert [node.step for node in flow.nodes] == list(steps)
+    assert [node.index for node in flow.nodes] == list(range(len(steps)))
+    for node in flow.nodes:
+        if node.step.type in ("call_button", "call_button_with_input"):
+            assert node.function.keywords["serial"] == "ABC123"
+        else:
+            assert node.function is None
+    assert not flow.requires_input
+
+
+def test_compile_flow_install_os(config, config_path):
+    """Test if installing the OS and the addons is appended to the steps."""
+    flow = compile_flow(
+        config,
+        options(
+            config_path,
+            install_os=True,
+            install_addons=True,
+            addon_paths=("gapps.zip",),
+        ),
+    )
+
+    commands = [node.command for node in flow.nodes[len(plan_steps(config)) :]]
+    assert commands == [
+        "adb_twrp_wipe_and_install",
+        "adb_twrp_install_addon",
+        "adb_twrp_finish_install_addons",
+    ]
+    assert flow.nodes[-3].function.keywords["install_addons"]
+    assert flow.nodes[-2].function.keywords["addon_path"] == "gapps.zip"
+
+
+def test_compile_flow_without_addons(config, config_path):
+    """Test if the device only reboots if installing addons is enabled without addons."""
+    flow = compile_flow(
+        config, options(config_path, install_os=True, install_addons=True), steps=()
+    )
+
+    assert [node.command for node in flow.nodes] == [
+        "adb_twrp_wipe_and_install",
+        "adb_reboot",
+    ]
+
+
+def test_compile_flow_missing_image(config, config_path):
+    """Test if missing images are reported before anything runs."""
+    with pytest.raises(FlowError, match="needs the recovery image"):
+        compile_flow(config, options(config_path, recovery=None))
+
+    # booting the flashed recovery doesn't need it
+    flow = compile_flow(
+        config, options(config_path, recovery=None, flash_recovery=False)
+    )
+    assert [node.command for node in flow.nodes] == ["adb_reboot_recovery"]
+
+
+def test_compile_flow_without_additional_images(config_path):
+    """Test if the additional images of a config are optional, like skipping their selection."""
+    config = _load_config("coral", config_path)
+    assert config.additional_steps == ["dtbo"]
+
+    flow = compile_flow(config, options(config_path))
+
+    assert "fastboot_flash_additional_partitions" in [
+        node.command for node in flow.nodes
+    ]
+    node = next(
+        node
+        for node in flow.nodes
+        if node.command == "fastboot_flash_additional_partitions"
+    )
+    assert node.function.keywords["dtbo"] is None
+
+
+def test_run_flow(mocker, config, config_path):
+    """Test if the nodes run in order and report their start and end."""
+    calls = fake_commands(mocker)
+    flow = compile_flow(config, options(config_path))
+    started, done = [], []
+
+    output = list(
+        flow.run(
+            on_node_start=lambda node: started.append(node.index),
+            on_node_done=lambda node, success: done.append((node.index, success)),
+        )
+    )
+
+    assert output[-1] is True
+    assert [name for name, _ in calls] == [
+        "adb_reboot_bootloader",
+        "fastboot_unlock",
+        "fastboot_reboot",
+        "adb_reboot_bootloader",
+        "fastboot_boot_recovery",
+    ]
+    assert "$fastboot_unlock" in output
+    assert started == list(range(len(flow)))
+    assert done == [(index, True) for index in range(len(flow))]
+
+
+def test_run_flow_stops_on_failure(mocker, config, config_path):
+    """Test if a flow stops at the first failing node and can be resumed."""
+    calls = fake_commands(mocker, failing=("fastboot_unlock",))
+    flow = compile_flow(config, options(config_path))
+
+    assert list(flow.run())[-1] is False
+    assert [name for name, _ in calls] == ["adb_reboot_bootloader", "fastboot_unlock"]
+
+    calls.clear()
+    resume = next(
+        node.index for node in flow.nodes if node.command == "fastboot_reboot"
+    )
+    assert list(flow.run(start=resume))[-1] is True
+    assert calls[0][0] == "fastboot_reboot"
+
+
+def test_session_flow(mocker, config, config_path):
+    """Test if every device session gets a flow for its device and images."""
+    compile_mock = mocker.patch("openandroidinstaller.flow.compile_flow")
+    session = DeviceSession(
+        serial="ABC123", bin_path=Path("bin"), config=config, recovery_path="r.img"
+    )
+
+    session_flow(options(config_path))(session)
+
+    used_config, used_options = compile_mock.call_args.args
+    assert used_config is config
+    assert (used_options.serial, used_options.recovery, used_options.image) == (
+        "ABC123",
+        "r.img",
+        "image.zip",
+    )
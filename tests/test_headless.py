@@ -0,0 +1,188 @@
+"""Test the headless install mode."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import io
+import json
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from openandroidinstaller.app_state import AppState
+from openandroidinstaller.headless import JsonLinesReporter, run_headless_install
+from openandroidinstaller.journal import InstallJournal, read_journal
+from openandroidinstaller.openandroidinstaller import startup
+
+
+def fake_commands(failing=()):
+    """Get fake command functions recording the commands which were run."""
+    calls = []
+
+    def command(name):
+        def flow():
+            calls.append(name)
+            yield f"${name}"
+            yield "serving: 'image.zip'  (~50%)"
+            yield name not in failing
+
+        return flow
+
+    names = [
+        "adb_reboot_bootloader",
+        "fastboot_unlock",
+        "fastboot_reboot",
+        "fastboot_boot_recovery",
+        "adb_twrp_wipe_and_install",
+    ]
+    return calls, {name: command(name) for name in names}
+
+
+def run(mocker, config_path, failing=()):
+    calls, commands = fake_commands(failing)
+    # the flow module is imported by its bare name within the application
+    mocker.patch("flow.get_command_functions", return_value=commands)
+    state = AppState(platform="linux", config_path=config_path, bin_path=Path("bin"))
+    state.load_config("sargo")
+    state.image_path = "image.zip"
+    state.recovery_path = "twrp.img"
+    flow = state.compile_flow(install_os=True)
+    stream = io.StringIO()
+    success = run_headless_install(
+        flow, JsonLinesReporter(stream=stream), device_code="sargo"
+    )
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    return success, calls, events
+
+
+def test_run_headless_install(mocker, config_path):
+    """Test if the command steps and the installation run and are reported."""
+    success, calls, events = run(mocker, config_path)
+
+    assert success
+    assert calls == [
+        "adb_reboot_bootloader",
+        "fastboot_unlock",
+        "fastboot_reboot",
+        "adb_reboot_bootloader",
+        "fastboot_boot_recovery",
+        "adb_twrp_wipe_and_install",
+    ]
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == "start"
+    assert kinds[-1] == "finished"
+    assert events[-1]["success"]
+    assert "instruction" in kinds
+    assert {"event": "progress", "percentage": 50} in [
+        {key: event[key] for key in ("event", "percentage") if key in event}
+        for event in events
+    ]
+    assert all(
+        event["elapsed"] <= later["elapsed"] for event, later in zip(events, events[1:])
+    )
+
+
+def test_run_headless_install_failure(mocker, config_path):
+    """Test if the install stops at the first failing step."""
+    success, calls, events = run(mocker, config_path, failing=("fastboot_unlock",))
+
+    assert not success
+    assert calls == ["adb_reboot_bootloader", "fastboot_unlock"]
+    assert events[-2]["event"] == "step_finished"
+    assert events[-2]["success"] is False
+    assert events[-1] == {
+        "event": "finished",
+        "elapsed": events[-1]["elapsed"],
+        "success": False,
+    }
+
+
+def test_run_headless_install_resume(mocker, config_path, tmp_path):
+    """Test if an interrupted install is journaled and resumes at the failed step."""
+    state = AppState(platform="linux", config_path=config_path, bin_path=Path("bin"))
+    state.load_config("sargo")
+    state.image_path = "image.zip"
+    state.recovery_path = "twrp.img"
+    _, commands = fake_commands(failing=("fastboot_unlock",))
+    mocker.patch("flow.get_command_functions", return_value=commands)
+    flow = state.compile_flow(install_os=True, serial="ABC123")
+    journal = InstallJournal("ABC123", tmp_path)
+    journal.start(state.config, flow)
+
+    assert not run_headless_install(
+        flow, JsonLinesReporter(stream=io.StringIO()), journal=journal
+    )
+    checkpoint = read_journal(journal.path)
+    unlock = next(node for node in flow.nodes if node.command == "fastboot_unlock")
+    assert checkpoint.next_index == unlock.index
+    assert checkpoint.resumable
+
+    calls, commands = fake_commands()
+    mocker.patch("flow.get_command_functions", return_value=commands)
+    flow = state.compile_flow(install_os=True, serial="ABC123")
+    stream = io.StringIO()
+    success = run_headless_install(
+        flow,
+        JsonLinesReporter(stream=stream),
+        start=checkpoint.next_index,
+        journal=InstallJournal("ABC123", tmp_path),
+    )
+
+    assert success
+    assert calls[0] == "fastboot_unlock"
+    assert json.loads(stream.getvalue().splitlines()[0])["first_step"] == unlock.index
+    assert read_journal(journal.path).finished
+
+
+def test_install_command_unknown_device(tmp_path):
+    """Test if the install command rejects devices without config."""
+    image = tmp_path.joinpath("image.zip")
+    image.write_bytes(b"image")
+
+    result = CliRunner().invoke(
+        startup,
+        [
+            "-l",
+            str(tmp_path),
+            "install",
+            "--device-code",
+            "nothing",
+            "--image",
+            str(image),
+            "--skip-recovery",
+        ],
+    )
+
+    assert result.exit_code == 2
+    assert "No valid config for device code 'nothing'" in result.output
+
+
+def test_install_command_missing_recovery(tmp_path):
+    """Test if the install command rejects flows without the images they need."""
+    image = tmp_path.joinpath("image.zip")
+    image.write_bytes(b"image")
+
+    result = CliRunner().invoke(
+        startup,
+        [
+            "-l",
+            str(tmp_path),
+            "install",
+            "--device-code",
+            "sargo",
+            "--image",
+            str(image),
+            "--unlock-code",
+            "1234",
+        ],
+    )
+
+    assert result.exit_code == 2
+    assert "'fastboot_boot_recovery' needs the recovery image" in result.output
@@ -0,0 +1,221 @@
+"""Test the journal of the completed steps and resuming interrupted installations."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import dataclasses
+import hashlib
+import threading
+from pathlib import Path
+
+import pytest
+
+from openandroidinstaller.adb_client import DeviceInfo
+from openandroidinstaller.app_state import AppState
+from openandroidinstaller.flow import FlowOptions, compile_flow
+from openandroidinstaller.installer_config import _load_config
+from openandroidinstaller.journal import (
+    CompatibilityStatus,
+    InstallJournal,
+    find_interrupted_installs,
+    journal_path,
+    read_journal,
+    verify_checkpoint,
+)
+
+
+@pytest.fixture
+def images(tmp_path):
+    image = tmp_path.joinpath("image.zip")
+    image.write_bytes(b"image")
+    recovery = tmp_path.joinpath("twrp.img")
+    recovery.write_bytes(b"recovery")
+    return image, recovery
+
+
+@pytest.fixture
+def config(config_path):
+    return _load_config("sargo", config_path)
+
+
+@pytest.fixture
+def flow(config, config_path, images):
+    image, recovery = images
+    return compile_flow(
+        config,
+        FlowOptions(
+            bin_path=Path("bin"),
+            config_path=config_path,
+            image=str(image),
+            recovery=str(recovery),
+            serial="ABC123",
+        ),
+    )
+
+
+def write_journal(config, flow, journal_dir, completed=2, finish=False):
+    journal = InstallJournal("ABC123", journal_dir)
+    journal.start(config, flow)
+    for node in flow.nodes[:completed]:
+        journal.record_step(node)
+    if finish:
+        journal.finish()
+    journal.close()
+    return journal.path
+
+
+def test_journal_path(tmp_path):
+    """Test if serials can't escape the journal directory."""
+    path = journal_path("../192.168.0.2:5555", tmp_path)
+
+    assert path.parent == tmp_path
+    assert path.name == ".._192.168.0.2_5555.jsonl"
+
+
+def test_read_journal(tmp_path, config, flow, images):
+    """Test if the completed steps and the digests of the images are journaled."""
+    path = write_journal(config, flow, tmp_path)
+
+    checkpoint = read_journal(path)
+
+    assert checkpoint.serial == "ABC123"
+    assert checkpoint.device_code == "sargo"
+    assert checkpoint.completed == {0, 1}
+    assert checkpoint.next_index == 2
+    assert checkpoint.resumable
+    assert checkpoint.commands == tuple(node.command for node in flow.nodes)
+    assert checkpoint.choices == {
+        "unlock_bootloader": True,
+        "flash_recovery": True,
+        "install_addons": False,
+    }
+    assert checkpoint.artifacts["image"] == str(images[0])
+    assert checkpoint.digests["image"] == hashlib.sha256(b"image").hexdigest()
+
+
+def test_read_journal_after_crash(tmp_path, config, flow):
+    """Test if a record cut off by a crash is skipped and a new session starts over."""
+    path = write_journal(config, flow, tmp_path)
+    with open(path, "a") as stream:
+        stream.write('{"event": "step", "ind')
+
+    assert read_journal(path).completed == {0, 1}
+
+    path = write_journal(config, flow, tmp_path, completed=1)
+    assert read_journal(path).completed == {0}
+    assert read_journal(tmp_path.joinpath("missing.jsonl")) is None
+
+
+def test_records_are_synced(mocker, tmp_path, config, flow):
+    """Test if the steps are on disk once recorded, even while the images are still hashed."""
+    hashing = threading.Event()
+
+    def slow_hash(path):
+        hashing.wait(5)
+        return "digest"
+
+    mocker.patch("openandroidinstaller.journal.sha256_file", side_effect=slow_hash)
+    journal = InstallJournal("ABC123", tmp_path)
+    journal.start(config, flow)
+    journal.record_step(flow.nodes[0])
+    journal.record_step(flow.nodes[1], skipped=True)
+
+    checkpoint = read_journal(journal.path)
+    assert checkpoint.completed == {0}
+    assert checkpoint.skipped == {1}
+    assert checkpoint.next_index == 2
+    assert checkpoint.digests == {}
+
+    hashing.set()
+    journal.close()
+    assert read_journal(journal.path).digests == {
+        "image": "digest",
+        "recovery": "digest",
+    }
+
+
+def test_read_journal_installed(tmp_path, config, flow):
+    """Test if the installation of the OS and the addons is journaled apart from the steps."""
+    install_flow = compile_flow(
+        config, dataclasses.replace(flow.options, install_os=True), steps=()
+    )
+    journal = InstallJournal("ABC123", tmp_path)
+    journal.start(config, flow)
+    for node in flow.nodes:
+        journal.record_step(node)
+    journal.record_install(install_flow.nodes[0])
+    journal.close()
+
+    checkpoint = read_journal(journal.path)
+    assert checkpoint.next_index == len(flow)
+    assert checkpoint.installed == {0}
+    assert checkpoint.resumable
+
+
+def test_find_interrupted_installs(tmp_path, config, flow):
+    """Test if finished installations aren't offered to resume."""
+    write_journal(config, flow, tmp_path)
+    assert [
+        checkpoint.serial for checkpoint in find_interrupted_installs(tmp_path)
+    ] == ["ABC123"]
+
+    write_journal(config, flow, tmp_path, finish=True)
+    assert find_interrupted_installs(tmp_path) == []
+
+
+def test_verify_checkpoint(mocker, tmp_path, config, flow, images):
+    """Test if only the connected device with unchanged images can resume."""
+    checkpoint = read_journal(write_journal(config, flow, tmp_path))
+    list_devices = mocker.patch("openandroidinstaller.journal.list_devices")
+
+    list_devices.return_value = [
+        DeviceInfo(serial="ABC123", state="bootloader", device="sargo")
+    ]
+    result = verify_checkpoint(checkpoint, flow, Path("bin"))
+    assert result.status == CompatibilityStatus.COMPATIBLE
+
+    list_devices.return_value = [DeviceInfo(serial="OTHER", state="device")]
+    result = verify_checkpoint(checkpoint, flow, Path("bin"))
+    assert result.status == CompatibilityStatus.UNKNOWN
+
+    list_devices.return_value = [
+        DeviceInfo(serial="ABC123", state="device", device="bonito")
+    ]
+    result = verify_checkpoint(checkpoint, flow, Path("bin"))
+    assert result.status == CompatibilityStatus.INCOMPATIBLE
+
+    images[0].write_bytes(b"other image")
+    result = verify_checkpoint(checkpoint, flow, Path("bin"))
+    assert result.status == CompatibilityStatus.INCOMPATIBLE
+    assert "image.zip was changed" in result.message
+
+
+def test_resume_install(mocker, tmp_path, config_path, config, flow, images):
+    """Test if the state continues with the first step which didn't complete."""
+    checkpoint = read_journal(write_journal(config, flow, tmp_path, completed=3))
+    # the journal module is imported by its bare name within the application
+    mocker.patch(
+        "journal.list_devices",
+        return_value=[DeviceInfo(serial="ABC123", state="device")],
+    )
+    state = AppState(platform="linux", config_path=config_path, bin_path=Path("bin"))
+
+    result = state.resume_install(checkpoint)
+
+    assert result.status == CompatibilityStatus.COMPATIBLE
+    assert state.config.device_code == "sargo"
+    assert state.image_path == str(images[0])
+    assert state.recovery_path == str(images[1])
+    assert state.steps.cursor == 3
+    assert state.steps.current.title == flow.nodes[3].step.title
+    assert len(state.flow) == len(flow)
+    assert state.journal.path == checkpoint.path
+    assert state.flow.options.cancel_event is state.cancel_event
+    assert not state.os_installed
@@ -0,0 +1,151 @@
+"""Test the network client against a local HTTP server."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from openandroidinstaller.network import NetworkClient
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Answer like the lineageOS API and the tracking endpoint."""
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        time.sleep(self.server.delay)
+        self.send_response(200 if self.path.endswith("/sargo") else 404)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(("POST", json.loads(body)["name"]))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHandler)
+    server.requests = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **kwargs):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    return NetworkClient(
+        timeout=2,
+        lineage_api_url=url + "/api/v2/devices/{}",
+        tracking_url=url + "/api/event",
+        **kwargs,
+    )
+
+
+def test_download_link_cached(server):
+    """Test if download links are probed once per device code until the TTL passed."""
+    clock = FakeClock()
+    client = make_client(server, download_link_ttl=60, clock=clock)
+
+    link = client.get_download_link("sargo").result(timeout=5)
+    assert link == "https://download.lineageos.org/devices/sargo/builds"
+    assert client.get_download_link("unknown").result(timeout=5) is None
+    results = []
+    client.get_download_link("sargo", callback=results.append)
+    assert results == [link]
+    assert len(server.requests) == 2
+
+    clock.now = 61
+    client.get_download_link("sargo").result(timeout=5)
+    assert len(server.requests) == 3
+    client.shutdown()
+
+
+def test_download_link_doesnt_block(server):
+    """Test if the probe runs in the background and calls back once it's done."""
+    server.delay = 0.5
+    client = make_client(server)
+    results = []
+    done = threading.Event()
+
+    start = time.monotonic()
+    client.get_download_link(
+        "sargo", callback=lambda link: (results.append(link), done.set())
+    )
+    assert time.monotonic() - start < 0.1
+    assert done.wait(5)
+    assert results == ["https://download.lineageos.org/devices/sargo/builds"]
+    client.shutdown()
+
+
+def test_tracking_batched(server):
+    """Test if tracking events are queued and sent together."""
+    client = make_client(server, tracking_delay=60)
+    client.send_tracking_info("sargo", "started")
+    client.send_tracking_info("sargo", "finished")
+    assert server.requests == []
+
+    assert client.flush(timeout=5)
+    assert server.requests == [("POST", "started"), ("POST", "finished")]
+    client.shutdown()
+
+
+def test_tracking_delayed_flush(server):
+    """Test if queued tracking events are sent after the delay."""
+    client = make_client(server, tracking_delay=0.1)
+    client.send_tracking_info("sargo", "started")
+
+    deadline = time.monotonic() + 5
+    while not server.requests and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.requests == [("POST", "started")]
+    client.shutdown()
+
+
+def test_offline():
+    """Test if nothing blocks and events are dropped without a network."""
+    client = NetworkClient(
+        timeout=1,
+        lineage_api_url="http://127.0.0.1:1/{}",
+        tracking_url="http://127.0.0.1:1/api/event",
+        max_pending_events=2,
+        tracking_delay=60,
+    )
+    assert client.get_download_link("sargo").result(timeout=5) is None
+
+    for event in ["a", "b", "c"]:
+        client.send_tracking_info("sargo", event)
+    assert len(client._pending_events) == 2
+    assert client.flush(timeout=5) is False
+    assert client._pending_events == []
+    client.shutdown()
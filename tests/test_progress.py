@@ -0,0 +1,187 @@
+"""Test deriving the progress from the output of the tools."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+
+import pytest
+
+from openandroidinstaller.progress import (
+    ProgressEvent,
+    ProgressParser,
+    RateLimiter,
+    TransferProgress,
+)
+from openandroidinstaller.widgets import ProgressIndicator
+
+
+@pytest.mark.parametrize(
+    "line, percentage",
+    [
+        ("serving: 'lineage-21.0-sargo-signed.zip'  (~47%)", 47),
+        ("Total xfer: 1.00x", 99),
+        ("adb: failed to read command: Success", 99),
+        ("Sending 'boot_a' (65536 KB)", 1),
+        ("Writing 'boot_a'", 50),
+        ("Sending sparse 'super' 2/4 (524284 KB)", 25),
+        ("Writing sparse 'super' 2/4", 37),
+        ("Finished. Total time: 12.345s", 99),
+        ("63%", 63),
+        ("Failed to mount '/data' (Device or resource busy)", None),
+        (True, None),
+    ],
+)
+def test_parse(line, percentage):
+    """Test if the progress is read from the output of adb, fastboot and heimdall."""
+    assert ProgressParser.parse(line) == percentage
+
+
+def test_monotonic_progress():
+    """Test if only increasing progress is reported."""
+    parser = ProgressParser()
+    lines = ["(~0%)", "(~5%)", "(~5%)", "(~3%)", "(~100%)", "Total xfer: 1.00x"]
+
+    assert [parser.feed(line) for line in lines] == [1, 5, None, None, 99, None]
+    parser.reset()
+    assert parser.feed("(~5%)") == 5
+
+
+def test_rate_limiter():
+    """Test if only the first call within the interval is allowed."""
+    limiter = RateLimiter(interval=60)
+
+    assert limiter.ready()
+    assert not limiter.ready()
+    assert limiter.ready(force=True)
+
+
+def test_rate_limiter_keeps_last_action():
+    """Test if the latest throttled action runs once the interval passed."""
+    limiter = RateLimiter(interval=60)
+    calls = []
+
+    limiter.run(lambda: calls.append(1))
+    limiter.run(lambda: calls.append(2))
+    limiter.run(lambda: calls.append(3))
+    assert calls == [1]
+
+    limiter.flush()
+    assert calls == [1, 3]
+    limiter.flush()
+    assert calls == [1, 3]
+
+    limiter.run(lambda: calls.append(4))
+    limiter.cancel()
+    limiter.flush()
+    assert calls == [1, 3]
+
+
+def test_rate_limiter_trailing_timer():
+    """Test if the throttled action runs on its own after the interval."""
+    limiter = RateLimiter(interval=0.2)
+    done = threading.Event()
+
+    limiter.run(lambda: None)
+    limiter.run(done.set)
+
+    assert not done.is_set()
+    assert done.wait(2)
+
+
+def test_throttled_updates(mocker):
+    """Test if a long sideload only updates the progress bar a few times."""
+    update = mocker.patch(
+        "openandroidinstaller.widgets.ProgressIndicator.update",
+        return_value=True,
+        new_callable=mocker.Mock,
+    )
+    progress_indicator = ProgressIndicator(expand=True, max_updates_per_second=1)
+    progress_indicator.build()
+
+    for block in range(10000):
+        progress_indicator.display_progress_bar(
+            f"serving: 'image.zip'  (~{block // 100}%)"
+        )
+    progress_indicator.display_progress_bar("Total xfer: 1.00x")
+
+    # creating the bar, the first progress and the end of the sideload
+    assert update.call_count == 3
+    assert progress_indicator.progress_bar.value == 0.99
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_transfer_progress_fastboot(tmp_path):
+    """Test if the bytes sent by fastboot are tracked over all images."""
+    dtbo = tmp_path.joinpath("dtbo.img")
+    dtbo.write_bytes(b"0" * 1024 * 1024)
+    super_img = tmp_path.joinpath("super.img")
+    super_img.write_bytes(b"0" * 3 * 1024 * 1024)
+    clock = FakeClock()
+    progress = TransferProgress([str(dtbo), str(super_img)], clock=clock)
+    assert progress.bytes_total == 4 * 1024 * 1024
+
+    progress.start_image(str(dtbo))
+    clock.now = 1
+    event = progress.feed("Sending 'dtbo' (1024 KB)  OKAY [  1.000s]")
+    assert event.percentage == 25
+    assert event.bytes_per_second == 1024 * 1024
+    assert event.eta == 3
+    assert progress.feed("Writing 'dtbo'  OKAY [  0.100s]") is None
+    progress.finish_image()
+
+    # rebooting between the images doesn't count for the transfer rate
+    clock.now = 10
+    progress.start_image(str(super_img))
+    clock.now = 12
+    event = progress.feed("Sending sparse 'super' 1/3 (1024 KB)  OKAY [  2.000s]")
+    assert event.label == "super.img"
+    assert event.percentage == 50
+    assert event.bytes_per_second == 2 * 1024 * 1024 / 3
+    event = progress.finish_image()
+    assert event.percentage == 100
+
+
+def test_transfer_progress_heimdall(tmp_path):
+    """Test if the upload percentages of heimdall are converted to bytes."""
+    recovery = tmp_path.joinpath("recovery.img")
+    recovery.write_bytes(b"0" * 1000)
+    progress = TransferProgress([str(recovery)], clock=FakeClock())
+    progress.start_image(str(recovery))
+
+    assert progress.feed("Uploading RECOVERY") is None
+    assert progress.feed("47%").bytes_done == 470
+    assert progress.feed("47%") is None
+    assert progress.feed("100%").bytes_done == 1000
+
+
+def test_progress_event():
+    """Test if rate and remaining time are described and replace the line-based progress."""
+    event = ProgressEvent(
+        label="super.img",
+        bytes_done=50_000_000,
+        bytes_total=100_000_000,
+        bytes_per_second=21_300_000,
+        eta=102,
+    )
+    assert event.percentage == 50
+    assert event.describe() == "21.3 MB/s, 1:42 left"
+
+    parser = ProgressParser()
+    assert parser.feed("Sending 'super' (1024 KB)") == 1
+    assert parser.feed(event) == 50
+    assert parser.feed("Writing 'super'") is None
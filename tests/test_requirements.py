@@ -0,0 +1,112 @@
+"""Test the automatic checks of the requirements."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+from pathlib import Path
+from subprocess import CalledProcessError
+
+from openandroidinstaller.requirements import (
+    CompatibilityStatus,
+    DeviceProperties,
+    check_device_requirements,
+    check_requirements,
+)
+
+
+def device(**values) -> DeviceProperties:
+    return DeviceProperties(serial="8ABX0Y1AB", values=values)
+
+
+def test_check_requirements_passed():
+    """Test if met requirements are reported as compatible."""
+    properties = device(
+        **{
+            "ro.build.version.release": "12",
+            "ro.build.display.id": "SQ1A.220205.002 release-keys",
+            "ro.boot.flash.locked": "1",
+            "battery.level": "87",
+        }
+    )
+
+    report = check_requirements(
+        {"android": "12.1.0", "firmware": "SQ1A.220205.002"}, properties
+    )
+
+    assert report.passed
+    assert report.device_read
+    assert [result.name for result in report.results] == [
+        "android",
+        "firmware",
+        "battery",
+        "bootloader",
+    ]
+    assert all(
+        result.status == CompatibilityStatus.COMPATIBLE for result in report.results
+    )
+    assert report.get("bootloader").message == "The bootloader is locked."
+
+
+def test_check_requirements_failed():
+    """Test if unmet and unknown requirements are reported."""
+    properties = device(
+        **{
+            "ro.build.version.release": "11",
+            "ro.build.display.id": "RQ3A.211001.001",
+            "battery.level": "42",
+        }
+    )
+
+    report = check_requirements(
+        {"android": "10 (Q)", "firmware": "MiUI 12.5 (Q)"}, properties
+    )
+
+    assert not report.passed
+    assert [result.name for result in report.failed] == ["android", "battery"]
+    assert report.get("firmware").status == CompatibilityStatus.UNKNOWN
+    assert "RQ3A.211001.001" in report.get("firmware").message
+    assert report.get("bootloader") is None
+
+
+def test_check_requirements_without_config_requirements():
+    """Test if only the default requirements are checked without requirements in the config."""
+    report = check_requirements(None, device(**{"battery.level": "80"}))
+
+    assert [result.name for result in report.results] == ["battery"]
+    assert report.passed
+
+
+def test_check_device_requirements_without_device(mocker):
+    """Test if the requirements are unknown if no device is connected."""
+
+    def patched_get_device_properties(*args, **kwargs):
+        raise CalledProcessError(returncode=1, cmd="adb shell")
+
+    mocker.patch(
+        "openandroidinstaller.requirements.get_device_properties",
+        patched_get_device_properties,
+    )
+
+    report = check_device_requirements(
+        {"android": 12}, bin_path=Path("openandroidinstaller/bin/")
+    )
+
+    assert report.passed
+    assert not report.device_read
+    assert {result.status for result in report.results} == {CompatibilityStatus.UNKNOWN}
+
+
+def test_check_requirements_unreadable_device():
+    """Test if a device telling nothing about the requirements isn't reported as checked."""
+    report = check_requirements({"firmware": "SQ1A"}, device(**{"ro.serialno": "1"}))
+
+    assert report.passed
+    assert not report.device_read
+    assert not check_requirements(None, device()).device_read
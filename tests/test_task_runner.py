@@ -0,0 +1,168 @@
+"""Test running flows in the background with the task runner."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import sys
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from openandroidinstaller.flow import FlowOptions, compile_flow
+from openandroidinstaller.installer_config import _load_config
+from openandroidinstaller.task_runner import TaskRunner
+
+# use the same tooling module as the task runner, which keeps track of the running commands
+from tooling import run_command
+
+
+def test_batches_and_success():
+    """Test if the output is passed on in batches and the success is reported."""
+
+    def flow():
+        for i in range(100):
+            yield f"line {i}"
+        yield True
+
+    batches = []
+    results = []
+    runner = TaskRunner(batch_interval=60)
+    runner.start(flow, on_output=batches.append, on_done=results.append)
+
+    assert runner.wait(timeout=5) is True
+    assert not runner.running
+    assert results == [True]
+    # all output arrives in one batch
+    assert len(batches) == 1
+    assert batches[0][-1] is True
+    assert len(batches[0]) == 101
+    runner.shutdown()
+
+
+def test_batch_before_blocking_command():
+    """Test if lines are passed on while the flow blocks, like on a long command."""
+    release = threading.Event()
+
+    def flow():
+        yield "$adb wait-for-recovery"
+        release.wait(5)
+        yield True
+
+    batches = []
+    runner = TaskRunner(batch_interval=0.1)
+    runner.start(flow, on_output=batches.append, on_done=lambda _: None)
+
+    deadline = time.monotonic() + 2
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [["$adb wait-for-recovery"]]
+    release.set()
+    assert runner.wait(timeout=5) is True
+    assert batches[-1] == [True]
+    runner.shutdown()
+
+
+def test_failing_flow():
+    """Test if failing and crashing flows are reported as failure."""
+
+    def crashing_flow():
+        yield "started"
+        raise RuntimeError("unplugged")
+
+    results = []
+    runner = TaskRunner()
+    runner.start(crashing_flow, on_output=lambda _: None, on_done=results.append)
+    assert runner.wait(timeout=5) is False
+
+    runner.start(lambda: iter(["line", False]), lambda _: None, results.append)
+    assert runner.wait(timeout=5) is False
+    assert results == [False, False]
+    runner.shutdown()
+
+
+def test_single_task():
+    """Test if only one flow runs at a time."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_flow():
+        started.set()
+        release.wait(5)
+        yield True
+
+    runner = TaskRunner()
+    runner.start(blocking_flow, lambda _: None, lambda _: None)
+    started.wait(5)
+    assert runner.running
+    with pytest.raises(RuntimeError):
+        runner.start(blocking_flow, lambda _: None, lambda _: None)
+    release.set()
+    assert runner.wait(timeout=5) is True
+    runner.shutdown()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake tools are shell scripts.")
+def test_cancel_hanging_command(tmp_path):
+    """Test if cancelling stops a command waiting for a device."""
+    adb = tmp_path.joinpath("adb")
+    adb.write_text('#!/bin/sh\necho "waiting"\nexec sleep 30\n')
+    adb.chmod(0o755)
+    lines = []
+    results = []
+    runner = TaskRunner(batch_interval=0)
+    runner.start(
+        partial(run_command, "adb wait-for-recovery", bin_path=tmp_path),
+        on_output=lines.extend,
+        on_done=results.append,
+    )
+    while "waiting" not in lines:
+        time.sleep(0.05)
+
+    start = time.monotonic()
+    runner.cancel()
+    assert runner.wait(timeout=5) is False
+    assert time.monotonic() - start < 2
+    assert runner.cancelled
+    assert results == [False]
+    runner.shutdown()
+
+
+def test_cancel_while_waiting_for_device(fake_device, config_path):
+    """Test if cancelling stops a flow waiting for the device to change its state."""
+    # the device takes long to reboot, so waiting for the bootloader doesn't end on its own
+    fake_device.set(reboot_time=60)
+    runner = TaskRunner()
+    flow = compile_flow(
+        _load_config("sargo", config_path),
+        FlowOptions(
+            bin_path=fake_device.bin_path,
+            config_path=config_path,
+            recovery="twrp.img",
+            cancel_event=runner.cancel_event,
+        ),
+    )
+    results = []
+    runner.start(flow.run, on_output=lambda _: None, on_done=results.append)
+    # wait until the device reboots into the bootloader
+    for _ in range(50):
+        if "off" in fake_device.modes():
+            break
+        time.sleep(0.1)
+
+    started = time.monotonic()
+    runner.cancel()
+
+    assert runner.wait(timeout=5) is False
+    assert time.monotonic() - started < 2
+    assert results == [False]
+    assert "fastboot flashing unlock" not in fake_device.commands()
+    runner.shutdown()
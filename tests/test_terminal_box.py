@@ -10,6 +10,8 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import time
+
 from flet import Container
 
 from openandroidinstaller.widgets import TerminalBox
@@ -37,11 +39,56 @@ def test_write_lines(mocker):
     # write some lines
     for line in ["test", "test_line2", True]:
         terminal_box.write_line(line)
+    # show the lines of the pending update
+    terminal_box.flush()
 
     # two lines of text should appear
     assert len(terminal_box._box.content.controls[0].value.split("\n")) == 2
 
 
+def test_line_cap_and_coalesced_updates(mocker):
+    """Test if only the last lines are kept and updates are rate-limited."""
+    update = mocker.patch(
+        "openandroidinstaller.widgets.TerminalBox.update",
+        return_value=True,
+        new_callable=mocker.Mock,
+    )
+
+    terminal_box = TerminalBox(expand=True, max_lines=100, max_updates_per_second=1)
+    _ = terminal_box.build()
+
+    for num in range(5000):
+        terminal_box.write_line(f"line {num}")
+    # only the first line is shown right away, the others are shown by one pending update
+    assert update.call_count == 1
+    terminal_box.flush()
+    assert update.call_count == 2
+
+    lines = terminal_box._box.content.controls[0].value.split("\n")
+    assert len(lines) == 100
+    assert lines[0] == ">line 4900"
+    assert lines[-1] == ">line 4999"
+
+
+def test_pending_update(mocker):
+    """Test if lines written right after an update are shown after the update interval."""
+    update = mocker.patch(
+        "openandroidinstaller.widgets.TerminalBox.update",
+        return_value=True,
+        new_callable=mocker.Mock,
+    )
+
+    terminal_box = TerminalBox(expand=True, max_updates_per_second=20)
+    _ = terminal_box.build()
+    terminal_box.write_line("first")
+    terminal_box.write_line("second")
+    assert update.call_count == 1
+
+    time.sleep(0.2)
+    assert update.call_count == 2
+    assert terminal_box._box.content.controls[0].value == ">first\n>second"
+
+
 def test_toggle_visibility(mocker):
     """Test if the visibility toggle method works."""
     mocker.patch(
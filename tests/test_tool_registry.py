@@ -0,0 +1,86 @@
+"""Test probing the tools with the tool registry."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import os
+import sys
+import time
+
+import pytest
+
+from openandroidinstaller.tool_registry import ToolRegistry, parse_version
+
+FAKE_TOOLS = {
+    "adb": "Android Debug Bridge version 1.0.41\nVersion 34.0.5-10900879\nInstalled as $0",
+    "fastboot": "fastboot version 34.0.5-10900879\nInstalled as $0",
+}
+
+
+@pytest.fixture
+def bin_path(tmp_path):
+    path = tmp_path.joinpath("bin")
+    path.mkdir()
+    for tool, output in FAKE_TOOLS.items():
+        script = path.joinpath(tool)
+        script.write_text(
+            f'#!/bin/sh\necho run >> "{tmp_path}/calls"\nsleep 0.3\nprintf "{output}\\n"\n'
+        )
+        script.chmod(0o755)
+    return path
+
+
+def test_parse_version():
+    """Test if the version is read from the output of the tools."""
+    assert parse_version(FAKE_TOOLS["adb"].splitlines()) == "34.0.5-10900879"
+    assert parse_version(FAKE_TOOLS["fastboot"].splitlines()) == "34.0.5-10900879"
+    assert parse_version(["Heimdall v1.4.2"]) == "1.4.2"
+    assert parse_version(["command not found"]) is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake tools are shell scripts.")
+def test_probe_concurrently(bin_path, tmp_path):
+    """Test if the tools are probed concurrently without blocking the caller."""
+    registry = ToolRegistry(bin_path, cache_path=tmp_path.joinpath("cache.json"))
+
+    start = time.monotonic()
+    probe = registry.probe()
+    assert time.monotonic() - start < 0.2
+    infos = probe.result(timeout=5)
+    # both tools take 0.3s each
+    assert time.monotonic() - start < 0.55
+
+    assert infos["adb"].available
+    assert infos["adb"].version == "34.0.5-10900879"
+    assert "sideload" in infos["adb"].capabilities
+    assert infos["fastboot"].output == "fastboot version 34.0.5-10900879"
+    assert not registry.available("heimdall")
+    assert registry.get("heimdall").capabilities == frozenset()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Fake tools are shell scripts.")
+def test_probe_cached(bin_path, tmp_path):
+    """Test if the tools are only run again after they changed."""
+    cache_path = tmp_path.joinpath("cache.json")
+    calls = tmp_path.joinpath("calls")
+    ToolRegistry(bin_path, cache_path=cache_path).probe().result(timeout=5)
+    assert len(calls.read_text().splitlines()) == 2
+
+    info = ToolRegistry(bin_path, cache_path=cache_path).get("adb", timeout=5)
+    assert info.version == "34.0.5-10900879"
+    assert "sideload" in info.capabilities
+    assert len(calls.read_text().splitlines()) == 2
+
+    # a changed binary is probed again
+    adb = bin_path.joinpath("adb")
+    stat = adb.stat()
+    os.utime(adb, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    ToolRegistry(bin_path, cache_path=cache_path).probe().result(timeout=5)
+    assert len(calls.read_text().splitlines()) == 3
@@ -10,13 +10,30 @@
 # You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
 # If not, see <https://www.gnu.org/licenses/>."""
 # Author: Tobias Sterbak
+import threading
+import time
 from pathlib import Path
 from subprocess import CalledProcessError
 
 from openandroidinstaller.tooling import run_command
 
-from openandroidinstaller.tooling import adb_reboot, fastboot_flash_recovery
-from openandroidinstaller.tooling import search_device
+from openandroidinstaller.tooling import (
+    ProgressEvent,
+    adb_reboot,
+    adb_reboot_download,
+    adb_twrp_install_addon,
+    fastboot_flash_recovery,
+    heimdall_flash_recovery,
+)
+from openandroidinstaller.adb_client import DeviceInfo
+from openandroidinstaller.tooling import (
+    DISCONNECTED,
+    DeviceStateWatcher,
+    clear_property_cache,
+    get_device_properties,
+    list_devices,
+    search_device,
+)
 
 
 def test_adb_reboot_success(fp):
@@ -440,3 +457,288 @@ def test_fastboot_flash_recovery_with_additional_partitions_failure(fp):
         ):
             print(line)
     assert not line
+
+
+def test_wait_timeout_fails(fp, mocker):
+    """Test if a device not reaching the expected state fails the command."""
+    wait = mocker.patch(
+        "openandroidinstaller.tooling.wait_for_device_state", return_value=False
+    )
+
+    output = list(
+        adb_twrp_install_addon(
+            bin_path=Path("test/path/to/tools"),
+            addon_path="gapps.zip",
+            is_ab=True,
+            serial="R58M123ABC",
+        )
+    )
+
+    # nothing is sideloaded, fp would complain about unregistered commands
+    assert output == [False]
+    assert wait.call_args.kwargs["serial"] == "R58M123ABC"
+
+
+def test_run_command_with_serial(fp):
+    """Test if a serial replaces the selection of the only USB device."""
+    fp.register(["test/path/to/tools/adb", "-s", "R58M123ABC", "reboot"])
+    fp.register(["test/path/to/tools/fastboot", "-s", "R58M123ABC", "reboot"])
+
+    output = list(adb_reboot(bin_path=Path("test/path/to/tools"), serial="R58M123ABC"))
+    assert output[-1]
+    output = list(
+        run_command(
+            "fastboot reboot", bin_path=Path("test/path/to/tools"), serial="R58M123ABC"
+        )
+    )
+    assert output[-1]
+
+    # only the device selector following the tool is replaced
+    fp.register(
+        ["test/path/to/tools/adb", "-s", "R58M123ABC", "shell", "getprop", "-d"]
+    )
+    output = list(
+        run_command(
+            "adb -d shell getprop -d",
+            bin_path=Path("test/path/to/tools"),
+            serial="R58M123ABC",
+        )
+    )
+    assert output[-1]
+
+
+def test_list_devices(fp):
+    """Test if adb and fastboot devices are listed with their details."""
+    fp.register(
+        ["test/path/to/tools/adb", "devices", "-l"],
+        stdout=[
+            "List of devices attached",
+            "R58M123ABC   device usb:1-1.2 product:sargo model:Pixel_3a device:sargo transport_id:3",
+        ],
+    )
+    fp.register(
+        ["test/path/to/tools/fastboot", "devices", "-l"],
+        stdout=["8A3X0ABCD\t fastboot usb:1-1.3"],
+    )
+
+    devices = list_devices(bin_path=Path("test/path/to/tools"))
+
+    assert [(device.serial, device.state) for device in devices] == [
+        ("R58M123ABC", "device"),
+        ("8A3X0ABCD", "bootloader"),
+    ]
+    assert devices[0].model == "Pixel_3a"
+    assert devices[1].usb == "1-1.3"
+
+
+class FakeAdbClient:
+    """Client returning a prepared sequence of adb device lists."""
+
+    def __init__(self, device_lists):
+        self.device_lists = list(device_lists)
+
+    def devices(self):
+        if len(self.device_lists) > 1:
+            return self.device_lists.pop(0)
+        return self.device_lists[0]
+
+
+def test_device_state_watcher_transition():
+    """Test if waiting returns as soon as the device reaches the state."""
+    client = FakeAdbClient(
+        [
+            [DeviceInfo("R58M123ABC", "sideload")],
+            [],
+            [DeviceInfo("R58M123ABC", "recovery")],
+        ]
+    )
+    watcher = DeviceStateWatcher(
+        bin_path=Path("test/path/to/tools"), poll_interval=0, client=client
+    )
+
+    assert watcher.wait_for("recovery", timeout=5)
+    assert watcher.current_state() == "recovery"
+
+
+def test_device_state_watcher_backoff():
+    """Test if the polling slows down while the state stays and speeds up on a change."""
+
+    class RecordingEvent:
+        def __init__(self):
+            self.timeouts = []
+
+        def wait(self, timeout):
+            self.timeouts.append(timeout)
+            return False
+
+    client = FakeAdbClient(
+        [[DeviceInfo("R58M123ABC", "sideload")]] * 8
+        + [[], [DeviceInfo("R58M123ABC", "recovery")]]
+    )
+    watcher = DeviceStateWatcher(
+        bin_path=Path("test/path/to/tools"),
+        poll_interval=0.25,
+        max_poll_interval=1.0,
+        client=client,
+    )
+    event = RecordingEvent()
+
+    assert watcher.wait_for("recovery", timeout=60, cancel_event=event)
+    assert event.timeouts == [0.25, 0.375, 0.5625, 0.84375, 1.0, 1.0, 1.0, 1.0, 0.25]
+
+
+def test_device_state_watcher_serial_and_timeout(fp):
+    """Test if only the device with the serial is watched and timeouts are reported."""
+    fp.register(
+        ["test/path/to/tools/fastboot", "devices", "-l"],
+        stdout=["8A3X0ABCD\t fastboot usb:1-1.3"],
+        occurrences=10,
+    )
+    client = FakeAdbClient([[DeviceInfo("R58M123ABC", "recovery")]])
+    watcher = DeviceStateWatcher(
+        bin_path=Path("test/path/to/tools"),
+        serial="8A3X0ABCD",
+        poll_interval=0,
+        client=client,
+    )
+
+    assert watcher.current_state() == "bootloader"
+    assert not watcher.wait_for("recovery", timeout=0)
+
+    watcher.serial = "unknown"
+    assert watcher.current_state() == DISCONNECTED
+
+
+def test_device_state_watcher_without_server(fp):
+    """Test if the adb binary is used if no adb server is reachable."""
+
+    class UnavailableClient:
+        def devices(self):
+            raise ConnectionRefusedError()
+
+    fp.register(
+        ["test/path/to/tools/adb", "devices", "-l"],
+        stdout=["List of devices attached", "R58M123ABC   device usb:1-1.2"],
+    )
+    watcher = DeviceStateWatcher(
+        bin_path=Path("test/path/to/tools"), client=UnavailableClient()
+    )
+
+    assert watcher.current_state(check_fastboot=False) == "device"
+
+
+def test_adb_reboot_download_cancel(fp, mocker):
+    """Test if waiting for the download mode stops right away once it is cancelled."""
+    mocker.patch("openandroidinstaller.tooling.usb_sysfs_available", return_value=False)
+    fp.register(["test/path/to/tools/adb", "-d", "reboot", "download"])
+    fp.register(
+        ["test/path/to/tools/heimdall", "detect"],
+        stdout=["ERROR: Failed to detect compatible download-mode device."],
+        returncode=1,
+        occurrences=100,
+    )
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+
+    started = time.monotonic()
+    output = list(
+        adb_reboot_download(
+            bin_path=Path("test/path/to/tools"), cancel_event=cancel_event
+        )
+    )
+
+    assert output[-1] is False
+    assert time.monotonic() - started < 2
+
+
+def test_heimdall_flash_recovery_progress(fp, tmp_path):
+    """Test if flashes report the bytes sent to the device."""
+    recovery = tmp_path.joinpath("recovery.img")
+    recovery.write_bytes(b"0" * 2000)
+    fp.register(
+        [
+            "test/path/to/tools/heimdall",
+            "flash",
+            "--no-reboot",
+            "--RECOVERY",
+            str(recovery),
+        ],
+        stdout=[
+            "Uploading RECOVERY",
+            "0%",
+            "50%",
+            "100%",
+            "RECOVERY upload successful",
+        ],
+    )
+
+    output = list(
+        heimdall_flash_recovery(
+            bin_path=Path("test/path/to/tools"), recovery=str(recovery)
+        )
+    )
+
+    events = [line for line in output if isinstance(line, ProgressEvent)]
+    assert [event.bytes_done for event in events] == [1000, 2000, 2000]
+    assert events[0].bytes_total == 2000
+    assert output[-1] is True
+
+
+def test_get_device_properties(mocker):
+    """Test if the properties are read in one call and cached by serial."""
+    clear_property_cache()
+    check_output = mocker.patch(
+        "openandroidinstaller.tooling.check_output",
+        return_value=b"""[ro.serialno]: [8ABX0Y1AB]
+[ro.product.device]: []
+[ro.product.vendor.device]: [sargo]
+[ro.build.version.sdk]: [33]
+[ro.boot.slot_suffix]: [_a]
+[ro.boot.flash.locked]: [1]
+[ro.boot.vbmeta.device_state]: [locked]
+[battery.level]: [87]
+""",
+    )
+
+    properties = get_device_properties(bin_path=Path("openandroidinstaller/bin/"))
+
+    assert check_output.call_count == 1
+    command = check_output.call_args.args[0]
+    assert command[1] == "shell"
+    assert "getprop ro.product.device" in command[2]
+    assert properties.serial == "8ABX0Y1AB"
+    assert properties.device_code == "sargo"
+    assert properties.sdk_version == 33
+    assert properties.slot_suffix == "_a"
+    assert properties.battery_level == 87
+    assert properties.bootloader_locked is True
+
+    # the properties are cached by serial
+    cached = get_device_properties(
+        bin_path=Path("openandroidinstaller/bin/"), serial="8ABX0Y1AB"
+    )
+    assert cached is properties
+    assert check_output.call_count == 1
+
+    get_device_properties(
+        bin_path=Path("openandroidinstaller/bin/"), serial="8ABX0Y1AB", refresh=True
+    )
+    assert check_output.call_count == 2
+    assert check_output.call_args.args[0][1:3] == ["-s", "8ABX0Y1AB"]
+    clear_property_cache()
+
+
+def test_search_device_without_device_code(mocker):
+    """Test if a device without device code is reported as not found."""
+    mocker.patch(
+        "openandroidinstaller.tooling.check_output",
+        return_value=b"[ro.product.device]: []\n[battery.level]: []",
+    )
+
+    search_result = search_device(
+        platform="linux", bin_path=Path("openandroidinstaller/bin/")
+    )
+
+    assert search_result.device_code is None
+    assert search_result.properties.battery_level is None
+    assert search_result.properties.bootloader_locked is None
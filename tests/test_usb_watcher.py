@@ -0,0 +1,96 @@
+"""Test detecting USB devices with sysfs."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import threading
+import time
+
+import pytest
+
+from openandroidinstaller.usb_watcher import (
+    SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+    SAMSUNG_VENDOR_ID,
+    find_usb_devices,
+    wait_for_usb_device,
+)
+
+
+def add_usb_device(sysfs_root, name, vendor_id, product_id):
+    device_dir = sysfs_root.joinpath(name)
+    device_dir.mkdir()
+    device_dir.joinpath("idVendor").write_text(f"{vendor_id}\n")
+    device_dir.joinpath("idProduct").write_text(f"{product_id}\n")
+
+
+@pytest.fixture
+def sysfs_root(tmp_path):
+    """Fake sysfs tree with a hub, an interface and a keyboard."""
+    root = tmp_path.joinpath("devices")
+    root.mkdir()
+    add_usb_device(root, "usb1", "1d6b", "0002")
+    add_usb_device(root, "1-2", "046d", "c31c")
+    root.joinpath("1-2:1.0").mkdir()
+    return root
+
+
+def test_find_usb_devices(sysfs_root):
+    """Test if only devices with matching ids are found."""
+    assert find_usb_devices(SAMSUNG_VENDOR_ID, ["685d"], sysfs_root=sysfs_root) == []
+
+    add_usb_device(sysfs_root, "1-1.2", "04e8", "685D")
+    assert find_usb_devices(
+        SAMSUNG_VENDOR_ID, SAMSUNG_DOWNLOAD_PRODUCT_IDS, sysfs_root=sysfs_root
+    ) == ["1-1.2"]
+
+
+def test_wait_for_usb_device(sysfs_root):
+    """Test if waiting returns shortly after the device appears."""
+
+    def plug_in():
+        time.sleep(0.2)
+        add_usb_device(sysfs_root, "1-1.2", "04e8", "685d")
+
+    threading.Thread(target=plug_in).start()
+    start = time.monotonic()
+    found = wait_for_usb_device(
+        SAMSUNG_VENDOR_ID,
+        SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+        timeout=5,
+        sysfs_root=sysfs_root,
+        poll_interval=0.05,
+        use_uevents=False,
+    )
+
+    assert found
+    assert time.monotonic() - start < 1
+
+
+def test_wait_for_usb_device_timeout_and_cancel(sysfs_root):
+    """Test if waiting gives up after the deadline or when cancelled."""
+    assert not wait_for_usb_device(
+        SAMSUNG_VENDOR_ID,
+        SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+        timeout=0.1,
+        sysfs_root=sysfs_root,
+        poll_interval=0.05,
+    )
+
+    cancel_event = threading.Event()
+    cancel_event.set()
+    start = time.monotonic()
+    assert not wait_for_usb_device(
+        SAMSUNG_VENDOR_ID,
+        SAMSUNG_DOWNLOAD_PRODUCT_IDS,
+        timeout=60,
+        sysfs_root=sysfs_root,
+        cancel_event=cancel_event,
+    )
+    assert time.monotonic() - start < 1
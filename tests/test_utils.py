@@ -0,0 +1,80 @@
+"""Test the utility functions."""
+
+# This file is part of OpenAndroidInstaller.
+# OpenAndroidInstaller is free software: you can redistribute it and/or modify it under the terms of
+# the GNU General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+# OpenAndroidInstaller is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with OpenAndroidInstaller.
+# If not, see <https://www.gnu.org/licenses/>."""
+# Author: Tobias Sterbak
+import zipfile
+
+import pytest
+
+from openandroidinstaller import utils
+from openandroidinstaller.utils import (
+    CompatibilityStatus,
+    image_sdk_level,
+    image_works_with_device,
+    inspect_image,
+)
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    """Create a small OS image zip."""
+    path = tmp_path.joinpath("lineage-21.0-20240101-nightly-sargo-signed.zip")
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as image_zip:
+        image_zip.writestr(
+            "META-INF/com/android/metadata",
+            "ota-type=AB\npost-sdk-level=34\npre-device=sargo,bonito",
+        )
+        image_zip.writestr("payload.bin", b"\0" * 10000)
+    return str(path)
+
+
+def test_inspect_image(image_path):
+    """Test if metadata, entries and sizes are read from the image."""
+    info = inspect_image(image_path)
+
+    assert info.metadata["pre-device"] == "sargo,bonito"
+    assert info.metadata["post-sdk-level"] == "34"
+    assert info.has_payload
+    assert "META-INF/com/android/metadata" in info.entries
+    assert info.uncompressed_size > 10000 > info.compressed_size
+
+
+def test_inspect_image_cached(image_path, mocker):
+    """Test if the checks of the same image read the zip only once."""
+    spy = mocker.spy(utils.zipfile, "ZipFile")
+
+    assert image_works_with_device(["sargo"], image_path).status == (
+        CompatibilityStatus.COMPATIBLE
+    )
+    assert image_sdk_level(image_path) == 34
+    assert image_works_with_device(["bonito"], image_path).status == (
+        CompatibilityStatus.COMPATIBLE
+    )
+    assert spy.call_count == 1
+
+
+def test_inspect_image_without_metadata(tmp_path):
+    """Test if images without metadata or broken zips are reported properly."""
+    path = tmp_path.joinpath("image.zip")
+    with zipfile.ZipFile(path, "w") as image_zip:
+        image_zip.writestr("payload.bin", b"")
+    assert image_works_with_device(["sargo"], str(path)).status == (
+        CompatibilityStatus.UNKNOWN
+    )
+
+    broken = tmp_path.joinpath("broken.zip")
+    broken.write_bytes(b"no zip")
+    assert image_works_with_device(["sargo"], str(broken)).status == (
+        CompatibilityStatus.INCOMPATIBLE
+    )
+    empty = tmp_path.joinpath("empty.zip")
+    empty.write_bytes(b"")
+    assert image_sdk_level(str(empty)) == -1